@@ -2,6 +2,12 @@ import numpy as np
 
 UPPER_BOUND_FELT252 = 3618502788666131213697322783095070105623107215331596699973092056135872020481
 UPPER_BOUND__I128 = (2**127) - 1 # included
+LOWER_BOUND__I128 = -(2**127) # included
+
+WFLOAT_SCALE = 1e6
+
+# fast path : wsad values that fit in an int64 (floats below ~9.2e12)
+_INT64_SAFE = float(2**63 - 1024)
 
 # wfloat for wsad as felt252
 def wfloat_to_float(x) -> float :
@@ -18,29 +24,158 @@ def wfloat(x : float) :
         else as_wsad
     )
 
+# ----------------------------------------------------------------------
+# Vectorized codec (same truncation as wfloat, whole ndarray at once)
+
+def wsad_array(x, saturate : bool = False) -> np.ndarray :
+    '''
+    Truncate a float array onto the 1e6 grid (raw i128 values of WFloat).
+
+    Returns an int64 array when every value fits, an object array otherwise.
+    Outside the i128 range, values are clipped when ``saturate`` is set,
+    otherwise an OverflowError is raised.
+    '''
+    scaled = np.trunc(np.asarray(x, dtype=np.float64) * WFLOAT_SCALE)
+
+    if not np.all(np.isfinite(scaled)) and not saturate :
+        raise ValueError("cannot encode nan/inf as wfloat")
+    scaled = np.nan_to_num(scaled, nan=0.0)
+
+    if np.any((scaled > UPPER_BOUND__I128) | (scaled < LOWER_BOUND__I128)) :
+        if not saturate :
+            raise OverflowError("value out of the i128 range of WFloat")
+        scaled = np.clip(scaled, float(LOWER_BOUND__I128), float(UPPER_BOUND__I128))
+    scaled = np.asarray(scaled)
+
+    if np.all(np.abs(scaled) < _INT64_SAFE) :
+        return scaled.astype(np.int64)
+    as_wsad = np.frompyfunc(
+        lambda e : min(max(int(e), LOWER_BOUND__I128), UPPER_BOUND__I128), 1, 1
+    )(scaled)
+    return np.asarray(as_wsad, dtype=object)
+
+def wsad_array_to_felt(x) -> np.ndarray :
+    '''
+    Raw i128 values to felt252 (negative values offset by the prime).
+    '''
+    as_wsad = np.asarray(x).astype(object)
+    as_wsad[as_wsad < 0] += UPPER_BOUND_FELT252
+    return as_wsad
+
+def felt_array_to_wsad(x) -> np.ndarray :
+    '''
+    felt252 integers (ndarray or nested lists) to raw i128 values (object array).
+    '''
+    felts = np.asarray(x, dtype=object).copy()
+    felts[felts > UPPER_BOUND__I128] -= UPPER_BOUND_FELT252
+    return felts
+
+def wfloat_array(x, saturate : bool = False) -> np.ndarray :
+    '''
+    Encode a float array into an object array of felt252 integers.
+    Same truncation as ``wfloat``, see ``wsad_array`` for ``saturate``.
+    '''
+    return wsad_array_to_felt(wsad_array(x, saturate))
+
+def wfloat_array_to_float(x) -> np.ndarray :
+    '''
+    Decode felt252 integers (ndarray or nested lists) into a float64 array.
+    '''
+    felts = np.asarray(x, dtype=object)
+    result = np.asarray(felts.astype(np.float64))
+    # negative wsad sit right below the prime, far above the i128 bound
+    negative = result > UPPER_BOUND__I128
+    if np.any(negative) :
+        result[negative] = (felts[negative] - UPPER_BOUND_FELT252).astype(np.float64)
+    return result * 1e-6
+
 def to_hex(x: int) -> str:
     return f"0x{x:0x}"
 
 def from_hex(x : str) -> int:
     return int(x, 16)
 
+# ----------------------------------------------------------------------
+# Calldata serialization (flat felt252 buffers, linear in the matrix size)
+
+class FeltStream:
+    '''
+    Write-only felt buffer backed by a text file.
+    Behaves like the list given to ``*_as_felts`` so calldata can be
+    streamed to disk without holding it entirely in memory.
+    '''
+    def __init__(self, file) -> None:
+        self.file = file
+        self.empty = True
+
+    def append(self, felt : int) -> None:
+        self.extend((felt,))
+
+    def extend(self, felts) -> None:
+        text = ", ".join(map(str, felts))
+        if not text :
+            return
+        if not self.empty :
+            self.file.write(", ")
+        self.file.write(text)
+        self.empty = False
+
+def vector_as_felts(vector, out = None) :
+    '''
+    Append ``len, w_0, .., w_n`` (a Span<felt252>) to ``out``.
+    '''
+    out = [] if out is None else out
+    out.append(len(vector))
+    out.extend(wfloat_array(vector).tolist())
+    return out
+
+def matrix_as_felts(matrix, out = None) :
+    '''
+    Append ``n_rows, (len, w_0, .., w_n) * n_rows`` (a Span<Span<felt252>>) to ``out``.
+    '''
+    out = [] if out is None else out
+    encoded = wfloat_array(matrix)
+    n_rows = len(encoded)
+    out.append(n_rows)
+    if n_rows == 0 :
+        return out
+
+    rows = np.empty((n_rows, encoded.shape[1] + 1), dtype=object)
+    rows[:, 0] = encoded.shape[1]
+    rows[:, 1:] = encoded
+    out.extend(rows.ravel().tolist())
+    return out
+
+def felts_as_matrix(felts) -> list :
+    '''
+    Parse a serialized Span<Span<felt252>> (eg. the result of predict).
+    '''
+    n_rows, position = felts[0], 1
+    result = []
+    for _ in range(n_rows) :
+        length = felts[position]
+        result.append(list(felts[position + 1:position + 1 + length]))
+        position += 1 + length
+    return result
+
+def felts_as_string(felts) -> str :
+    return ", ".join(map(str, felts))
+
+def felts_from_string(text : str) -> list :
+    '''
+    Inverse of felts_as_string (decimal or 0x prefixed felts).
+    '''
+    return [int(x, 0) for x in text.split(",") if x.strip()]
+
 def matrix_to_wfloat(matrix) :
-    x = "array!["
-    for line in matrix :
-        x += "array!["
-        for e in line :
-            x += f"{wfloat(e)}, "
-        x = x[:-1] + "].span(), "
-    return x[:-1] + "].span()"
+    lines = [
+        "array![" + ", ".join(map(str, line)) + ",].span(),"
+        for line in wfloat_array(matrix).tolist()
+    ]
+    return "array![" + " ".join(lines) + "].span()"
 
 def matrix_as_felt_string(matrix) -> str :
-    result = f"{len(matrix)}, "
-    for x in matrix[:-1]:
-        result += f"{vector_as_felt_string(x)}, "
-    return result + vector_as_felt_string(matrix[-1])
+    return felts_as_string(matrix_as_felts(matrix))
 
 def vector_as_felt_string(vector) -> str :
-    result = f"{len(vector)}, "
-    for x in vector[:-1] :
-        result += f"{wfloat(x)}, "
-    return result + f"{wfloat(vector[-1])}"
\ No newline at end of file
+    return felts_as_string(vector_as_felts(vector))
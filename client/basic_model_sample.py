@@ -1,12 +1,39 @@
 import numpy as np
-from sklearn.datasets import load_iris
-from sklearn.preprocessing import OneHotEncoder
-from sklearn.model_selection import train_test_split
-from tensorflow.keras.datasets import mnist
 from typing import List, Tuple, Union
 
-from matplotlib import pyplot as plt
-from basic_conversions import matrix_as_felt_string, vector_as_felt_string
+from basic_conversions import FeltStream, felts_as_string, matrix_as_felts, vector_as_felts, wfloat_array, \
+    WFLOAT_SCALE
+
+# ----------------------------------------------------------------------------------------------------------------
+
+# activations applied in place, x is overwritten and returned
+
+def relu_(x: np.ndarray) -> np.ndarray:
+    return np.maximum(x, 0, out=x)
+
+def sigmoid_(x: np.ndarray) -> np.ndarray:
+    np.negative(x, out=x)
+    np.exp(x, out=x)
+    x += 1
+    return np.reciprocal(x, out=x)
+
+def softmax_(x: np.ndarray) -> np.ndarray:
+    x -= x.max(axis=1, keepdims=True)
+    np.exp(x, out=x)
+    x /= x.sum(axis=1, keepdims=True)
+    return x
+
+IN_PLACE_ACTIVATIONS = {
+    "ReLU": relu_,
+    "Sigmoid": sigmoid_,
+    "Softmax": softmax_,
+}
+
+INFERENCE_CHUNK_SIZE = 65536
+
+def fake_quantize(x: np.ndarray) -> np.ndarray:
+    # same grid and truncation as wfloat()
+    return np.trunc(x * WFLOAT_SCALE) / WFLOAT_SCALE
 
 # ----------------------------------------------------------------------------------------------------------------
 
@@ -16,13 +43,20 @@ class ILayer:
     
     def forward(self, X: np.ndarray) -> np.ndarray:
         raise NotImplementedError("Must implement forward method")
+
+    def inference(self, X: np.ndarray) -> np.ndarray:
+        return self.forward(X)
     
     def backward(self, dY: np.ndarray, learning_rate: float) -> np.ndarray:
         raise NotImplementedError("Must implement backward method")
     
     def num_params(self) -> int: return 0
 
-    def serialize(self) -> str: return ""
+    def serialize(self) -> str: return felts_as_string(self.serialize_felts())
+
+    def serialize_felts(self, out: list = None) -> list: return [] if out is None else out
+
+    def serialize_sparse_felts(self, out: list = None) -> list: return [] if out is None else out
 
 # ----------------------------------------------------------------------------------------------------------------
 
@@ -33,6 +67,9 @@ class DenseLayer(ILayer):
         self.activation_name = activation
         self.activation = None
         self.activation_derivative = None
+        # quantization aware training : WFloat grid in the forward pass,
+        # straight-through gradient in the backward pass
+        self.fake_quantize = False
 
     def build(self, input_shape: int = None) -> None:
         if input_shape:
@@ -41,7 +78,7 @@ class DenseLayer(ILayer):
         self.b = np.zeros((1, self.output_shape))
         if self.activation_name == "Sigmoid":
             self.activation = lambda x: 1 / (1 + np.exp(-x))
-            self.activation_derivative = lambda x: self.activation(x) * (1 - self.activation(x))
+            self.activation_derivative = lambda x: (lambda s: s * (1 - s))(self.activation(x))
         elif self.activation_name == "ReLU":
             self.activation = lambda x: np.maximum(0, x)
             self.activation_derivative = lambda x: (x > 0).astype(float)
@@ -52,34 +89,134 @@ class DenseLayer(ILayer):
             raise ValueError("Unsupported activation function")
 
     def forward(self, X: np.ndarray) -> np.ndarray:
+        if self.fake_quantize:
+            return self._forward_quantized(X)
         self.input = X
         self.z = np.dot(X, self.W) + self.b
         self.output = self.activation(self.z)
         
         return self.output
 
-    def backward(self, dY: np.ndarray, learning_rate: float) -> np.ndarray:
+    def _forward_quantized(self, X: np.ndarray) -> np.ndarray:
+        self.input = fake_quantize(X)
+        self.z = fake_quantize(np.dot(self.input, fake_quantize(self.W)) + fake_quantize(self.b))
+        self.output = fake_quantize(self.activation(self.z))
+
+        return self.output
+
+    def inference(self, X: np.ndarray) -> np.ndarray:
+        # no training cache, bias and activation applied in place on X.W
+        z = np.dot(X, self.W)
+        z += self.b
+        return IN_PLACE_ACTIVATIONS[self.activation_name](z)
+
+    def gradients(self, dY: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
         m = dY.shape[0]
         dZ = dY * self.activation_derivative(self.z)
         dW = np.dot(self.input.T, dZ) / m
         dB = np.sum(dZ, axis=0, keepdims=True) / m
         dX = np.dot(dZ, self.W.T)
+
+        return dX, dW, dB
+
+    def backward(self, dY: np.ndarray, learning_rate: float) -> np.ndarray:
+        dX, dW, dB = self.gradients(dY)
         
         self.W -= learning_rate * dW
         self.b -= learning_rate * dB
         
         return dX
 
+    # Fused training (preallocated workspaces, in place ufuncs)
+    # ----------------------------------------------------------------------
+
+    def allocate(self, batch_size: int, dtype=np.float64) -> None:
+        # W and b stay the master weights (their own dtype), the fused passes
+        # compute with ws_W / ws_b in dtype (the masters themselves if same dtype)
+        self.ws_W = self.W.astype(dtype, copy=False)
+        self.ws_b = self.b.astype(dtype, copy=False)
+        self.ws_z = np.empty((batch_size, self.output_shape), dtype=dtype)
+        self.ws_output = np.empty((batch_size, self.output_shape), dtype=dtype)
+        self.ws_dZ = np.empty((batch_size, self.output_shape), dtype=dtype)
+        self.ws_dX = np.empty((batch_size, self.input_shape), dtype=dtype)
+        self.ws_mask = np.empty((batch_size, self.output_shape), dtype=bool)
+        self.ws_dW = np.empty_like(self.ws_W)
+        self.ws_dB = np.empty_like(self.ws_b)
+
+    def forward_fused(self, X: np.ndarray) -> np.ndarray:
+        m = X.shape[0]
+        self.input = X
+        z = self.ws_z[:m]
+        output = self.ws_output[:m]
+
+        np.dot(X, self.ws_W, out=z)
+        z += self.ws_b
+
+        np.copyto(output, z)
+        return IN_PLACE_ACTIVATIONS[self.activation_name](output)
+
+    def backward_fused(self, dY: np.ndarray, learning_rate: float) -> np.ndarray:
+        m = dY.shape[0]
+        dZ = self.ws_dZ[:m]
+        dX = self.ws_dX[:m]
+
+        if self.activation_name == "ReLU":
+            mask = self.ws_mask[:m]
+            np.greater(self.ws_z[:m], 0, out=mask)
+            np.multiply(dY, mask, out=dZ)
+        elif self.activation_name == "Sigmoid":
+            # sigmoid'(z) = s (1 - s), s already in the forward output
+            output = self.ws_output[:m]
+            np.subtract(1, output, out=dZ)
+            dZ *= output
+            dZ *= dY
+        else: # Softmax, derivative not implemented (identity)
+            dZ[...] = dY
+
+        np.dot(self.input.T, dZ, out=self.ws_dW)
+        np.sum(dZ, axis=0, keepdims=True, out=self.ws_dB)
+        np.dot(dZ, self.ws_W.T, out=dX)
+
+        self.ws_dW *= learning_rate / m
+        self.ws_dB *= learning_rate / m
+        self.W -= self.ws_dW
+        self.b -= self.ws_dB
+        if self.ws_W is not self.W:
+            np.copyto(self.ws_W, self.W)
+            np.copyto(self.ws_b, self.b)
+
+        return dX
+
     def num_params(self) -> int:
         return np.prod(self.W.shape) + np.prod(self.b.shape)
     
     # we force ReLU activation for simplicity
     # TODO: not force it
-    def serialize(self) -> str :
-        weights = matrix_as_felt_string(self.W)
-        biaises = vector_as_felt_string(self.b[0])
+    def serialize_felts(self, out: list = None) -> list:
+        out = [] if out is None else out
+        matrix_as_felts(self.W, out)
+        vector_as_felts(self.b[0], out)
         activation = 0
-        return f"{weights}, {biaises}, {activation}"
+        out.append(activation)
+        return out
+
+    # n_rows, n_cols, nnz, (flat index, weight) * nnz, biaises: Span<felt252>, activation
+    # weights that truncate to a zero wfloat are not stored
+    def serialize_sparse_felts(self, out: list = None) -> list:
+        out = [] if out is None else out
+        encoded = wfloat_array(self.W).ravel()
+        indices = np.flatnonzero(encoded != 0)
+
+        out.extend([self.W.shape[0], self.W.shape[1], len(indices)])
+        pairs = np.empty((len(indices), 2), dtype=object)
+        pairs[:, 0] = indices
+        pairs[:, 1] = encoded[indices]
+        out.extend(pairs.ravel().tolist())
+
+        vector_as_felts(self.b[0], out)
+        activation = 0
+        out.append(activation)
+        return out
 
 class Sequential:
     def __init__(self, layers: List[ILayer], optimizer: 'SGD') -> None:
@@ -97,14 +234,60 @@ class Sequential:
             X = layer.forward(X)
         return X
 
+    def inference(self, X: np.ndarray) -> np.ndarray:
+        for layer in self.layers:
+            X = layer.inference(X)
+        return X
+
+    def predict_batch(self, X: np.ndarray, chunk_size: int = INFERENCE_CHUNK_SIZE) -> np.ndarray:
+        '''
+        Inference on fixed size chunks, memory stays bounded by chunk_size rows.
+        '''
+        if len(X) <= chunk_size:
+            return self.inference(X)
+        result = None
+        for i in range(0, len(X), chunk_size):
+            output = self.inference(X[i:i + chunk_size])
+            if result is None:
+                result = np.empty((len(X), output.shape[1]), dtype=output.dtype)
+            result[i:i + len(output)] = output
+        return result
+
+    def compile(self, chunk_size: int = INFERENCE_CHUNK_SIZE):
+        '''
+        Freeze the layer chain (weights, biaises, activations) into a single callable.
+        '''
+        chain = tuple(
+            (layer.W.copy(), layer.b.copy(), IN_PLACE_ACTIVATIONS[layer.activation_name])
+            for layer in self.layers
+        )
+
+        def run(X: np.ndarray) -> np.ndarray:
+            for W, b, activation in chain:
+                X = np.dot(X, W)
+                X += b
+                X = activation(X)
+            return X
+
+        def predict(X: np.ndarray) -> np.ndarray:
+            if len(X) <= chunk_size:
+                return run(X)
+            return np.concatenate([run(X[i:i + chunk_size]) for i in range(0, len(X), chunk_size)])
+
+        return predict
+
     def backward(self, dY: np.ndarray) -> None:
         for layer in reversed(self.layers):
             dY = layer.backward(dY, self.optimizer.learning_rate)
 
     def train(
             self, X: np.ndarray, y: np.ndarray, epochs: int, 
-            batch_size: int, verbose: bool = False) -> List[float]:
+            batch_size: int, verbose: bool = False,
+            quantization_aware: bool = False) -> List[float]:
         
+        for layer in self.layers:
+            layer.fake_quantize = quantization_aware
+
         self.loss_history = []
         for epoch in range(epochs):
             permutation = np.random.permutation(X.shape[0])
@@ -126,6 +309,59 @@ class Sequential:
             if verbose and epoch % 10 == 0:
                 print(f'Epoch {epoch+1}, Loss: {loss}')
 
+        for layer in self.layers:
+            layer.fake_quantize = False
+
+        return self.loss_history
+
+    def train_fused(
+            self, X: np.ndarray, y: np.ndarray, epochs: int, batch_size: int,
+            dtype=np.float32, loss_every: int = 0, loss_sample: int = 1000,
+            verbose: bool = False) -> List[float]:
+        '''
+        Same SGD as train, without per batch allocations :
+        layers work in preallocated buffers, batches are gathered
+        through a permutation of indices (no shuffled copy of X).
+        Every ``loss_every`` epochs (0 : never), the loss is measured
+        on ``loss_sample`` random rows instead of the whole dataset.
+        Batches are computed in ``dtype``, the weights keep their own dtype.
+        '''
+        X = np.ascontiguousarray(X, dtype=dtype)
+        y = np.ascontiguousarray(y, dtype=dtype)
+        batch_size = min(batch_size, X.shape[0])
+
+        for layer in self.layers:
+            layer.allocate(batch_size, dtype)
+        X_batch = np.empty((batch_size, X.shape[1]), dtype=dtype)
+        y_batch = np.empty((batch_size, y.shape[1]), dtype=dtype)
+        dY = np.empty((batch_size, y.shape[1]), dtype=dtype)
+
+        self.loss_history = []
+        for epoch in range(epochs):
+            permutation = np.random.permutation(X.shape[0])
+
+            for i in range(0, X.shape[0], batch_size):
+                indices = permutation[i:i + batch_size]
+                m = len(indices)
+                np.take(X, indices, axis=0, out=X_batch[:m])
+                np.take(y, indices, axis=0, out=y_batch[:m])
+
+                output = X_batch[:m]
+                for layer in self.layers:
+                    output = layer.forward_fused(output)
+
+                np.subtract(output, y_batch[:m], out=dY[:m])
+                gradient = dY[:m]
+                for layer in reversed(self.layers):
+                    gradient = layer.backward_fused(gradient, self.optimizer.learning_rate)
+
+            if loss_every and epoch % loss_every == 0:
+                sample = np.random.randint(0, X.shape[0], size=min(loss_sample, X.shape[0]))
+                loss = self.mse_loss(self.forward(X[sample]), y[sample])
+                self.loss_history.append(loss)
+                if verbose:
+                    print(f'Epoch {epoch+1}, Loss: {loss}')
+
         return self.loss_history
 
     def mse_loss(self, predictions: np.ndarray, targets: np.ndarray) -> float:
@@ -135,10 +371,33 @@ class Sequential:
         return sum(layer.num_params() for layer in self.layers)
     
     def serialize(self) -> str:
-        result = f"{len(self.layers)}, "
+        return felts_as_string(self.serialize_felts())
+
+    # layout expected by Sequential::init_from_felt252 :
+    # n_layers, (weights: Span<Span<felt252>>, biaises: Span<felt252>, activation) * n_layers
+    def serialize_felts(self, out: list = None) -> list:
+        out = [] if out is None else out
+        out.append(len(self.layers))
+        for layer in self.layers:
+            layer.serialize_felts(out)
+        return out
+
+    # same header, layers in the sparse (index, value) format
+    # of DenseLayer.serialize_sparse_felts (off-chain format for now,
+    # init_from_felt252 only reads the dense layout)
+    def serialize_sparse_felts(self, out: list = None) -> list:
+        out = [] if out is None else out
+        out.append(len(self.layers))
         for layer in self.layers:
-            result += f"{layer.serialize()}, "
-        return result[:-2]
+            layer.serialize_sparse_felts(out)
+        return out
+
+    def serialize_sparse(self) -> str:
+        return felts_as_string(self.serialize_sparse_felts())
+
+    def serialize_to_file(self, path: str) -> None:
+        with open(path, 'w') as file:
+            self.serialize_felts(FeltStream(file))
 
 class SGD:
     def __init__(self, learning_rate : float) -> None:
@@ -146,7 +405,12 @@ class SGD:
 
 # ----------------------------------------------------------------------------------------------------------------
 
-def build_model(train_X, train_Y):
+def build_model(train_X, train_Y, sparsity: float = 0.0, ranks: dict = None):
+    '''
+    Train the deployed architecture, then optionally compress it
+    (compression.compress) : ``sparsity`` fraction of pruned weights,
+    ``ranks`` of the factorized layers by index.
+    '''
     layers = [
         DenseLayer(input_shape=train_X.shape[1], output_shape=5, activation="ReLU"), 
         DenseLayer(output_shape=5, activation="ReLU"), 
@@ -156,5 +420,12 @@ def build_model(train_X, train_Y):
     model = Sequential(layers, SGD(learning_rate=0.01))
     model.build()
     model.train(train_X, train_Y, epochs=30, batch_size=1000, verbose=True)
-    
+
+    if sparsity > 0 or ranks:
+        # compression imports this module
+        from compression import compress, compression_report
+        compressed = compress(model, sparsity, ranks)
+        print(compression_report(model, compressed))
+        model = compressed
+
     return model
\ No newline at end of file
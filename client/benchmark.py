@@ -0,0 +1,186 @@
+import argparse
+import copy
+import os
+import time
+import numpy as np
+
+from basic_conversions import wfloat, wfloat_to_float, wfloat_array, wfloat_array_to_float, \
+    matrix_as_felt_string, wsad_array
+from wfloat_model import WFloatSequential, WFloatDenseLayer, reference_forward, RELU, SIGMOID, SOFTMAX
+
+# ----------------------------------------------------------------------
+
+def timeit(function, repeat : int = 3) -> float :
+    '''
+    Best wall time (seconds) over ``repeat`` runs.
+    '''
+    best = float("inf")
+    for _ in range(repeat) :
+        start = time.perf_counter()
+        function()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+def report(name : str, baseline : float, candidate : float) -> None :
+    print(f"{name:<32} baseline {baseline*1e3:10.2f} ms | "
+          f"optimized {candidate*1e3:10.2f} ms | x{baseline / candidate:.1f}")
+
+# ----------------------------------------------------------------------
+
+def benchmark_wfloat_codec(n_rows : int, n_cols : int) -> None :
+    X = np.random.randn(n_rows, n_cols) * 10
+
+    encoded = [[wfloat(x) for x in line] for line in X]
+    assert (wfloat_array(X) == np.array(encoded, dtype=object)).all()
+
+    report(
+        f"encode {n_rows}x{n_cols}",
+        timeit(lambda : [[wfloat(x) for x in line] for line in X]),
+        timeit(lambda : wfloat_array(X))
+    )
+    report(
+        f"decode {n_rows}x{n_cols}",
+        timeit(lambda : [[wfloat_to_float(x) for x in line] for line in encoded]),
+        timeit(lambda : wfloat_array_to_float(encoded))
+    )
+
+def _concatenated_matrix_as_felt_string(matrix) -> str :
+    # previous implementation, kept as the reference for the serializer benchmark
+    result = f"{len(matrix)}, "
+    for line in matrix :
+        result += f"{len(line)}, "
+        for x in line :
+            result += f"{wfloat(x)}, "
+    return result[:-2]
+
+def benchmark_serializer(n_rows : int, n_cols : int) -> None :
+    W = np.random.randn(n_rows, n_cols)
+    assert _concatenated_matrix_as_felt_string(W) == matrix_as_felt_string(W)
+
+    report(
+        f"serialize {n_rows}x{n_cols}",
+        timeit(lambda : _concatenated_matrix_as_felt_string(W)),
+        timeit(lambda : matrix_as_felt_string(W))
+    )
+
+def benchmark_wfloat_model(n_rows : int, n_cols : int) -> None :
+    model = WFloatSequential([
+        WFloatDenseLayer(wsad_array(np.random.randn(n_cols, 5)), wsad_array(np.random.randn(5)), activation)
+        for activation in (RELU,)
+    ] + [
+        WFloatDenseLayer(wsad_array(np.random.randn(5, 5)), wsad_array(np.random.randn(5)), activation)
+        for activation in (SIGMOID, SOFTMAX)
+    ], force_relu=False)
+    X = wsad_array(np.random.randn(n_rows, n_cols))
+
+    n_checked = min(n_rows, 100)
+    assert (model.forward(X[:n_checked]) == np.array(reference_forward(model, X[:n_checked]))).all()
+
+    report(
+        f"wfloat forward {n_checked}x{n_cols}",
+        timeit(lambda : reference_forward(model, X[:n_checked]), repeat=1),
+        timeit(lambda : model.forward(X[:n_checked]), repeat=1)
+    )
+
+STAR_DATASET_PATH = os.path.join("..", "data", "star_classification.csv")
+
+def star_dataset(n_rows : int):
+    '''
+    Standardized star classification features and one hot classes,
+    random data of the same shape when the csv is not downloaded.
+    '''
+    if os.path.exists(STAR_DATASET_PATH) :
+        import pandas as pd
+        df = pd.read_csv(STAR_DATASET_PATH, nrows=n_rows)
+        X = df.drop(columns=["class"]).to_numpy(dtype=float)
+        classes, Y = np.unique(df["class"].to_numpy(), return_inverse=True)
+        Y = np.eye(len(classes))[Y]
+    else :
+        print(f"{STAR_DATASET_PATH} not found, using random data")
+        X = np.random.randn(n_rows, 17)
+        Y = np.eye(3)[np.random.randint(0, 3, n_rows)]
+    X = (X - X.mean(axis=0)) / (X.std(axis=0) + 1e-12)
+    return X, Y
+
+def benchmark_training(n_rows : int, epochs : int = 5, batch_size : int = 1000) -> None :
+    from basic_model_sample import DenseLayer, Sequential, SGD
+
+    X, Y = star_dataset(n_rows)
+    model = Sequential([
+        DenseLayer(input_shape=X.shape[1], output_shape=5, activation="ReLU"),
+        DenseLayer(output_shape=5, activation="ReLU"),
+        DenseLayer(output_shape=Y.shape[1], activation="ReLU"),
+    ], SGD(learning_rate=0.01))
+    model.build()
+
+    report(
+        f"epoch {n_rows} rows (float64)",
+        timeit(lambda : copy.deepcopy(model).train(X, Y, epochs, batch_size)) / epochs,
+        timeit(lambda : copy.deepcopy(model).train_fused(X, Y, epochs, batch_size, dtype=np.float64)) / epochs
+    )
+    report(
+        f"epoch {n_rows} rows (float32)",
+        timeit(lambda : copy.deepcopy(model).train(X, Y, epochs, batch_size)) / epochs,
+        timeit(lambda : copy.deepcopy(model).train_fused(X, Y, epochs, batch_size)) / epochs
+    )
+
+def benchmark_parallel_training(n_rows : int, epochs : int = 3, batch_size : int = 10_000) -> None :
+    from basic_model_sample import DenseLayer, Sequential, SGD
+    from parallel_training import DataParallelTrainer
+
+    X, Y = star_dataset(n_rows)
+    model = Sequential([
+        DenseLayer(input_shape=X.shape[1], output_shape=64, activation="ReLU"),
+        DenseLayer(output_shape=64, activation="ReLU"),
+        DenseLayer(output_shape=Y.shape[1], activation="ReLU"),
+    ], SGD(learning_rate=0.01))
+    model.build()
+
+    baseline = timeit(lambda : copy.deepcopy(model).train(X, Y, epochs, batch_size), repeat=1)
+    n_workers = 1
+    while n_workers <= os.cpu_count() :
+        report(
+            f"training {n_workers} workers",
+            baseline,
+            timeit(lambda : DataParallelTrainer(copy.deepcopy(model), n_workers).train(X, Y, epochs, batch_size), repeat=1)
+        )
+        n_workers *= 2
+
+def benchmark_inference(n_rows : int) -> None :
+    from basic_model_sample import DenseLayer, Sequential, SGD
+
+    X, Y = star_dataset(min(n_rows, 100_000))
+    X = np.resize(X, (n_rows, X.shape[1]))
+    model = Sequential([
+        DenseLayer(input_shape=X.shape[1], output_shape=5, activation="ReLU"),
+        DenseLayer(output_shape=5, activation="ReLU"),
+        DenseLayer(output_shape=Y.shape[1], activation="ReLU"),
+    ], SGD(learning_rate=0.01))
+    model.build()
+
+    report(f"predict_batch {n_rows} rows", timeit(lambda : model.forward(X)), timeit(lambda : model.predict_batch(X)))
+    compiled = model.compile()
+    report(f"compiled {n_rows} rows", timeit(lambda : model.forward(X)), timeit(lambda : compiled(X)))
+
+# ----------------------------------------------------------------------
+
+BENCHMARKS = {
+    "wfloat" : lambda args : benchmark_wfloat_codec(args.rows, 8),
+    "serializer" : lambda args : benchmark_serializer(args.rows, 64),
+    "wfloat_model" : lambda args : benchmark_wfloat_model(args.rows, 8),
+    "training" : lambda args : benchmark_training(max(args.rows, 100_000)),
+    "inference" : lambda args : benchmark_inference(max(args.rows, 1_000_000)),
+    "parallel_training" : lambda args : benchmark_parallel_training(max(args.rows, 100_000)),
+}
+
+def main():
+    parser = argparse.ArgumentParser(description="Client benchmarks")
+    parser.add_argument('names', nargs='*', default=list(BENCHMARKS), help='benchmarks to run')
+    parser.add_argument('--rows', type=int, default=10_000, help='number of input rows')
+    args = parser.parse_args()
+
+    for name in args.names :
+        BENCHMARKS[name](args)
+
+if __name__ == "__main__":
+    main()
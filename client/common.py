@@ -1,8 +1,12 @@
+import asyncio
 import json
 import os
-from starknet_py.net.full_node_client import FullNodeClient
+import threading
 import numpy as np
 
+from fees import FeeEstimator
+from prediction_cache import PredictionCache
+
 # ----------------------------------------------------------------------
 # GLOBAL VARIABLES
 
@@ -14,11 +18,28 @@ class GlobalState:
 
         with open(os.path.join('data', 'contract_info.json'), 'r') as file :
             data = json.load(file)
-            self.RPC = data['rpc']
+            self.RPC = os.environ.get('ASTRAL_RPC', data['rpc'])
             self.DECLARED_ADDRESS = data['declared_address']
             self.DEPLOYED_ADDRESS = data['deployed_address']
+            # to bump whenever the model stored at DEPLOYED_ADDRESS changes
+            self.MODEL_VERSION = data.get('model_version', 0)
+            # raw_model calldata of the constructor (Sequential.serialize_to_file)
+            self.MODEL_PATH = data.get('model_path', os.path.join('..', 'contract', 'draft', 'model_weights.save'))
+
+        # one event loop for the whole client, the http session and
+        # the resolved contracts are bound to it and reused between calls.
+        # Opened on first use (see _connect) : importing this module
+        # neither loads aiohttp / starknet_py nor touches the network.
+        self._connect_lock = threading.Lock()
+        self._loop = None
+        self._session = None
+        self._client = None
+        self._prediction_cache = None
+        self._deployed_model = None
+        self._float_model_predict = None
+        self._fee_estimator = None
 
-        self.client = FullNodeClient(node_url=self.RPC)
+        self.contracts = dict()
         self.addresses = None
         self.private_keys = None
 
@@ -26,11 +47,110 @@ class GlobalState:
         self.bot_account = None
         self.default_contract = None
 
+        # float32 standardized features, int8 class indices (see simulation_data)
+        self.classes = None
+        self.scaler = None
         self.train_X = None
-        self.train_Y = None
+        self.train_y = None
         self.test_X = None
-        self.test_Y = None
+        self.test_y = None
 
         self.current_sample = np.array([])
 
+    async def _open_session(self):
+        import aiohttp
+        return aiohttp.ClientSession()
+
+    def _connect(self) -> None:
+        with self._connect_lock:
+            if self._client is not None:
+                return
+            from starknet_py.net.full_node_client import FullNodeClient
+
+            self._loop = asyncio.new_event_loop()
+            self.loop_thread = threading.Thread(target=self._loop.run_forever, daemon=True)
+            self.loop_thread.start()
+            self._session = asyncio.run_coroutine_threadsafe(self._open_session(), self._loop).result()
+            self._client = FullNodeClient(node_url=self.RPC, session=self._session)
+
+    @property
+    def loop(self) -> asyncio.AbstractEventLoop:
+        self._connect()
+        return self._loop
+
+    @property
+    def session(self):
+        self._connect()
+        return self._session
+
+    @property
+    def client(self):
+        self._connect()
+        return self._client
+
+    @property
+    def prediction_cache(self) -> PredictionCache:
+        if self._prediction_cache is None:
+            self._prediction_cache = PredictionCache(
+                path=os.path.join('data', 'prediction_cache.sqlite')
+            )
+        return self._prediction_cache
+
+    @property
+    def deployed_model(self):
+        '''
+        wfloat_model.WFloatSequential replica of the model at DEPLOYED_ADDRESS,
+        read from MODEL_PATH (None if there is no such file).
+        '''
+        if self._deployed_model is None and os.path.exists(self.MODEL_PATH):
+            from basic_conversions import felts_from_string
+            from wfloat_model import WFloatSequential
+            with open(self.MODEL_PATH, 'r') as file:
+                self._deployed_model = WFloatSequential.from_felts(felts_from_string(file.read()))
+        return self._deployed_model
+
+    @property
+    def model_predict(self):
+        '''
+        Float inputs -> outputs of the deployed model, as computed by its
+        predict (None if there is no MODEL_PATH file). Nothing is trained.
+        '''
+        return None if self.deployed_model is None else self.deployed_model.predict
+
+    @property
+    def float_model_predict(self):
+        '''
+        Same model in floating point (WFloatSequential.to_model().compile()),
+        the gap with model_predict is the fixed point rounding.
+        '''
+        if self._float_model_predict is None and self.deployed_model is not None:
+            self._float_model_predict = self.deployed_model.to_model().compile()
+        return self._float_model_predict
+
+    @property
+    def fee_estimator(self) -> FeeEstimator:
+        # sized on the deployed layers, DEFAULT_GAS without them
+        if self._fee_estimator is None:
+            self._fee_estimator = FeeEstimator()
+            if self.deployed_model is not None:
+                self._fee_estimator.set_model(self.deployed_model)
+        return self._fee_estimator
+
+    def run(self, coroutine):
+        '''
+        Run a coroutine on the shared event loop and wait for its result.
+        '''
+        return asyncio.run_coroutine_threadsafe(coroutine, self.loop).result()
+
+    def close(self) -> None:
+        if self._prediction_cache is not None:
+            self._prediction_cache.close()
+            self._prediction_cache = None
+        if self._loop is None or self._loop.is_closed():
+            return
+        self.run(self._session.close())
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self.loop_thread.join()
+        self._loop.close()
+
 globalState = GlobalState()
@@ -0,0 +1,113 @@
+import copy
+import numpy as np
+from typing import Dict, List, Tuple
+
+from basic_conversions import wsad_array
+from basic_model_sample import DenseLayer, Sequential, SGD
+from fees import model_storage_reads
+
+# ----------------------------------------------------------------------
+# Post training compression : magnitude pruning and low rank
+# factorization of DenseLayer, with their effect on storage / calldata.
+
+def magnitude_prune(model : Sequential, sparsity : float) -> List[np.ndarray]:
+    '''
+    Zero the ``sparsity`` fraction of smallest weights of every layer (in place).
+    Returns the masks of the kept weights.
+    '''
+    masks = []
+    for layer in model.layers:
+        n_pruned = int(sparsity * layer.W.size)
+        mask = np.ones(layer.W.size, dtype=bool)
+        if n_pruned > 0:
+            mask[np.argpartition(np.abs(layer.W).ravel(), n_pruned - 1)[:n_pruned]] = False
+        mask = mask.reshape(layer.W.shape)
+        layer.W *= mask
+        masks.append(mask)
+    return masks
+
+def low_rank_factorize(layer : DenseLayer, rank : int) -> Tuple[DenseLayer, DenseLayer]:
+    '''
+    Replace W (n x m) by a rank ``rank`` truncated SVD U V, as two ReLU layers.
+
+    The contract only applies ReLU, the linear map X U goes through it
+    with relu(a) - relu(-a) = a :
+        first  : W1 = [U, -U], no biais           (n x 2r)
+        second : W2 = [V ; -V], original biais   (2r x m)
+    so that relu(X W1) W2 + b = X U V + b.
+    '''
+    U, S, Vt = np.linalg.svd(layer.W, full_matrices=False)
+    U = U[:, :rank] * np.sqrt(S[:rank])
+    V = np.sqrt(S[:rank])[:, None] * Vt[:rank]
+
+    first = DenseLayer(layer.input_shape, 2 * rank, "ReLU")
+    first.build()
+    first.W = np.concatenate([U, -U], axis=1)
+    first.b = np.zeros((1, 2 * rank))
+
+    second = DenseLayer(2 * rank, layer.output_shape, layer.activation_name)
+    second.build()
+    second.W = np.concatenate([V, -V], axis=0)
+    second.b = layer.b.copy()
+
+    return first, second
+
+def factorize_model(model : Sequential, ranks : Dict[int, int]) -> Sequential:
+    '''
+    New model where layer i is factorized with rank ranks[i] when it reduces the number of weights.
+    '''
+    layers = []
+    for index, layer in enumerate(model.layers):
+        rank = ranks.get(index)
+        if rank is not None and 2 * rank * (layer.input_shape + layer.output_shape) < layer.W.size:
+            layers.extend(low_rank_factorize(layer, rank))
+        else:
+            layers.append(layer)
+    return Sequential(layers, SGD(model.optimizer.learning_rate))
+
+def compress(model : Sequential, sparsity : float = 0.0, ranks : Dict[int, int] = None) -> Sequential:
+    '''
+    Post training step : low rank factorization (factorize_model) then magnitude
+    pruning of the result. The trained model is left untouched.
+    '''
+    compressed = factorize_model(copy.deepcopy(model), {} if ranks is None else ranks)
+    if sparsity > 0:
+        magnitude_prune(compressed, sparsity)
+    return compressed
+
+# ----------------------------------------------------------------------
+
+def nonzero_weights(layer : DenseLayer) -> int:
+    '''
+    Weights stored by DenseLayer.serialize_sparse_felts : the ones that do not truncate to a zero wfloat.
+    '''
+    return int(np.count_nonzero(wsad_array(layer.W)))
+
+def sparse_storage_slots(model : Sequential) -> int:
+    '''
+    model_content entries if only the non zero weights were stored as (index, value).
+    '''
+    # weights + biaises + (input size, output size, nnz, activation)
+    return sum(
+        2 * nonzero_weights(layer) + layer.output_shape + 4
+        for layer in model.layers
+    )
+
+def size_report(model : Sequential) -> dict:
+    layer_dims = [(layer.input_shape, layer.output_shape) for layer in model.layers]
+    return {
+        "parameters" : int(model.num_params()),
+        "nonzero_weights" : sum(nonzero_weights(layer) for layer in model.layers),
+        "storage_slots" : model_storage_reads(layer_dims),
+        "sparse_storage_slots" : sparse_storage_slots(model),
+        "calldata_felts" : len(model.serialize_felts()),
+        "sparse_calldata_felts" : len(model.serialize_sparse_felts()),
+    }
+
+def compression_report(before : Sequential, after : Sequential) -> str:
+    before_size = size_report(before)
+    after_size = size_report(after)
+    lines = [f"{'':<24}{'before':>12}{'after':>12}"]
+    for key in before_size:
+        lines.append(f"{key:<24}{before_size[key]:>12}{after_size[key]:>12}")
+    return "\n".join(lines)
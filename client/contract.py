@@ -1,7 +1,7 @@
 import json
 import os
+import sys
 
-import eel
 from starknet_py.net.full_node_client import FullNodeClient
 from starknet_py.net.account.account import Account
 from starknet_py.net.models.chains import StarknetChainId
@@ -16,13 +16,14 @@ from pprint import pprint
 
 from typing import List, Optional, Tuple
 from common import globalState
+from fees import observed_gas
 
 # import aioconsole
-import asyncio
 
 import numpy as np
 
-from basic_conversions import wfloat, wfloat_to_float, to_hex, from_hex
+from basic_conversions import wfloat, wfloat_to_float, wfloat_array, wfloat_array_to_float, \
+    felts_as_matrix, to_hex, from_hex
 
 # ----------------------------------------------------------------------
 
@@ -102,9 +103,27 @@ def retrieve_account_data() -> None:
 # CALL
 # ----------------------------------------------------------------------
 
+async def get_contract_async(provider = None, address : str = None) -> Contract :
+    '''
+    Resolve a contract once per (provider, address) and cache it,
+    later calls reuse the ABI instead of fetching it again.
+    '''
+    provider = globalState.client if provider is None else provider
+    address = globalState.DEPLOYED_ADDRESS if address is None else address
+    key = (getattr(provider, "address", None), int(address, 16))
+
+    contract = globalState.contracts.get(key)
+    if contract is None :
+        contract = await Contract.from_address(provider=provider, address=address)
+        contract = globalState.contracts.setdefault(key, contract)
+    return contract
+
+def get_contract(provider = None, address : str = None) -> Contract :
+    return globalState.run(get_contract_async(provider, address))
+
 def call_generic(function_name : str) :
-    contract = globalState.default_contract
-    return asyncio.run(
+    contract = get_contract()
+    return globalState.run(
         contract.functions[function_name].call()
     )[0]
 
@@ -119,31 +138,53 @@ def call_generic(function_name : str) :
 
 # ADD PREDICTION INVOKE
 
-def invoke_predict(prediction: np.array, debug=False) :
+async def invoke_predict_rows(contract : Contract, inputs_as_felt : list, for_storage : bool = True) -> list :
+    '''
+    Invoke predict and read the returned matrix from the transaction trace.
+    '''
+    # fn predict(ref self: TContractState, inputs: Matrix, for_storage: bool) -> Matrix;
+    result = await contract.functions["predict"].invoke_v3(
+        inputs=inputs_as_felt, for_storage=for_storage,
+        l1_resource_bounds=globalState.fee_estimator.resource_bounds("predict", np.shape(inputs_as_felt))
+    )
+    await result.wait_for_acceptance()
+
+    try :
+        gas_used = await observed_gas(globalState.client, result.hash)
+    except Exception as error :
+        print(f"[predict] fee of {result.hash:#x} not observed : {error}", file=sys.stderr)
+    else :
+        globalState.fee_estimator.observe("predict", np.shape(inputs_as_felt), gas_used)
+
+    trace = await globalState.client.trace_transaction(result.hash)
+    # __execute__ of the account -> predict call
+    return felts_as_matrix(trace.execute_invocation.calls[0].result)
+
+def predict_onchain(prediction: np.array, log = print, for_storage : bool = True) -> np.ndarray :
+    '''
+    Predict with the deployed model (cached rows are not resubmitted,
+    unless ``for_storage`` : the contract then has to see every row).
+    '''
     account = globalState.bot_account
 
-    contract = asyncio.run(
-        Contract.from_address(
-                provider=account, 
-                address=globalState.DEPLOYED_ADDRESS
-    ))
-
-    inputs_as_felt = [
-       [ wfloat(x) for x in line ] for line in prediction
-    ]
+    contract = get_contract(account)
 
+    inputs_as_felt = wfloat_array(prediction).tolist()
 
-    eel.writeToConsole("Try predict ..")
+    def submit(rows : list) -> list :
+        log(f"Try predict ({len(rows)} {'' if for_storage else 'uncached '}rows) ..")
+        return globalState.run(invoke_predict_rows(contract, rows, for_storage))
 
-    # fn predict(ref self: TContractState, inputs: Matrix, for_storage: bool) -> Matrix;
-    result = asyncio.run(
-        contract.functions["predict"].invoke_v3(
-            inputs=inputs_as_felt, for_storage=True, 
-            l1_resource_bounds=RESOURCE_BOUND_UPDATE_PREDICTION
-        )
+    res = globalState.prediction_cache.predict(
+        globalState.DEPLOYED_ADDRESS, globalState.MODEL_VERSION, inputs_as_felt, submit, for_storage
     )
+    return wfloat_array_to_float(res)
+
+def invoke_predict(prediction: np.array, debug=False) :
+    # eel is only loaded by the web interface, not by the headless commands
+    import eel
 
-    res = result
+    res = predict_onchain(prediction, log=eel.writeToConsole)
 
     eel.writeToConsole("Succeed")
     eel.setSepoliaConsole(
@@ -0,0 +1,122 @@
+import math
+import time
+from typing import Dict, List, Optional, Tuple
+
+# ----------------------------------------------------------------------
+# Cost model of CountryWiseContract.predict (in l1 gas)
+# Rough starting coefficients, refined by FeeEstimator.observe.
+
+BASE_GAS = 20_000
+GAS_PER_STORAGE_READ = 200 # one model_content entry
+GAS_PER_MULTIPLICATION = 20 # one WFloat mul + add in naive_dot
+GAS_PER_CALLDATA_FELT = 30
+GAS_PER_ROW = 500 # row wise addition + activation
+
+PRICE_PER_UNIT = 1042990458309864
+DEFAULT_GAS = 39_871 # previous hand tuned bound (59806) once MARGIN is applied
+
+MARGIN = 1.5
+TTL = 600.0 # seconds
+SMOOTHING = 0.2
+
+def model_storage_reads(layer_dims : List[Tuple[int, int]]) -> int:
+    '''
+    Number of model_content entries read by read_model.
+    '''
+    # weights + biaises + (input size, output size, activation)
+    return sum(n_in * n_out + n_out + 3 for n_in, n_out in layer_dims)
+
+def calldata_size(input_shape : Tuple[int, int]) -> int:
+    n_rows, n_cols = input_shape
+    return 1 + n_rows * (n_cols + 1) + 1
+
+def estimate_gas(function_name : str, input_shape : Tuple[int, int], layer_dims : Optional[List[Tuple[int, int]]]) -> int:
+    '''
+    Estimate the l1 gas of an invocation from the input shape and the model layers.
+    '''
+    if function_name != "predict" or layer_dims is None :
+        return DEFAULT_GAS
+
+    n_rows = input_shape[0]
+    multiplications = n_rows * sum(n_in * n_out for n_in, n_out in layer_dims)
+    return (
+        BASE_GAS
+        + GAS_PER_STORAGE_READ * model_storage_reads(layer_dims)
+        + GAS_PER_MULTIPLICATION * multiplications
+        + GAS_PER_ROW * n_rows * len(layer_dims)
+        + GAS_PER_CALLDATA_FELT * calldata_size(input_shape)
+    )
+
+# ----------------------------------------------------------------------
+
+class FeeEstimator:
+    '''
+    Resource bounds per (function, input shape), estimated off-chain
+    and cached with a TTL. Observed fees update both the cached entry
+    and a per-function correction applied to new shapes.
+    '''
+    def __init__(
+            self, layer_dims : Optional[List[Tuple[int, int]]] = None,
+            price_per_unit : int = PRICE_PER_UNIT, margin : float = MARGIN,
+            ttl : float = TTL) -> None:
+        self.layer_dims = layer_dims
+        self.price_per_unit = price_per_unit
+        self.margin = margin
+        self.ttl = ttl
+
+        self.cache : Dict[Tuple[str, Tuple[int, ...]], Tuple[float, float]] = dict()
+        self.corrections : Dict[str, float] = dict()
+
+    def set_model(self, model) -> None:
+        '''
+        Use the layer dimensions of a basic_model_sample.Sequential
+        or a wfloat_model.WFloatSequential (eg. globalState.deployed_model).
+        '''
+        self.layer_dims = [(layer.input_shape, layer.output_shape) for layer in model.layers]
+        self.cache.clear()
+        self.corrections.clear()
+
+    def _evict(self, now : float) -> None:
+        expired = [key for key, (_, timestamp) in self.cache.items() if now - timestamp > self.ttl]
+        for key in expired :
+            del self.cache[key]
+
+    def gas(self, function_name : str, input_shape : tuple) -> float:
+        now = time.monotonic()
+        self._evict(now)
+
+        key = (function_name, tuple(input_shape))
+        if key not in self.cache :
+            modeled = estimate_gas(function_name, key[1], self.layer_dims)
+            self.cache[key] = (modeled * self.corrections.get(function_name, 1.0), now)
+        return self.cache[key][0]
+
+    def resource_bounds(self, function_name : str, input_shape : tuple) -> 'ResourceBounds':
+        from starknet_py.net.client_models import ResourceBounds
+        return ResourceBounds(
+            math.ceil(self.gas(function_name, input_shape) * self.margin),
+            self.price_per_unit
+        )
+
+    def observe(self, function_name : str, input_shape : tuple, gas_used : int) -> None:
+        '''
+        Refine the estimate with the gas actually consumed by a transaction.
+        '''
+        key = (function_name, tuple(input_shape))
+        previous = self.gas(function_name, input_shape)
+        # never settle below what was just observed
+        refined = max((1 - SMOOTHING) * previous + SMOOTHING * gas_used, gas_used)
+        self.cache[key] = (refined, time.monotonic())
+
+        modeled = estimate_gas(function_name, key[1], self.layer_dims)
+        ratio = gas_used / modeled
+        correction = self.corrections.get(function_name, ratio)
+        self.corrections[function_name] = (1 - SMOOTHING) * correction + SMOOTHING * ratio
+
+async def observed_gas(client, transaction_hash : int) -> int:
+    '''
+    Gas consumed by an accepted transaction : actual fee / l1 gas price of its block.
+    '''
+    receipt = await client.get_transaction_receipt(transaction_hash)
+    block = await client.get_block(block_number=receipt.block_number)
+    return math.ceil(receipt.actual_fee.amount / block.l1_gas_price.price_in_fri)
@@ -0,0 +1,57 @@
+import argparse
+import subprocess
+import sys
+from collections import defaultdict
+from typing import Dict, List, Tuple
+
+# ----------------------------------------------------------------------
+# Import time report, from ``python -X importtime`` in a fresh interpreter
+# (so nothing is already in sys.modules).
+
+def import_times(module : str) -> List[Tuple[str, int, int]]:
+    '''
+    (module, self µs, cumulative µs) of every module loaded by ``import module``.
+    '''
+    completed = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True, text=True
+    )
+    if completed.returncode != 0 :
+        raise ImportError(completed.stderr.strip().splitlines()[-1])
+
+    times = []
+    for line in completed.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line :
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        times.append((name.strip(), int(self_us), int(cumulative_us)))
+    return times
+
+def package_times(times : List[Tuple[str, int, int]]) -> Dict[str, int]:
+    '''
+    Self time per top level package, the cost of pulling it in.
+    '''
+    result = defaultdict(int)
+    for name, self_us, _ in times :
+        result[name.split(".")[0]] += self_us
+    return dict(result)
+
+def import_report(module : str, top : int = 15) -> str:
+    times = import_times(module)
+    packages = sorted(package_times(times).items(), key=lambda item : -item[1])
+    total = sum(self_us for _, self_us, _ in times)
+
+    lines = [f"import {module} : {total / 1000:.1f} ms, {len(times)} modules", f"{'package':<32}{'ms':>10}{'%':>8}"]
+    for package, self_us in packages[:top] :
+        lines.append(f"{package:<32}{self_us / 1000:>10.1f}{100 * self_us / max(total, 1):>8.1f}")
+    return "\n".join(lines)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Per package import cost")
+    parser.add_argument("modules", nargs="*", default=["main"])
+    parser.add_argument("--top", type=int, default=15)
+    args = parser.parse_args()
+
+    for module in args.modules :
+        print(import_report(module, args.top))
+        print()
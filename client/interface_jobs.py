@@ -0,0 +1,44 @@
+import numpy as np
+
+from common import globalState
+from simulation_data import sample
+from contract import predict_onchain
+from submitter import Submitter, predict_submissions
+from basic_conversions import wfloat_array
+
+# ----------------------------------------------------------------------
+# Jobs of the web interface commands (see web_interface.query), kept out
+# of web_interface so that they run without eel.
+
+def fetch_job(job) :
+    X, Y = sample()
+    globalState.current_sample = X
+    # fixed point columns (as the contract), then float columns
+    model_Y = None if globalState.model_predict is None \
+        else np.hstack([globalState.model_predict(X), globalState.float_model_predict(X)])
+    visual = f"X = \n{X}\n Expected Y = \n{Y}\nExpected model (fixed point | float)\nY = \n{model_Y}"
+    job.send("setSimulationConsole", visual)
+
+def predict_job(X, for_storage : bool = False) :
+    '''
+    Rows already predicted are answered by the prediction cache, unless
+    ``for_storage`` : the contract then stores every row.
+    '''
+    def run(job) :
+        def log(text : str) :
+            # last chance to cancel, before the transaction is sent
+            job.check()
+            job.progress(text)
+        res = predict_onchain(X, log=log, for_storage=for_storage)
+        job.progress("Succeed")
+        job.send("setSepoliaConsole", f"Onchain result:\n{res}")
+    return run
+
+def predict_all_job(X) :
+    def run(job) :
+        submissions = predict_submissions(wfloat_array(X).tolist())
+        job.progress(f"{len(submissions)} transactions ..")
+        job.check()
+        report = Submitter().submit(submissions)
+        job.progress(str(report))
+    return run
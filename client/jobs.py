@@ -0,0 +1,137 @@
+import itertools
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional
+
+# ----------------------------------------------------------------------
+# Background commands of the web interface : each command runs on a
+# worker thread as a Job, its messages are queued and forwarded to the
+# console by the eel greenlet (see web_interface.pump_messages).
+
+MAX_WORKERS = 4
+KEPT_JOBS = 100 # finished jobs remembered for ``jobs``
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+CANCELLED = "cancelled"
+
+class JobCancelled(Exception):
+    pass
+
+class Job:
+    def __init__(self, job_id : int, name : str, messages : queue.Queue) -> None:
+        self.id = job_id
+        self.name = name
+        self.status = QUEUED
+        self.error = None
+        self.created = time.monotonic()
+        self.finished = None
+        self.future = None
+
+        self._messages = messages
+        self._cancel = threading.Event()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancel.is_set()
+
+    def check(self) -> None:
+        '''
+        Raise JobCancelled if a cancellation was requested, to call between steps.
+        '''
+        if self.cancelled :
+            raise JobCancelled()
+
+    def progress(self, text : str) -> None:
+        self.send("writeToConsole", f"[job {self.id}] {text}")
+
+    def send(self, function_name : str, text : str) -> None:
+        '''
+        Call eel.<function_name>(text) from the eel thread.
+        '''
+        self._messages.put((function_name, text))
+
+    def __str__(self) -> str:
+        end = time.monotonic() if self.finished is None else self.finished
+        return f"[job {self.id}] {self.name} : {self.status} ({end - self.created:.1f}s)"
+
+class JobPool:
+    def __init__(self, max_workers : int = MAX_WORKERS) -> None:
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="job")
+        self.messages : queue.Queue = queue.Queue()
+        self.jobs : Dict[int, Job] = dict()
+        self.ids = itertools.count(1)
+        self.lock = threading.Lock()
+
+    def submit(self, name : str, function : Callable[[Job], None]) -> Job:
+        '''
+        Run ``function(job)`` on a worker thread.
+        '''
+        with self.lock :
+            job = Job(next(self.ids), name, self.messages)
+            self.jobs[job.id] = job
+            self._forget_finished()
+        # before the worker can post its own messages
+        job.progress(f"{name} : {QUEUED}")
+        job.future = self.executor.submit(self._run, job, function)
+        return job
+
+    def _run(self, job : Job, function : Callable[[Job], None]) -> None:
+        try :
+            # cancelled after the worker picked it, before it started
+            job.check()
+            job.status = RUNNING
+            function(job)
+            job.status = DONE
+        except JobCancelled :
+            job.status = CANCELLED
+        except Exception as error :
+            job.status = FAILED
+            job.error = error
+            job.progress(f"failed : {error}")
+        finally :
+            job.finished = time.monotonic()
+            job.progress(f"{job.name} : {job.status}")
+
+    def cancel(self, job_id : int) -> Optional[Job]:
+        '''
+        Cancel a queued job, or ask a running one to stop at its next ``check``.
+        '''
+        job = self.jobs.get(job_id)
+        if job is None or job.finished is not None :
+            return job
+        job._cancel.set()
+        # not yet handed to the executor : _run sees the flag
+        if job.future is not None and job.future.cancel() :
+            job.status = CANCELLED
+            job.finished = time.monotonic()
+            job.progress(f"{job.name} : {job.status}")
+        return job
+
+    def running(self) -> List[Job]:
+        return [job for job in self.jobs.values() if job.finished is None]
+
+    def _forget_finished(self) -> None:
+        finished = [job.id for job in self.jobs.values() if job.finished is not None]
+        for job_id in finished[:max(0, len(finished) - KEPT_JOBS)] :
+            del self.jobs[job_id]
+
+    def drain(self) -> List[tuple]:
+        '''
+        Pending (function_name, text) messages.
+        '''
+        result = []
+        while True :
+            try :
+                result.append(self.messages.get_nowait())
+            except queue.Empty :
+                return result
+
+    def shutdown(self) -> None:
+        for job in self.running() :
+            job._cancel.set()
+        self.executor.shutdown(wait=False, cancel_futures=True)
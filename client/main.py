@@ -1,34 +1,59 @@
-from web_interface import init_server
-import eel
 import atexit
-import subprocess
-import atexit
-import web_interface
 import os
+import sys
 import argparse
-from threading import Thread
 from common import globalState
-from contract import retrieve_account_data
-from simulation_data import import_data
 
-def main():
-    parser = argparse.ArgumentParser(description="Oracle Scheduler")
+# eel, starknet_py and the model are imported by the commands needing them,
+# see ``python3 import_profile.py main`` for the import cost of this module
 
-    # parser.add_argument('--disable_sepolia', action='store_true', default=False, help='Do not load data/sepolia.json by default')
-    # parser.add_argument('--disable_startup_fetch', action='store_true', default=False, help='Do not load data/sepolia.json by default')
+HEADLESS_COMMANDS = ["contract_address", "contract_declaration_address", "sample", "predict", "call"]
 
-    args = parser.parse_args()
-    
-    print("------------------------------------")
+def run_headless(command : str, arguments : list) -> None:
+    '''
+    Run one command and print its result, without the web interface.
+    '''
+    match command :
+        case "contract_address" :
+            print(globalState.DEPLOYED_ADDRESS)
 
-    if not os.path.exists(os.path.join("data", "sepolia.json")) :
-        print("[Warning] : Offline mode - Did not find data/sepolia.json !")
+        case "contract_declaration_address" :
+            print(globalState.DECLARED_ADDRESS)
 
-    # if not args.disable_sepolia :
+        case "sample" :
+            from simulation_data import import_data, sample
+            import_data()
+            X, _ = sample()
+            print(X)
+
+        case "predict" :
+            from contract import retrieve_account_data, predict_onchain
+            from simulation_data import import_data, sample
+            if arguments not in ([], ["store"]) :
+                raise SystemExit("usage : main.py --headless predict [store]")
+            retrieve_account_data()
+            import_data()
+            X, _ = sample()
+            # cached rows are answered locally, unless stored by the contract
+            print(predict_onchain(X, log=lambda message : print(message, file=sys.stderr), for_storage=arguments == ["store"]))
+
+        case "call" :
+            from contract import call_generic
+            if len(arguments) != 1 :
+                raise SystemExit("usage : main.py --headless call <function_name>")
+            print(call_generic(arguments[0]))
+
+def run_interface() -> None:
+    import eel
+    from web_interface import init_server
+    from contract import retrieve_account_data
+    from simulation_data import import_data
 
     retrieve_account_data()
     import_data()
 
+    # "Expected model" of fetch : globalState.model_predict, the deployed
+    # weights read on first use (see common.GlobalState.deployed_model)
     init_server()
 
     # eel.initComponents()
@@ -44,6 +69,31 @@ def main():
     while globalState.application_on :
         eel.sleep(3)
 
+def main():
+    parser = argparse.ArgumentParser(description="Oracle Scheduler")
+
+    # parser.add_argument('--disable_sepolia', action='store_true', default=False, help='Do not load data/sepolia.json by default')
+    # parser.add_argument('--disable_startup_fetch', action='store_true', default=False, help='Do not load data/sepolia.json by default')
+    parser.add_argument('--headless', choices=HEADLESS_COMMANDS, default=None, help='Run a single command without the web interface')
+    parser.add_argument('arguments', nargs='*', help='Arguments of the headless command')
+
+    args = parser.parse_args()
+
+    atexit.register(globalState.close)
+
+    if args.headless is not None :
+        run_headless(args.headless, args.arguments)
+        return
+
+    print("------------------------------------")
+
+    if not os.path.exists(os.path.join("data", "sepolia.json")) :
+        print("[Warning] : Offline mode - Did not find data/sepolia.json !")
+
+    # if not args.disable_sepolia :
+
+    run_interface()
+
 def cleanup(background_process) :
     background_process.terminate()
     background_process.wait()
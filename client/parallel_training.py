@@ -0,0 +1,169 @@
+import os
+import multiprocessing as mp
+from multiprocessing import shared_memory
+from typing import List, Tuple
+
+import numpy as np
+
+from basic_model_sample import DenseLayer, Sequential
+
+# ----------------------------------------------------------------------
+# Data parallel SGD : every mini-batch is split across worker processes,
+# each computes the gradients of its shard, the master sums them
+# (all-reduce) and applies the update. Dataset, weights and gradients
+# live in shared memory, a step only sends two integers to each worker.
+
+def _shared_array(shape : tuple, dtype=np.float64) -> Tuple[shared_memory.SharedMemory, np.ndarray]:
+    size = max(int(np.prod(shape)) * np.dtype(dtype).itemsize, 1)
+    memory = shared_memory.SharedMemory(create=True, size=size)
+    return memory, np.ndarray(shape, dtype=dtype, buffer=memory.buf)
+
+def _attach(name : str, shape : tuple, dtype=np.float64) -> Tuple[shared_memory.SharedMemory, np.ndarray]:
+    # the master owns (and unlinks) the segment
+    memory = shared_memory.SharedMemory(name=name)
+    return memory, np.ndarray(shape, dtype=dtype, buffer=memory.buf)
+
+def _parameter_shapes(specs : List[Tuple[int, int, str]]) -> List[tuple]:
+    shapes = []
+    for input_shape, output_shape, _ in specs:
+        shapes += [(input_shape, output_shape), (1, output_shape)]
+    return shapes
+
+def _bind_parameters(layers : List[DenseLayer], parameters : np.ndarray, copy_values : bool) -> None:
+    '''
+    Make the W / b of every layer views of the flat parameter buffer.
+    '''
+    offset = 0
+    for layer in layers:
+        for name in ("W", "b"):
+            shape = getattr(layer, name).shape
+            size = int(np.prod(shape))
+            view = parameters[offset:offset + size].reshape(shape)
+            if copy_values:
+                view[...] = getattr(layer, name)
+            setattr(layer, name, view)
+            offset += size
+
+def _worker(index : int, n_workers : int, specs, names : dict, shapes : dict, connection) -> None:
+    memories = dict()
+    arrays = dict()
+    for key in names:
+        dtype = np.int64 if key == "permutation" else np.float64
+        memories[key], arrays[key] = _attach(names[key], shapes[key], dtype)
+
+    layers = [DenseLayer(input_shape, output_shape, activation) for input_shape, output_shape, activation in specs]
+    for layer in layers:
+        layer.build()
+    # weights are read from the shared buffer, never written by workers
+    _bind_parameters(layers, arrays["parameters"], copy_values=False)
+
+    X, y, permutation = arrays["X"], arrays["y"], arrays["permutation"]
+    gradient = arrays["gradients"][index]
+
+    while True:
+        message = connection.recv()
+        if message is None:
+            break
+        start, stop = message
+        indices = np.array_split(permutation[start:stop], n_workers)[index]
+        m = len(indices)
+
+        gradient[...] = 0
+        if m > 0:
+            output = X[indices]
+            for layer in layers:
+                output = layer.forward(output)
+            dY = output - y[indices]
+
+            # gradients of the shard are summed (not averaged) before the reduce
+            offset = len(gradient)
+            for layer in reversed(layers):
+                dY, dW, dB = layer.gradients(dY)
+                for value in (dB, dW):
+                    offset -= value.size
+                    gradient[offset:offset + value.size] = value.ravel() * m
+        connection.send(m)
+
+    for memory in memories.values():
+        memory.close()
+
+# ----------------------------------------------------------------------
+
+class DataParallelTrainer:
+    def __init__(self, model : Sequential, n_workers : int = None) -> None:
+        self.model = model
+        self.n_workers = n_workers or os.cpu_count()
+        self.specs = [(layer.input_shape, layer.output_shape, layer.activation_name) for layer in model.layers]
+        self.n_params = sum(int(np.prod(shape)) for shape in _parameter_shapes(self.specs))
+
+    def _start(self, X : np.ndarray, y : np.ndarray) -> None:
+        self.memories = dict()
+        arrays = dict()
+        shapes = {
+            "X" : X.shape, "y" : y.shape, "permutation" : (X.shape[0],),
+            "parameters" : (self.n_params,), "gradients" : (self.n_workers, self.n_params),
+        }
+        for key, shape in shapes.items():
+            dtype = np.int64 if key == "permutation" else np.float64
+            self.memories[key], arrays[key] = _shared_array(shape, dtype)
+        arrays["X"][...] = X
+        arrays["y"][...] = y
+        self.arrays = arrays
+
+        _bind_parameters(self.model.layers, arrays["parameters"], copy_values=True)
+
+        names = { key : memory.name for key, memory in self.memories.items() }
+        self.connections = []
+        self.processes = []
+        for index in range(self.n_workers):
+            master, worker = mp.Pipe()
+            process = mp.Process(
+                target=_worker, daemon=True,
+                args=(index, self.n_workers, self.specs, names, shapes, worker)
+            )
+            process.start()
+            self.connections.append(master)
+            self.processes.append(process)
+
+    def _stop(self) -> None:
+        for connection in self.connections:
+            connection.send(None)
+        for process in self.processes:
+            process.join()
+
+        # the model keeps private copies of the trained weights
+        for layer in self.model.layers:
+            layer.W = layer.W.copy()
+            layer.b = layer.b.copy()
+        self.arrays = None
+        for memory in self.memories.values():
+            memory.close()
+            memory.unlink()
+
+    def _step(self, start : int, stop : int) -> None:
+        for connection in self.connections:
+            connection.send((start, stop))
+        m = sum(connection.recv() for connection in self.connections)
+
+        gradient = self.arrays["gradients"].sum(axis=0)
+        self.arrays["parameters"] -= (self.model.optimizer.learning_rate / m) * gradient
+
+    def train(
+            self, X : np.ndarray, y : np.ndarray, epochs : int,
+            batch_size : int, verbose : bool = False) -> List[float]:
+        self._start(X, y)
+        try:
+            self.model.loss_history = []
+            for epoch in range(epochs):
+                self.arrays["permutation"][...] = np.random.permutation(X.shape[0])
+                for i in range(0, X.shape[0], batch_size):
+                    self._step(i, min(i + batch_size, X.shape[0]))
+
+                loss = self.model.mse_loss(self.model.forward(X), y)
+                self.model.loss_history.append(loss)
+                if verbose and epoch % 10 == 0:
+                    print(f'Epoch {epoch+1}, Loss: {loss}')
+        finally:
+            self._stop()
+
+        return self.model.loss_history
@@ -0,0 +1,114 @@
+import hashlib
+import sqlite3
+import threading
+from collections import OrderedDict
+from typing import Callable, List, Optional
+
+# ----------------------------------------------------------------------
+
+CAPACITY = 100_000 # rows kept in memory
+
+def row_key(address : str, model_version : int, row : List[int]) -> bytes:
+    '''
+    Content address of a wfloat-encoded input row for a given deployed model.
+    '''
+    digest = hashlib.blake2b(digest_size=32)
+    digest.update(f"{int(address, 16):x}:{model_version}:".encode())
+    digest.update(",".join(map(str, row)).encode())
+    return digest.digest()
+
+class PredictionCache:
+    '''
+    LRU cache of predict outputs (felt252 rows) keyed by row_key,
+    optionally backed by a sqlite file that survives restarts.
+    '''
+    def __init__(self, capacity : int = CAPACITY, path : Optional[str] = None) -> None:
+        self.capacity = capacity
+        self.entries : OrderedDict = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+        self.db = None
+        if path is not None :
+            self.db = sqlite3.connect(path, check_same_thread=False)
+            self.db.execute(
+                "CREATE TABLE IF NOT EXISTS predictions (key BLOB PRIMARY KEY, output TEXT)"
+            )
+            self.db.commit()
+
+    def get(self, key : bytes) -> Optional[List[int]]:
+        with self.lock :
+            if key in self.entries :
+                self.entries.move_to_end(key)
+                return self.entries[key]
+            if self.db is None :
+                return None
+            row = self.db.execute(
+                "SELECT output FROM predictions WHERE key = ?", (key,)
+            ).fetchone()
+        if row is None :
+            return None
+        output = [int(x) for x in row[0].split(",")] if row[0] else []
+        self._remember(key, output)
+        return output
+
+    def put(self, key : bytes, output : List[int]) -> None:
+        self._remember(key, output)
+        if self.db is not None :
+            with self.lock :
+                self.db.execute(
+                    "INSERT OR REPLACE INTO predictions VALUES (?, ?)",
+                    (key, ",".join(map(str, output)))
+                )
+                self.db.commit()
+
+    def _remember(self, key : bytes, output : List[int]) -> None:
+        with self.lock :
+            self.entries[key] = output
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.capacity :
+                self.entries.popitem(last=False)
+
+    def predict(
+            self, address : str, model_version : int, rows : List[List[int]],
+            submit : Callable[[List[List[int]]], List[List[int]]],
+            for_storage : bool = False) -> List[List[int]]:
+        '''
+        Answer cached rows locally, send the misses (deduplicated) in one
+        ``submit`` call and cache what it returns.
+
+        With ``for_storage`` the contract has to store the prediction :
+        every row is sent, the outputs are only cached.
+        '''
+        keys = [row_key(address, model_version, row) for row in rows]
+        if for_storage :
+            outputs = submit(rows)
+            for key, output in zip(keys, outputs) :
+                self.put(key, output)
+            self.misses += len(rows)
+            return outputs
+
+        outputs = [self.get(key) for key in keys]
+
+        missing = OrderedDict()
+        for index, (key, output) in enumerate(zip(keys, outputs)) :
+            if output is None :
+                missing.setdefault(key, index)
+
+        self.hits += len(rows) - sum(output is None for output in outputs)
+        self.misses += len(missing)
+
+        if len(missing) > 0 :
+            computed = submit([rows[index] for index in missing.values()])
+            for key, output in zip(missing, computed) :
+                self.put(key, output)
+            computed = dict(zip(missing, computed))
+            outputs = [computed[key] if output is None else output for key, output in zip(keys, outputs)]
+
+        return outputs
+
+    def close(self) -> None:
+        if self.db is not None :
+            self.db.close()
+            self.db = None
@@ -0,0 +1,326 @@
+import argparse
+import asyncio
+import json
+import signal
+import sys
+import threading
+import time
+from collections import deque
+from typing import Awaitable, Callable, List, Optional
+
+import numpy as np
+
+from common import globalState
+from basic_conversions import wfloat_array, wfloat_array_to_float
+from prediction_cache import row_key
+
+# ----------------------------------------------------------------------
+# Headless batch scheduler : rows -> bounded queue -> batches (by size or
+# time window) -> one predict per batch, one in flight per account.
+
+MAX_BATCH_ROWS = 16
+MAX_WAIT = 2.0 # seconds before an incomplete batch is sent
+QUEUE_SIZE = 1024 # rows, producers wait above it
+LATENCY_WINDOW = 1000 # batches kept for the percentiles
+METRICS_INTERVAL = 10.0 # seconds
+
+class SchedulerMetrics:
+    def __init__(self) -> None:
+        self.start = time.perf_counter()
+        self.rows_in = 0
+        self.rows_done = 0
+        self.rows_failed = 0
+        self.batches = 0
+        self.latencies = deque(maxlen=LATENCY_WINDOW)
+
+    def snapshot(self, queue_depth : int, in_flight : int) -> dict:
+        elapsed = time.perf_counter() - self.start
+        latencies = np.array(self.latencies, dtype=float)
+        # null in the json lines until a batch is done (json.dumps would write NaN)
+        percentiles = [float(x) for x in np.percentile(latencies, (50, 90, 99))] if len(latencies) > 0 \
+            else [None] * 3
+        return {
+            "elapsed" : round(elapsed, 3),
+            "rows_in" : self.rows_in,
+            "rows_done" : self.rows_done,
+            "rows_failed" : self.rows_failed,
+            "batches" : self.batches,
+            "rows_per_s" : self.rows_done / elapsed if elapsed > 0 else 0.0,
+            "queue_depth" : queue_depth,
+            "in_flight" : in_flight,
+            "latency_p50" : percentiles[0],
+            "latency_p90" : percentiles[1],
+            "latency_p99" : percentiles[2],
+        }
+
+class BatchScheduler:
+    '''
+    Long running batcher, to be run on globalState.loop.
+
+    ``submit_batch(worker, rows)`` is awaited by one of ``workers``
+    (eg. an account) at a time, ``sink(rows, outputs)`` stores the results.
+    When ``queue_size`` rows are pending, ``put`` waits (backpressure).
+    '''
+    def __init__(
+            self, submit_batch : Callable[[object, List[list]], Awaitable[List[list]]],
+            workers : list, sink : Callable[[List[list], List[list]], None],
+            max_batch_rows : int = MAX_BATCH_ROWS, max_wait : float = MAX_WAIT,
+            queue_size : int = QUEUE_SIZE) -> None:
+        if len(workers) == 0 :
+            raise ValueError("no worker to submit with")
+        self.submit_batch = submit_batch
+        self.workers = workers
+        self.sink = sink
+        self.max_batch_rows = max_batch_rows
+        self.max_wait = max_wait
+
+        self.rows : asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+        # at most one ready batch per worker waits behind the running ones
+        self.batches : asyncio.Queue = asyncio.Queue(maxsize=len(workers))
+        self.metrics = SchedulerMetrics()
+        self.in_flight = 0
+        self.blocked_puts = 0 # producers waiting for room in ``rows``
+        self.closed = False
+        self.ended = False
+
+    async def put(self, row : list) -> None:
+        if self.closed :
+            raise RuntimeError("scheduler is closed")
+        self.blocked_puts += 1
+        try :
+            await self.rows.put(row)
+        finally :
+            self.blocked_puts -= 1
+        self.metrics.rows_in += 1
+
+    def close(self) -> None:
+        '''
+        Stop accepting rows, pending ones are still submitted.
+        '''
+        if not self.closed :
+            self.closed = True
+            # end marker, behind the rows already queued
+            asyncio.ensure_future(self.rows.put(None))
+
+    def snapshot(self) -> dict:
+        return self.metrics.snapshot(self.rows.qsize(), self.in_flight)
+
+    async def _next_batch(self) -> List[list]:
+        batch = []
+        deadline = None
+        while len(batch) < self.max_batch_rows :
+            if deadline is None :
+                row = await self.rows.get()
+            else :
+                timeout = deadline - time.monotonic()
+                if timeout <= 0 :
+                    break
+                try :
+                    row = await asyncio.wait_for(self.rows.get(), timeout)
+                except asyncio.TimeoutError :
+                    break
+            if row is None :
+                self.ended = True
+                break
+            batch.append(row)
+            deadline = time.monotonic() + self.max_wait if deadline is None else deadline
+        return batch
+
+    async def _batcher(self) -> None:
+        while not self.ended :
+            batch = await self._next_batch()
+            if len(batch) > 0 :
+                await self.batches.put(batch)
+
+        # rows of producers that were blocked on a full queue when closed,
+        # each get makes room for one of them
+        remaining = []
+        while self.blocked_puts > 0 or not self.rows.empty() :
+            row = await self.rows.get()
+            if row is not None :
+                remaining.append(row)
+        for i in range(0, len(remaining), self.max_batch_rows) :
+            await self.batches.put(remaining[i:i + self.max_batch_rows])
+
+        for _ in self.workers :
+            await self.batches.put(None)
+
+    async def _worker(self, worker) -> None:
+        while True :
+            batch = await self.batches.get()
+            if batch is None :
+                return
+            self.in_flight += 1
+            start = time.perf_counter()
+            try :
+                outputs = await self.submit_batch(worker, batch)
+            except Exception as error :
+                print(f"[scheduler] batch of {len(batch)} rows failed : {error}", file=sys.stderr)
+                self.metrics.rows_failed += len(batch)
+            else :
+                self.metrics.latencies.append(time.perf_counter() - start)
+                self.metrics.batches += 1
+                try :
+                    self.sink(batch, outputs)
+                except Exception as error :
+                    print(f"[scheduler] results of {len(batch)} rows not stored : {error}", file=sys.stderr)
+                    self.metrics.rows_failed += len(batch)
+                else :
+                    self.metrics.rows_done += len(batch)
+            finally :
+                self.in_flight -= 1
+
+    async def run(self) -> dict:
+        '''
+        Process rows until ``close`` and every pending batch is done.
+        '''
+        await asyncio.gather(self._batcher(), *[self._worker(x) for x in self.workers])
+        return self.snapshot()
+
+# ----------------------------------------------------------------------
+# Contract predict with the prediction cache
+
+def cached_predict_batch(address : Optional[str] = None, for_storage : bool = False) -> Callable:
+    '''
+    Predict through globalState.prediction_cache (PredictionCache.predict), its
+    blocking sqlite reads and writes run in the default executor.
+    '''
+    from contract import get_contract_async, invoke_predict_rows
+
+    address = globalState.DEPLOYED_ADDRESS if address is None else address
+    cache = globalState.prediction_cache
+
+    async def submit_batch(account, rows : List[list]) -> List[list]:
+        loop = asyncio.get_running_loop()
+        contract = await get_contract_async(account, address)
+
+        def submit(missing : List[list]) -> List[list]:
+            # from the executor thread, back on the loop
+            return asyncio.run_coroutine_threadsafe(
+                invoke_predict_rows(contract, missing, for_storage), loop
+            ).result()
+
+        return await loop.run_in_executor(
+            None, cache.predict, address, globalState.MODEL_VERSION, rows, submit, for_storage
+        )
+
+    return submit_batch
+
+def json_lines_sink(file) -> Callable:
+    def sink(rows : List[list], outputs : List[list]) -> None:
+        for row, output in zip(wfloat_array_to_float(rows).tolist(), wfloat_array_to_float(outputs).tolist()) :
+            file.write(json.dumps({"input" : row, "output" : output}) + "\n")
+        file.flush()
+    return sink
+
+# ----------------------------------------------------------------------
+# Row sources
+
+def ingest_lines(scheduler : BatchScheduler, file, loop : asyncio.AbstractEventLoop) -> threading.Thread:
+    '''
+    Read one row per line (a json list or comma separated floats) in a
+    daemon thread, which blocks while the scheduler queue is full.
+    '''
+    def read() -> None:
+        for line in file :
+            line = line.strip()
+            if not line :
+                continue
+            if scheduler.closed :
+                return
+            values = json.loads(line) if line.startswith("[") else [float(x) for x in line.split(",")]
+            try :
+                asyncio.run_coroutine_threadsafe(scheduler.put(wfloat_array(values).tolist()), loop).result()
+            except RuntimeError :
+                # closed while this row was read
+                return
+        loop.call_soon_threadsafe(scheduler.close)
+
+    thread = threading.Thread(target=read, daemon=True)
+    thread.start()
+    return thread
+
+async def ingest_samples(scheduler : BatchScheduler, n_rows : int) -> None:
+    '''
+    ``n_rows`` rows drawn from the training set (simulation_data.sample).
+    '''
+    from simulation_data import sample
+    produced = 0
+    while produced < n_rows and not scheduler.closed :
+        X, _ = sample()
+        for row in wfloat_array(X[:n_rows - produced]).tolist() :
+            if scheduler.closed :
+                break
+            await scheduler.put(row)
+        produced += len(X)
+    scheduler.close()
+
+async def report_metrics(scheduler : BatchScheduler, file, interval : float) -> None:
+    while True :
+        await asyncio.sleep(interval)
+        file.write(json.dumps(scheduler.snapshot()) + "\n")
+        file.flush()
+
+async def serve(scheduler : BatchScheduler, source : Optional[Awaitable], metrics_file, metrics_interval : float) -> dict:
+    ingest = None if source is None else asyncio.ensure_future(source)
+    reporter = asyncio.ensure_future(report_metrics(scheduler, metrics_file, metrics_interval))
+    try :
+        return await scheduler.run()
+    finally :
+        reporter.cancel()
+        if ingest is not None :
+            ingest.cancel()
+
+# ----------------------------------------------------------------------
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Headless batch predictions")
+    parser.add_argument("--input", default="-", help="rows file, one row per line (default: stdin)")
+    parser.add_argument("--simulate", type=int, default=None, help="use N rows of the dataset instead of --input")
+    parser.add_argument("--output", default="-", help="json lines results (default: stdout)")
+    parser.add_argument("--batch-rows", type=int, default=MAX_BATCH_ROWS)
+    parser.add_argument("--max-wait", type=float, default=MAX_WAIT)
+    parser.add_argument("--queue-size", type=int, default=QUEUE_SIZE)
+    parser.add_argument("--metrics-interval", type=float, default=METRICS_INTERVAL)
+    parser.add_argument("--for-storage", action="store_true", help="store the predictions on-chain (every row is sent)")
+    args = parser.parse_args()
+
+    from contract import retrieve_account_data
+    from submitter import loaded_accounts
+    retrieve_account_data()
+
+    output = sys.stdout if args.output == "-" else open(args.output, "a")
+    input_file = sys.stdin if args.input == "-" else open(args.input, "r")
+
+    async def create() -> BatchScheduler:
+        # the queues belong to globalState.loop
+        return BatchScheduler(
+            cached_predict_batch(for_storage=args.for_storage), loaded_accounts(), json_lines_sink(output),
+            args.batch_rows, args.max_wait, args.queue_size
+        )
+    scheduler = globalState.run(create())
+
+    if args.simulate is not None :
+        from simulation_data import import_data
+        import_data()
+        source = ingest_samples(scheduler, args.simulate)
+    else :
+        ingest_lines(scheduler, input_file, globalState.loop)
+        source = None
+
+    # first signal : drain and exit, second one : exit now
+    def stop(signum, frame) :
+        signal.signal(signal.SIGINT, signal.SIG_DFL)
+        signal.signal(signal.SIGTERM, signal.SIG_DFL)
+        globalState.loop.call_soon_threadsafe(scheduler.close)
+    signal.signal(signal.SIGINT, stop)
+    signal.signal(signal.SIGTERM, stop)
+
+    try :
+        final = globalState.run(serve(scheduler, source, sys.stderr, args.metrics_interval))
+        print(json.dumps(final), file=sys.stderr)
+    finally :
+        globalState.close()
+
+if __name__ == "__main__":
+    main()
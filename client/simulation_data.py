@@ -1,46 +1,290 @@
 import os
+import sys
 import json
+import hashlib
 import numpy as np
-import pandas as pd
-
-from sklearn.model_selection import train_test_split
-from sklearn.preprocessing import OneHotEncoder, LabelEncoder, StandardScaler
-from keras.utils import to_categorical
-
-import matplotlib.pyplot as plt
 
 from common import globalState
 
 SAMPLE_SIZE = 5
 DATASET_PATH = os.path.join("..", "data", "star_classification.csv")
 
-def import_data():
-    df = pd.read_csv(DATASET_PATH)
+LABEL_COLUMN = "class"
+CHUNK_SIZE = 100_000 # rows per pd.read_csv chunk
+TEST_SIZE = 0.2
+SPLIT_SEED = 42
+
+# ----------------------------------------------------------------------
+# Streaming ingest : the csv is read chunk by chunk (twice), only the
+# float32 features and int8 labels of the final split are kept in memory.
+
+def read_chunks(path : str = DATASET_PATH, chunksize : int = CHUNK_SIZE):
+    '''
+    Yield (features as float32, class names) for each chunk of the csv.
+    '''
+    # pandas is only needed when the csv is (re)parsed, not on a cache hit
+    import pandas as pd
+
+    columns = pd.read_csv(path, nrows=0).columns
+    dtype = {column : np.float32 for column in columns if column != LABEL_COLUMN}
+    dtype[LABEL_COLUMN] = str
+    for chunk in pd.read_csv(path, dtype=dtype, chunksize=chunksize):
+        labels = chunk.pop(LABEL_COLUMN).to_numpy()
+        yield chunk.to_numpy(dtype=np.float32), labels
+
+class RunningScaler:
+    '''
+    StandardScaler fitted chunk by chunk (running mean / variance, Chan et al. merge).
+    '''
+    def __init__(self) -> None:
+        self.count = 0
+        self.mean = None
+        self.m2 = None
+
+    def partial_fit(self, X : np.ndarray) -> 'RunningScaler':
+        X = np.asarray(X, dtype=np.float64)
+        count = len(X)
+        if count == 0 :
+            return self
+        mean = X.mean(axis=0)
+        m2 = ((X - mean) ** 2).sum(axis=0)
+
+        if self.count == 0 :
+            self.count, self.mean, self.m2 = count, mean, m2
+            return self
+
+        total = self.count + count
+        delta = mean - self.mean
+        self.mean = self.mean + delta * (count / total)
+        self.m2 = self.m2 + m2 + delta ** 2 * (self.count * count / total)
+        self.count = total
+        return self
+
+    @property
+    def scale(self) -> np.ndarray:
+        # population variance, constant columns are left as is (like sklearn)
+        scale = np.sqrt(self.m2 / self.count)
+        scale[scale == 0] = 1.0
+        return scale
+
+    def transform(self, X : np.ndarray, out : np.ndarray = None) -> np.ndarray:
+        '''
+        Standardize ``X`` into ``out`` (defaults to a new array of the dtype of ``X``).
+        '''
+        out = np.empty_like(X) if out is None else out
+        np.subtract(X, self.mean.astype(out.dtype), out=out)
+        np.divide(out, self.scale.astype(out.dtype), out=out)
+        return out
+
+def one_hot(labels : np.ndarray, n_classes : int, dtype=np.float32) -> np.ndarray:
+    result = np.zeros((len(labels), n_classes), dtype=dtype)
+    result[np.arange(len(labels)), labels] = 1
+    return result
+
+def split_mask(n_rows : int, test_size : float = TEST_SIZE, seed : int = SPLIT_SEED) -> np.ndarray:
+    '''
+    Boolean mask of the test rows.
+    '''
+    is_test = np.zeros(n_rows, dtype=bool)
+    n_test = int(np.ceil(n_rows * test_size))
+    is_test[np.random.default_rng(seed).choice(n_rows, n_test, replace=False)] = True
+    return is_test
+
+def preprocess(path : str = DATASET_PATH, chunksize : int = CHUNK_SIZE, test_size : float = TEST_SIZE, seed : int = SPLIT_SEED) -> dict:
+    '''
+    Standardized split of the csv, as a dict of arrays (see CACHED_ARRAYS).
+    '''
+    # first pass : scaler, classes, number of rows
+    scaler = RunningScaler()
+    classes = set()
+    n_features = None
+    for X, labels in read_chunks(path, chunksize):
+        scaler.partial_fit(X)
+        classes.update(np.unique(labels).tolist())
+        n_features = X.shape[1]
+    classes = np.array(sorted(classes))
+    n_rows = scaler.count
+
+    # second pass : standardize straight into the preallocated split
+    is_test = split_mask(n_rows, test_size, seed)
+    n_test = int(is_test.sum())
+    train_X = np.empty((n_rows - n_test, n_features), dtype=np.float32)
+    test_X = np.empty((n_test, n_features), dtype=np.float32)
+    train_y = np.empty(n_rows - n_test, dtype=np.int8)
+    test_y = np.empty(n_test, dtype=np.int8)
+
+    start, train_position, test_position = 0, 0, 0
+    for X, labels in read_chunks(path, chunksize):
+        scaler.transform(X, out=X)
+        y = np.searchsorted(classes, labels).astype(np.int8)
+        chunk_is_test = is_test[start:start + len(X)]
+        start += len(X)
+
+        n_chunk_test = int(chunk_is_test.sum())
+        test_X[test_position:test_position + n_chunk_test] = X[chunk_is_test]
+        test_y[test_position:test_position + n_chunk_test] = y[chunk_is_test]
+        test_position += n_chunk_test
+
+        n_chunk_train = len(X) - n_chunk_test
+        train_X[train_position:train_position + n_chunk_train] = X[~chunk_is_test]
+        train_y[train_position:train_position + n_chunk_train] = y[~chunk_is_test]
+        train_position += n_chunk_train
+
+    return {
+        "classes" : classes,
+        "scaler_mean" : scaler.mean,
+        "scaler_m2" : scaler.m2,
+        "train_X" : train_X,
+        "train_y" : train_y,
+        "test_X" : test_X,
+        "test_y" : test_y,
+    }
 
-    X = df.drop(columns=["class"])
-    scaler = StandardScaler()
-    X_normalized = pd.DataFrame(scaler.fit_transform(X), columns=X.columns)
-    X_normalized = X_normalized.astype(float)
-    X = X_normalized.to_numpy()
+# ----------------------------------------------------------------------
+# On-disk cache : one .npy per array, memory mapped on reload.
+# Invalidated when the csv content or the preprocessing parameters change,
+# the csv is only re-hashed when its size / mtime changed. Without the csv,
+# the entry recorded in meta.json is used as is.
 
-    Y = df["class"]
-    Y = np.array(LabelEncoder().fit_transform(y=Y.values))
-    Y = np.array(OneHotEncoder().fit_transform(Y.reshape(-1, 1)).toarray()).astype(float)
+CACHE_DIR = os.path.join("data", "dataset_cache")
+CACHE_FORMAT = 1
+CACHED_ARRAYS = ["classes", "scaler_mean", "scaler_m2", "train_X", "train_y", "test_X", "test_y"]
 
-    train_X, test_X, train_Y, test_Y = train_test_split(X, Y, test_size=0.2, random_state=42)
+def file_digest(path : str, block_size : int = 1 << 20) -> str:
+    digest = hashlib.blake2b(digest_size=32)
+    with open(path, "rb") as file :
+        for block in iter(lambda : file.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
 
-    globalState.train_X = np.array(train_X)
-    globalState.train_Y = np.array(train_Y)
-    globalState.test_X = np.array(test_X)
-    globalState.test_Y = np.array(test_Y)
+def _source_stat(path : str) -> list:
+    stat = os.stat(path)
+    return [stat.st_size, stat.st_mtime_ns]
+
+def _read_meta(cache_dir : str) -> dict:
+    try :
+        with open(os.path.join(cache_dir, "meta.json"), "r") as file :
+            return json.load(file)
+    except (OSError, ValueError) :
+        return None
+
+def _write_meta(cache_dir : str, meta : dict) -> None:
+    temporary = os.path.join(cache_dir, "meta.json.tmp")
+    with open(temporary, "w") as file :
+        json.dump(meta, file)
+    os.replace(temporary, os.path.join(cache_dir, "meta.json"))
+
+def load_cached(path : str, params : dict, cache_dir : str = CACHE_DIR) -> dict:
+    '''
+    Memory mapped arrays of a valid cache entry, None otherwise.
+    '''
+    meta = _read_meta(cache_dir)
+    if meta is None or meta["format"] != CACHE_FORMAT or meta["params"] != params :
+        return None
+
+    if not os.path.exists(path) :
+        # the csv was moved away : the entry is trusted as recorded in meta.json
+        print(f"[dataset] {path} not found, using the cache of {meta['source_digest'][:12]} ({cache_dir})", file=sys.stderr)
+        return _load_arrays(cache_dir)
+
+    stat = _source_stat(path)
+    if meta["source_stat"] != stat :
+        if meta["source_digest"] != file_digest(path) :
+            return None
+        # touched but unchanged
+        meta["source_stat"] = stat
+        _write_meta(cache_dir, meta)
+
+    return _load_arrays(cache_dir)
+
+def _load_arrays(cache_dir : str) -> dict:
+    try :
+        return {
+            name : np.load(os.path.join(cache_dir, f"{name}.npy"), mmap_mode="r")
+            for name in CACHED_ARRAYS
+        }
+    except (OSError, ValueError) :
+        return None
+
+def store_cached(path : str, params : dict, arrays : dict, cache_dir : str = CACHE_DIR) -> None:
+    os.makedirs(cache_dir, exist_ok=True)
+    # meta.json is written last, a partial cache is never considered valid
+    if os.path.exists(os.path.join(cache_dir, "meta.json")) :
+        os.remove(os.path.join(cache_dir, "meta.json"))
+    for name in CACHED_ARRAYS :
+        np.save(os.path.join(cache_dir, f"{name}.npy"), arrays[name])
+    _write_meta(cache_dir, {
+        "format" : CACHE_FORMAT,
+        "params" : params,
+        "source_stat" : _source_stat(path),
+        "source_digest" : file_digest(path),
+    })
+
+# ----------------------------------------------------------------------
+
+def import_data(path : str = DATASET_PATH, chunksize : int = CHUNK_SIZE, cache_dir : str = CACHE_DIR):
+    params = {"test_size" : TEST_SIZE, "seed" : SPLIT_SEED}
+
+    arrays = None if cache_dir is None else load_cached(path, params, cache_dir)
+    if arrays is None :
+        arrays = preprocess(path, chunksize, **params)
+        if cache_dir is not None :
+            store_cached(path, params, arrays, cache_dir)
+
+    scaler = RunningScaler()
+    scaler.count = len(arrays["train_y"]) + len(arrays["test_y"])
+    scaler.mean = np.asarray(arrays["scaler_mean"])
+    scaler.m2 = np.asarray(arrays["scaler_m2"])
+
+    globalState.classes = np.asarray(arrays["classes"])
+    globalState.scaler = scaler
+    globalState.train_X = arrays["train_X"]
+    globalState.train_y = arrays["train_y"]
+    globalState.test_X = arrays["test_X"]
+    globalState.test_y = arrays["test_y"]
+
+# ----------------------------------------------------------------------
+
+# Generator.choice without replacement draws k indices in O(k) (no
+# permutation of the training set, unlike np.random.choice)
+_rng = np.random.default_rng()
 
 def sample() -> np.array:
-    indices = np.random.permutation(1000)
-    selected_indices = indices[:SAMPLE_SIZE]
+    selected_indices = _rng.choice(len(globalState.train_X), SAMPLE_SIZE, replace=False)
     X = globalState.train_X[selected_indices]
-    Y = globalState.train_Y[selected_indices]
+    Y = one_hot(globalState.train_y[selected_indices], len(globalState.classes))
 
     return X, Y
     # print(matrix_to_wfloat(sample))
     # print("--------------------")
-    # print(matrix_to_wfloat(model.forward(sample)))
\ No newline at end of file
+    # print(matrix_to_wfloat(model.forward(sample)))
+
+def reservoir_sample(path : str = DATASET_PATH, size : int = SAMPLE_SIZE, chunksize : int = CHUNK_SIZE, seed : int = None):
+    '''
+    Uniform sample of raw (features, class) rows straight from the csv,
+    without loading it (reservoir sampling, one chunk at a time).
+    '''
+    rng = np.random.default_rng(seed)
+    reservoir_X, reservoir_labels = None, None
+    seen = 0
+    for X, labels in read_chunks(path, chunksize):
+        if reservoir_X is None :
+            reservoir_X = np.empty((0, X.shape[1]), dtype=X.dtype)
+            reservoir_labels = np.empty(0, dtype=object)
+
+        # fill the reservoir first
+        n_fill = min(size - len(reservoir_X), len(X))
+        if n_fill > 0 :
+            reservoir_X = np.concatenate([reservoir_X, X[:n_fill]])
+            reservoir_labels = np.concatenate([reservoir_labels, labels[:n_fill]])
+
+        # row number t (1-based) replaces a random slot with probability size / t
+        t = seen + np.arange(n_fill, len(X)) + 1
+        slots = (rng.random(len(t)) * t).astype(np.int64)
+        kept = slots < size
+        for row, slot in zip(np.flatnonzero(kept) + n_fill, slots[kept]):
+            reservoir_X[slot] = X[row]
+            reservoir_labels[slot] = labels[row]
+        seen += len(X)
+
+    return reservoir_X, reservoir_labels
@@ -0,0 +1,206 @@
+import asyncio
+import sys
+import time
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from common import globalState
+from fees import observed_gas
+
+# ----------------------------------------------------------------------
+
+MAX_RETRIES = 3
+BACKOFF = 0.5 # seconds, doubled on each retry
+
+def loaded_accounts() -> list :
+    '''
+    Every account loaded by retrieve_account_data (validators then bot).
+    '''
+    accounts = list((globalState.validator_accounts or dict()).values())
+    if globalState.bot_account is not None :
+        accounts.append(globalState.bot_account)
+    return accounts
+
+# ----------------------------------------------------------------------
+
+class NonceManager:
+    '''
+    Local nonce per account, fetched once from the node then incremented,
+    so consecutive transactions do not wait for a get_nonce round trip.
+    '''
+    def __init__(self) -> None:
+        self.nonces : Dict[int, int] = dict()
+        self.locks : Dict[int, asyncio.Lock] = dict()
+
+    def _lock(self, account) -> asyncio.Lock:
+        return self.locks.setdefault(account.address, asyncio.Lock())
+
+    async def next(self, account) -> int:
+        async with self._lock(account) :
+            if account.address not in self.nonces :
+                self.nonces[account.address] = await account.get_nonce()
+            nonce = self.nonces[account.address]
+            self.nonces[account.address] += 1
+            return nonce
+
+    async def resync(self, account) -> None:
+        async with self._lock(account) :
+            self.nonces[account.address] = await account.get_nonce()
+
+class Submission:
+    def __init__(self, function_name : str, arguments : dict) -> None:
+        self.function_name = function_name
+        self.arguments = arguments
+
+        self.account = None
+        self.nonce = None
+        self.result = None
+        self.error = None
+        self.attempts = 0
+        self.latency = None
+
+class SubmissionReport:
+    def __init__(self, submissions : List[Submission], elapsed : float) -> None:
+        self.submissions = submissions
+        self.elapsed = elapsed
+
+        self.latencies = np.array([
+            x.latency for x in submissions if x.error is None
+        ], dtype=float)
+        self.n_succeeded = len(self.latencies)
+        self.n_failed = len(submissions) - self.n_succeeded
+
+    def throughput(self) -> float:
+        return self.n_succeeded / self.elapsed if self.elapsed > 0 else 0.0
+
+    def latency_percentiles(self, q = (50, 90, 99)) -> Dict[int, float]:
+        if len(self.latencies) == 0 :
+            return { x : float("nan") for x in q }
+        return dict(zip(q, np.percentile(self.latencies, q)))
+
+    def __str__(self) -> str:
+        percentiles = ", ".join(
+            f"p{q}={value*1e3:.0f}ms" for q, value in self.latency_percentiles().items()
+        )
+        return (
+            f"{self.n_succeeded} tx succeeded, {self.n_failed} failed in {self.elapsed:.2f}s\n"
+            f"throughput : {self.throughput():.2f} tx/s\n"
+            f"latency : {percentiles}"
+        )
+
+# ----------------------------------------------------------------------
+
+class Submitter:
+    '''
+    Fan out invocations over several accounts.
+
+    Transactions of one account are sent one after the other with
+    locally managed nonces (no wait for acceptance in between),
+    accounts submit concurrently.
+
+    Only a failed send is retried : once a transaction is sent, failures
+    to see it accepted or to read its fee are reported, never resent.
+    ``get_contract(account, address)`` resolves the contracts
+    (default : contract.get_contract_async).
+    '''
+    def __init__(
+            self, accounts : Optional[list] = None, address : Optional[str] = None,
+            resource_bounds = None,
+            max_retries : int = MAX_RETRIES, backoff : float = BACKOFF,
+            wait_for_acceptance : bool = False,
+            get_contract : Optional[Callable[[object, Optional[str]], Awaitable]] = None) -> None:
+        self.accounts = loaded_accounts() if accounts is None else accounts
+        if len(self.accounts) == 0 :
+            raise ValueError("no account to submit with")
+        if get_contract is None :
+            from contract import get_contract_async as get_contract
+        self.get_contract = get_contract
+
+        self.address = address
+        # None : estimated per submission by globalState.fee_estimator
+        self.resource_bounds = resource_bounds
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.wait_for_acceptance = wait_for_acceptance
+        self.nonces = NonceManager()
+
+    async def _invoke(self, account, submission : Submission) -> None:
+        contract = await self.get_contract(account, self.address)
+        function = contract.functions[submission.function_name]
+
+        input_shape = np.shape(submission.arguments.get("inputs", ()))
+        estimator = globalState.fee_estimator
+
+        while True :
+            submission.attempts += 1
+            submission.nonce = await self.nonces.next(account)
+            resource_bounds = self.resource_bounds if self.resource_bounds is not None \
+                else estimator.resource_bounds(submission.function_name, input_shape)
+            start = time.perf_counter()
+            try :
+                submission.result = await function.invoke_v3(
+                    **submission.arguments,
+                    l1_resource_bounds=resource_bounds,
+                    nonce=submission.nonce
+                )
+                submission.error = None
+                break
+            except Exception as error :
+                submission.error = error
+                if submission.attempts > self.max_retries :
+                    return
+                # the local nonce is no longer trusted after a rejection
+                await asyncio.sleep(self.backoff * 2 ** (submission.attempts - 1))
+                await self.nonces.resync(account)
+
+        if not self.wait_for_acceptance :
+            submission.latency = time.perf_counter() - start
+            return
+
+        # sent : from here on the transaction is never sent again
+        try :
+            await submission.result.wait_for_acceptance()
+        except Exception as error :
+            submission.error = error
+            return
+        submission.latency = time.perf_counter() - start
+
+        try :
+            gas_used = await observed_gas(account.client, submission.result.hash)
+        except Exception as error :
+            print(f"[submitter] fee of {submission.result.hash:#x} not observed : {error}", file=sys.stderr)
+        else :
+            estimator.observe(submission.function_name, input_shape, gas_used)
+
+    async def _account_worker(self, account, submissions : List[Submission]) -> None:
+        for submission in submissions :
+            submission.account = account
+            await self._invoke(account, submission)
+
+    async def submit_async(self, submissions : List[Submission]) -> SubmissionReport:
+        shards = [submissions[i::len(self.accounts)] for i in range(len(self.accounts))]
+
+        start = time.perf_counter()
+        await asyncio.gather(*[
+            self._account_worker(account, shard)
+            for account, shard in zip(self.accounts, shards) if len(shard) > 0
+        ])
+        return SubmissionReport(submissions, time.perf_counter() - start)
+
+    def submit(self, submissions : List[Submission]) -> SubmissionReport:
+        return globalState.run(self.submit_async(submissions))
+
+# ----------------------------------------------------------------------
+
+def predict_submissions(inputs_as_felt : list, rows_per_tx : int = 1, for_storage : bool = True) -> List[Submission]:
+    return [
+        Submission("predict", dict(inputs=inputs_as_felt[i:i + rows_per_tx], for_storage=for_storage))
+        for i in range(0, len(inputs_as_felt), rows_per_tx)
+    ]
+
+def evaluate_submissions(evaluations : List[Tuple[int, Optional[list]]]) -> List[Submission]:
+    return [
+        Submission("evaluate_stored_prediction", dict(which=which, evaluation=evaluation))
+        for which, evaluation in evaluations
+    ]
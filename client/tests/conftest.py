@@ -0,0 +1,8 @@
+import os
+import sys
+
+# the client modules import each other by name and read data/ relative
+# to the working directory (see common.GlobalState), as with ``python3 main.py``
+CLIENT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, CLIENT_DIR)
+os.chdir(CLIENT_DIR)
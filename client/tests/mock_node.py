@@ -0,0 +1,122 @@
+import asyncio
+import itertools
+from types import SimpleNamespace
+from typing import Dict, List
+
+# ----------------------------------------------------------------------
+# In-process stand-in for a Starknet node : the subset of the starknet_py
+# Account / Contract / FullNodeClient interface used by the client.
+
+class NodeError(Exception):
+    pass
+
+class MockNode:
+    '''
+    Accounts nonces, sent transactions, receipts, and failures to inject :
+    ``fail_sends`` / ``fail_acceptances`` / ``fail_receipts`` make the next
+    n calls raise (the failing send does not reach the node).
+    '''
+    def __init__(self, gas_used : int = 40_000, gas_price : int = 10) -> None:
+        self.gas_used = gas_used
+        self.gas_price = gas_price
+
+        self.nonces : Dict[int, int] = dict()
+        self.sent : List[tuple] = [] # (account address, function name, nonce, arguments)
+        self.get_nonce_calls = 0
+        self.resolved_contracts = 0
+        self.hashes = itertools.count(1)
+        self.results : Dict[int, list] = dict() # transaction hash -> returned felts
+
+        self.fail_sends = 0
+        self.fail_acceptances = 0
+        self.fail_receipts = 0
+
+    def account(self, address : int, nonce : int = 0) -> 'MockAccount':
+        self.nonces[address] = nonce
+        return MockAccount(self, address)
+
+    async def get_contract(self, account, address = None) -> 'MockContract':
+        self.resolved_contracts += 1
+        return MockContract(self, account)
+
+    def sent_by(self, address : int) -> List[tuple]:
+        return [x for x in self.sent if x[0] == address]
+
+    # FullNodeClient
+    async def get_transaction_receipt(self, transaction_hash : int):
+        await asyncio.sleep(0)
+        if self.fail_receipts > 0 :
+            self.fail_receipts -= 1
+            raise NodeError("receipt unavailable")
+        return SimpleNamespace(block_number=1, actual_fee=SimpleNamespace(amount=self.gas_used * self.gas_price))
+
+    async def get_block(self, block_number : int):
+        return SimpleNamespace(l1_gas_price=SimpleNamespace(price_in_fri=self.gas_price))
+
+    async def trace_transaction(self, transaction_hash : int):
+        # __execute__ of the account -> called function
+        call = SimpleNamespace(result=self.results[transaction_hash])
+        return SimpleNamespace(execute_invocation=SimpleNamespace(calls=[call]))
+
+    def execute(self, function_name : str, arguments : dict) -> list:
+        '''
+        Serialized return value : predict echoes its inputs (Span<Span<felt252>>).
+        '''
+        if function_name != "predict" :
+            return []
+        felts = [len(arguments["inputs"])]
+        for row in arguments["inputs"] :
+            felts += [len(row), *row]
+        return felts
+
+class MockAccount:
+    def __init__(self, node : MockNode, address : int) -> None:
+        self.node = node
+        self.client = node
+        self.address = address
+
+    async def get_nonce(self) -> int:
+        self.node.get_nonce_calls += 1
+        await asyncio.sleep(0)
+        return self.node.nonces[self.address]
+
+class MockInvokeResult:
+    def __init__(self, node : MockNode, transaction_hash : int) -> None:
+        self.node = node
+        self.hash = transaction_hash
+
+    async def wait_for_acceptance(self) -> None:
+        await asyncio.sleep(0)
+        if self.node.fail_acceptances > 0 :
+            self.node.fail_acceptances -= 1
+            raise NodeError("acceptance polling failed")
+
+class MockFunction:
+    def __init__(self, node : MockNode, account : MockAccount, name : str) -> None:
+        self.node = node
+        self.account = account
+        self.name = name
+
+    async def invoke_v3(self, l1_resource_bounds = None, nonce : int = None, **arguments) -> MockInvokeResult:
+        await asyncio.sleep(0)
+        node = self.node
+        if node.fail_sends > 0 :
+            node.fail_sends -= 1
+            raise NodeError("connection reset")
+        expected = node.nonces[self.account.address]
+        # None : filled by the account
+        nonce = expected if nonce is None else nonce
+        if nonce != expected :
+            raise NodeError(f"invalid transaction nonce {nonce}, expected {expected}")
+        node.nonces[self.account.address] += 1
+        node.sent.append((self.account.address, self.name, nonce, arguments))
+        result = MockInvokeResult(node, next(node.hashes))
+        node.results[result.hash] = node.execute(self.name, arguments)
+        return result
+
+class MockContract:
+    def __init__(self, node : MockNode, account : MockAccount) -> None:
+        self.functions = {
+            name : MockFunction(node, account, name)
+            for name in ("predict", "evaluate_stored_prediction")
+        }
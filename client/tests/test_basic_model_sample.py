@@ -0,0 +1,21 @@
+import numpy as np
+
+from basic_model_sample import DenseLayer, SGD, Sequential
+
+def model() -> Sequential:
+    np.random.seed(0)
+    layers = [DenseLayer(input_shape=4, output_shape=5, activation="ReLU"), DenseLayer(output_shape=2, activation="ReLU")]
+    result = Sequential(layers, SGD(learning_rate=0.01))
+    result.build()
+    return result
+
+def test_fused_float32_training_keeps_float64_weights():
+    X, Y = np.random.randn(256, 4), np.abs(np.random.randn(256, 2))
+    trained = model()
+    trained.train_fused(X, Y, epochs=2, batch_size=32, dtype=np.float32)
+
+    for layer in trained.layers :
+        assert layer.W.dtype == layer.b.dtype == np.float64
+        assert layer.ws_W.dtype == np.float32
+        # the float32 copy follows the updated masters
+        np.testing.assert_array_equal(layer.ws_W, layer.W.astype(np.float32))
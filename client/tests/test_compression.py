@@ -0,0 +1,38 @@
+import numpy as np
+
+from basic_model_sample import DenseLayer, SGD, Sequential, build_model
+from compression import compress, nonzero_weights, size_report
+
+def model() -> Sequential:
+    np.random.seed(0)
+    layers = [DenseLayer(input_shape=6, output_shape=8, activation="ReLU"), DenseLayer(output_shape=3, activation="ReLU")]
+    result = Sequential(layers, SGD(learning_rate=0.01))
+    result.build()
+    return result
+
+def test_weights_truncated_to_zero_are_not_counted():
+    sparse = model()
+    # below the wfloat resolution : stored as 0 by serialize_sparse_felts
+    sparse.layers[0].W[0, :] = 4e-7
+
+    felts = sparse.layers[0].serialize_sparse_felts()
+    assert nonzero_weights(sparse.layers[0]) == felts[2] == sparse.layers[0].W.size - 8
+    assert size_report(sparse)["sparse_calldata_felts"] == len(sparse.serialize_sparse_felts())
+
+def test_compress_leaves_the_trained_model_untouched():
+    trained = model()
+    weights = [layer.W.copy() for layer in trained.layers]
+
+    compressed = compress(trained, sparsity=0.5, ranks={0 : 1})
+
+    assert len(compressed.layers) == 3
+    assert size_report(compressed)["nonzero_weights"] < size_report(trained)["nonzero_weights"]
+    for layer, W in zip(trained.layers, weights) :
+        np.testing.assert_array_equal(layer.W, W)
+
+def test_build_model_prunes_after_training(capsys):
+    X, Y = np.random.randn(200, 6), np.abs(np.random.randn(200, 3))
+    pruned = build_model(X, Y, sparsity=0.5)
+
+    assert all(np.count_nonzero(layer.W) <= layer.W.size - int(0.5 * layer.W.size) for layer in pruned.layers)
+    assert "sparse_storage_slots" in capsys.readouterr().out
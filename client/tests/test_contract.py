@@ -0,0 +1,43 @@
+import asyncio
+import subprocess
+import sys
+
+import pytest
+
+from conftest import CLIENT_DIR
+from mock_node import MockNode
+
+pytest.importorskip("starknet_py")
+
+import contract
+from common import globalState
+
+def test_headless_import_does_not_load_eel():
+    # fresh interpreter : the modules loaded by ``main.py --headless predict / call``
+    code = "import sys, main, contract; assert 'eel' not in sys.modules, 'eel loaded'"
+    subprocess.run([sys.executable, "-c", code], cwd=CLIENT_DIR, check=True)
+
+def test_contracts_are_resolved_once_on_the_shared_loop(monkeypatch):
+    node = MockNode()
+    loops = []
+
+    async def from_address(provider, address):
+        loops.append(asyncio.get_running_loop())
+        return await node.get_contract(provider, address)
+
+    monkeypatch.setattr(contract.Contract, "from_address", from_address)
+    monkeypatch.setattr(globalState, "contracts", dict())
+    accounts = [node.account(0xa), node.account(0xb)]
+
+    resolved = [contract.get_contract(account, "0x1") for _ in range(3) for account in accounts]
+    session = globalState.session
+
+    # first call per (account, address) pays the resolution, later ones reuse it
+    assert node.resolved_contracts == 2
+    assert resolved[0] is resolved[2] is resolved[4]
+    assert resolved[1] is resolved[3] is resolved[5]
+    assert resolved[0] is not resolved[1]
+    # one loop and one http session for every call
+    assert loops == [globalState.loop] * 2
+    assert contract.get_contract(accounts[0], "0x01") is resolved[0]
+    assert globalState.session is session
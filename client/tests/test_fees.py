@@ -0,0 +1,72 @@
+import asyncio
+
+import numpy as np
+import pytest
+
+from basic_conversions import wfloat_array
+from common import globalState
+from fees import DEFAULT_GAS, FeeEstimator
+from mock_node import MockNode
+from wfloat_model import RELU, WFloatSequential
+
+MODEL = WFloatSequential.random(4, [(8, RELU), (3, RELU)])
+
+def estimator() -> FeeEstimator:
+    result = FeeEstimator()
+    result.set_model(MODEL)
+    return result
+
+def test_default_gas_without_model():
+    assert FeeEstimator().gas("predict", (4, 4)) == DEFAULT_GAS
+
+def test_estimate_grows_with_the_input_shape():
+    fees = estimator()
+    assert fees.layer_dims == [(4, 8), (8, 3)]
+
+    one_row, ten_rows = fees.gas("predict", (1, 4)), fees.gas("predict", (10, 4))
+    assert DEFAULT_GAS != one_row < ten_rows
+    assert fees.gas("predict", (1, 4)) < fees.gas("predict", (1, 8)) # calldata
+    assert fees.resource_bounds("predict", (10, 4)).max_amount > fees.resource_bounds("predict", (1, 4)).max_amount
+
+def test_estimate_converges_to_observed_gas():
+    fees = estimator()
+    shape = (5, 4)
+    gas_used = 0.6 * fees.gas("predict", shape)
+
+    for _ in range(50) :
+        fees.observe("predict", shape, gas_used)
+    assert abs(fees.gas("predict", shape) - gas_used) < 1e-3 * gas_used
+
+    # never below an observation
+    fees.observe("predict", shape, 2 * gas_used)
+    assert fees.gas("predict", shape) == 2 * gas_used
+
+def test_observations_correct_new_shapes():
+    fees, reference = estimator(), estimator()
+    for _ in range(50) :
+        fees.observe("predict", (5, 4), 0.5 * reference.gas("predict", (5, 4)))
+
+    ratio = fees.gas("predict", (20, 4)) / reference.gas("predict", (20, 4))
+    assert abs(ratio - 0.5) < 1e-3
+
+def test_global_estimator_uses_the_deployed_layers():
+    assert globalState.deployed_model is not None
+    assert globalState.fee_estimator.layer_dims == [
+        (layer.input_shape, layer.output_shape) for layer in globalState.deployed_model.layers
+    ]
+
+def test_onchain_predict_refines_the_estimate(monkeypatch):
+    contract = pytest.importorskip("contract")
+
+    node = MockNode(gas_used=123_456)
+    fees = estimator()
+    monkeypatch.setattr(globalState, "_client", node)
+    monkeypatch.setattr(globalState, "_fee_estimator", fees)
+    rows = wfloat_array(np.ones((2, 4))).tolist()
+
+    handle = asyncio.run(node.get_contract(node.account(0xa)))
+
+    outputs = asyncio.run(contract.invoke_predict_rows(handle, rows))
+
+    assert outputs == rows
+    assert fees.gas("predict", (2, 4)) == 123_456
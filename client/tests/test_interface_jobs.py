@@ -0,0 +1,70 @@
+import numpy as np
+import pytest
+
+pytest.importorskip("starknet_py")
+
+import contract
+import interface_jobs
+from common import globalState
+from jobs import DONE, JobPool
+from prediction_cache import PredictionCache
+
+X = np.array([[0.5, -1.0], [2.0, 0.25]])
+
+@pytest.fixture
+def sent(monkeypatch):
+    sent = []
+
+    async def get_contract_async(account, address = None) :
+        return None
+
+    async def invoke_predict_rows(handle, rows, for_storage) :
+        sent.append((rows, for_storage))
+        return [[sum(row)] for row in rows]
+
+    monkeypatch.setattr(contract, "get_contract_async", get_contract_async)
+    monkeypatch.setattr(contract, "invoke_predict_rows", invoke_predict_rows)
+    monkeypatch.setattr(globalState, "_prediction_cache", PredictionCache())
+    return sent
+
+def run(pool : JobPool, function) -> list:
+    job = pool.submit("job", function)
+    job.future.result(timeout=5)
+    assert job.status == DONE
+    return pool.drain()
+
+def test_fetch_shows_the_fixed_point_and_float_outputs(monkeypatch):
+    if globalState.deployed_model is None :
+        pytest.skip(f"no {globalState.MODEL_PATH}")
+    monkeypatch.setattr(interface_jobs, "sample", lambda : (np.ones((2, 17)), np.zeros((2, 3))))
+    monkeypatch.setattr(globalState, "current_sample", None)
+    pool = JobPool()
+    messages = run(pool, interface_jobs.fetch_job)
+    pool.shutdown()
+
+    visual = [text for name, text in messages if name == "setSimulationConsole"]
+    assert len(visual) == 1 and "fixed point | float" in visual[0]
+    fixed, floating = globalState.model_predict(np.ones((2, 17))), globalState.float_model_predict(np.ones((2, 17)))
+    np.testing.assert_allclose(fixed, floating, atol=1e-4)
+
+def test_second_predict_is_served_by_the_cache(sent):
+    pool = JobPool()
+    first = run(pool, interface_jobs.predict_job(X))
+    second = run(pool, interface_jobs.predict_job(X))
+    pool.shutdown()
+
+    assert len(sent) == 1 and sent[0][1] is False
+    assert any("Try predict" in text for _, text in first)
+    # nothing submitted, same result
+    assert not any("Try predict" in text for _, text in second)
+    result = lambda messages : [text for name, text in messages if name == "setSepoliaConsole"]
+    assert result(first) == result(second) != []
+
+def test_stored_predict_sends_every_row(sent):
+    pool = JobPool()
+    run(pool, interface_jobs.predict_job(X))
+    run(pool, interface_jobs.predict_job(X, for_storage=True))
+    pool.shutdown()
+
+    assert [for_storage for _, for_storage in sent] == [False, True]
+    assert len(sent[1][0]) == len(X)
@@ -0,0 +1,73 @@
+import threading
+
+from jobs import CANCELLED, DONE, FAILED, Job, JobPool
+
+def wait(job : Job) -> None:
+    job.future.result(timeout=5)
+
+def test_job_runs_and_reports():
+    pool = JobPool()
+    job = pool.submit("ok", lambda job : job.progress("working"))
+    wait(job)
+
+    assert job.status == DONE and job.finished is not None
+    assert [text for _, text in pool.drain()] == [
+        f"[job {job.id}] ok : queued", f"[job {job.id}] working", f"[job {job.id}] ok : done"
+    ]
+    pool.shutdown()
+
+def test_failure_is_reported():
+    def fail(job) :
+        raise ValueError("boom")
+
+    pool = JobPool()
+    job = pool.submit("fail", fail)
+    wait(job)
+
+    assert job.status == FAILED and isinstance(job.error, ValueError)
+    pool.shutdown()
+
+def test_cancel_queued_job():
+    pool = JobPool(max_workers=1)
+    release = threading.Event()
+    blocker = pool.submit("blocker", lambda job : release.wait(5))
+    queued = pool.submit("queued", lambda job : None)
+
+    pool.cancel(queued.id)
+    release.set()
+    wait(blocker)
+
+    assert queued.status == CANCELLED and queued.finished is not None
+    pool.shutdown()
+
+def test_cancel_running_job_at_next_check():
+    pool = JobPool()
+    started, release = threading.Event(), threading.Event()
+
+    def run(job) :
+        started.set()
+        release.wait(5)
+        job.check()
+
+    job = pool.submit("running", run)
+    started.wait(5)
+    pool.cancel(job.id)
+    release.set()
+    wait(job)
+
+    assert job.status == CANCELLED
+    pool.shutdown()
+
+def test_cancel_between_pick_and_start():
+    # the worker took the job (future.cancel fails) but _run has not started yet
+    pool = JobPool()
+    job = Job(1, "late", pool.messages)
+    called = []
+    job._cancel.set()
+
+    pool._run(job, called.append)
+
+    assert called == []
+    assert job.status == CANCELLED and job.finished is not None
+    assert pool.messages.get_nowait() == ("writeToConsole", "[job 1] late : cancelled")
+    pool.shutdown()
@@ -0,0 +1,51 @@
+from prediction_cache import PredictionCache
+
+ADDRESS = "0x1"
+ROWS = [[1, 2], [3, 4], [1, 2]]
+
+class Node:
+    def __init__(self) -> None:
+        self.calls = []
+
+    def submit(self, rows : list) -> list:
+        self.calls.append(rows)
+        return [[sum(row)] for row in rows]
+
+def test_misses_are_deduplicated_and_hits_served_locally():
+    cache, node = PredictionCache(), Node()
+
+    assert cache.predict(ADDRESS, 0, ROWS, node.submit) == [[3], [7], [3]]
+    assert cache.predict(ADDRESS, 0, ROWS, node.submit) == [[3], [7], [3]]
+
+    assert node.calls == [[[1, 2], [3, 4]]]
+    assert (cache.hits, cache.misses) == (3, 2)
+
+def test_model_version_is_part_of_the_key():
+    cache, node = PredictionCache(), Node()
+    cache.predict(ADDRESS, 0, ROWS[:1], node.submit)
+    cache.predict(ADDRESS, 1, ROWS[:1], node.submit)
+    assert len(node.calls) == 2
+
+def test_storage_predictions_are_always_sent():
+    cache, node = PredictionCache(), Node()
+    cache.predict(ADDRESS, 0, ROWS, node.submit)
+
+    assert cache.predict(ADDRESS, 0, ROWS, node.submit, for_storage=True) == [[3], [7], [3]]
+
+    # every row reaches the contract, duplicates included
+    assert node.calls[-1] == ROWS
+    # and the outputs still serve later plain predictions
+    cache.predict(ADDRESS, 0, [[3, 4]], node.submit)
+    assert len(node.calls) == 2
+
+def test_sqlite_backing_survives_restarts(tmp_path):
+    path = str(tmp_path / "cache.sqlite")
+    node = Node()
+    cache = PredictionCache(path=path)
+    cache.predict(ADDRESS, 0, ROWS, node.submit)
+    cache.close()
+
+    cache = PredictionCache(path=path)
+    assert cache.predict(ADDRESS, 0, ROWS, node.submit) == [[3], [7], [3]]
+    assert len(node.calls) == 1
+    cache.close()
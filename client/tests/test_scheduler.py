@@ -0,0 +1,105 @@
+import asyncio
+import json
+import threading
+
+import pytest
+
+from common import globalState
+from prediction_cache import PredictionCache
+from scheduler import BatchScheduler, cached_predict_batch
+
+async def echo(worker, rows : list) -> list:
+    await asyncio.sleep(0)
+    return [[sum(row)] for row in rows]
+
+def run_scheduler(producers : int, rows_per_producer : int, sink, **kwargs) -> tuple:
+    '''
+    :return: Final metrics, rows accepted by put, producers blocked at close
+    '''
+    async def main():
+        scheduler = BatchScheduler(echo, ["a", "b"], sink, **kwargs)
+        accepted = []
+
+        async def produce(first : int):
+            for i in range(rows_per_producer) :
+                try :
+                    await scheduler.put([first + i])
+                except RuntimeError :
+                    return
+                accepted.append([first + i])
+
+        running = asyncio.ensure_future(scheduler.run())
+        for p in range(producers) :
+            asyncio.ensure_future(produce(1000 * p))
+        await asyncio.sleep(0)
+        blocked = scheduler.blocked_puts
+        scheduler.close()
+        return await running, accepted, blocked
+
+    return asyncio.run(main())
+
+def test_close_drains_blocked_producers():
+    stored = []
+    final, accepted, blocked = run_scheduler(
+        5, 20, lambda rows, outputs : stored.extend(rows), max_batch_rows=4, max_wait=0.01, queue_size=2
+    )
+
+    assert blocked > 0
+    # every row accepted by put is predicted, none is lost in the queue
+    assert sorted(stored) == sorted(accepted)
+    assert final["rows_done"] == final["rows_in"] == len(accepted)
+
+def test_sink_failure_is_confined_to_its_batch():
+    stored = []
+
+    def sink(rows, outputs) :
+        if rows[0][0] == 0 :
+            raise IOError("disk full")
+        stored.extend(rows)
+
+    final, _, _ = run_scheduler(1, 12, sink, max_batch_rows=4, max_wait=0.01)
+
+    assert final["rows_failed"] == 4
+    assert final["rows_done"] == len(stored) == final["rows_in"] - 4
+
+def test_metrics_are_strict_json():
+    async def main():
+        return BatchScheduler(echo, ["a"], lambda rows, outputs : None).snapshot()
+
+    snapshot = asyncio.run(main())
+    assert snapshot["latency_p50"] is None
+    json.dumps(snapshot, allow_nan=False)
+
+def test_cached_predict_batch_uses_the_prediction_cache(monkeypatch):
+    contract = pytest.importorskip("contract")
+    cache_threads, sent = [], []
+
+    class Cache(PredictionCache) :
+        def get(self, key) :
+            cache_threads.append(threading.get_ident())
+            return super().get(key)
+
+    async def get_contract_async(account, address) :
+        return None
+
+    async def invoke_predict_rows(handle, rows, for_storage) :
+        sent.append((rows, for_storage))
+        return [[sum(row)] for row in rows]
+
+    monkeypatch.setattr(contract, "get_contract_async", get_contract_async)
+    monkeypatch.setattr(contract, "invoke_predict_rows", invoke_predict_rows)
+    monkeypatch.setattr(globalState, "_prediction_cache", Cache())
+
+    async def main():
+        submit_batch = cached_predict_batch(address="0x1")
+        first = await submit_batch("a", [[1, 2], [3, 4], [1, 2]])
+        second = await submit_batch("a", [[3, 4]])
+        return first, second, threading.get_ident()
+
+    first, second, loop_thread = asyncio.run(main())
+
+    assert first == [[3], [7], [3]] and second == [[7]]
+    # misses deduplicated in one call, hits answered locally
+    assert sent == [([[1, 2], [3, 4]], False)]
+    # sqlite reads happen off the event loop
+    assert loop_thread not in cache_threads
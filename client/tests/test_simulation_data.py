@@ -0,0 +1,55 @@
+import os
+import time
+
+import numpy as np
+import pytest
+
+from common import globalState
+from simulation_data import SAMPLE_SIZE, import_data, sample
+
+def test_sample_does_not_scale_with_the_dataset(monkeypatch):
+    n_rows = 10_000_000
+    # read-only views, nothing of the size of the dataset is allocated
+    monkeypatch.setattr(globalState, "train_X", np.broadcast_to(np.arange(n_rows, dtype=np.float32)[:, None], (n_rows, 3)))
+    monkeypatch.setattr(globalState, "train_y", np.broadcast_to(np.int8(1), (n_rows,)))
+    monkeypatch.setattr(globalState, "classes", np.arange(3))
+
+    start = time.perf_counter()
+    for _ in range(50) :
+        X, Y = sample()
+    # a permutation of the rows takes ~0.5 s per call
+    assert time.perf_counter() - start < 1.0
+
+    assert X.shape == (SAMPLE_SIZE, 3) and Y.shape == (SAMPLE_SIZE, 3)
+    assert len(np.unique(X[:, 0])) == SAMPLE_SIZE
+
+def write_csv(path, n_rows : int = 50) -> None:
+    rng = np.random.default_rng(0)
+    with open(path, "w") as file :
+        file.write("a,b,class\n")
+        for _ in range(n_rows) :
+            file.write(f"{rng.random()},{rng.random()},{rng.choice(['GALAXY', 'QSO', 'STAR'])}\n")
+
+def test_cache_is_used_without_the_csv(tmp_path, capsys):
+    pytest.importorskip("pandas")
+    csv, cache_dir = tmp_path / "stars.csv", str(tmp_path / "cache")
+    write_csv(csv)
+    import_data(str(csv), cache_dir=cache_dir)
+    train_X = np.array(globalState.train_X)
+
+    os.remove(csv)
+    import_data(str(csv), cache_dir=cache_dir)
+
+    np.testing.assert_array_equal(globalState.train_X, train_X)
+    assert "not found, using the cache" in capsys.readouterr().err
+
+def test_changed_csv_invalidates_the_cache(tmp_path):
+    pytest.importorskip("pandas")
+    csv, cache_dir = tmp_path / "stars.csv", str(tmp_path / "cache")
+    write_csv(csv, 50)
+    import_data(str(csv), cache_dir=cache_dir)
+    write_csv(csv, 60)
+
+    import_data(str(csv), cache_dir=cache_dir)
+
+    assert len(globalState.train_X) + len(globalState.test_X) == 60
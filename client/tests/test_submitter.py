@@ -0,0 +1,101 @@
+import asyncio
+
+from common import globalState
+from fees import FeeEstimator
+from mock_node import MockNode, NodeError
+from submitter import Submission, Submitter, predict_submissions
+
+ROWS = [[1_000_000, 2_000_000]] * 6
+
+def submitter(node : MockNode, accounts : list, **kwargs) -> Submitter:
+    return Submitter(
+        accounts, address="0x1", resource_bounds=object(), backoff=0.0,
+        get_contract=node.get_contract, **kwargs
+    )
+
+def test_nonces_are_pipelined_per_account():
+    node = MockNode()
+    accounts = [node.account(0xa, nonce=5), node.account(0xb)]
+
+    report = asyncio.run(submitter(node, accounts).submit_async(predict_submissions(ROWS)))
+
+    assert report.n_succeeded == 6 and report.n_failed == 0
+    # one get_nonce per account, then local increments
+    assert node.get_nonce_calls == 2
+    assert [x[2] for x in node.sent_by(0xa)] == [5, 6, 7]
+    assert [x[2] for x in node.sent_by(0xb)] == [0, 1, 2]
+    assert all(x.attempts == 1 for x in report.submissions)
+
+def test_failed_send_is_retried_with_a_resynced_nonce():
+    node = MockNode()
+    account = node.account(0xa, nonce=3)
+    node.fail_sends = 2
+
+    report = asyncio.run(submitter(node, [account]).submit_async(predict_submissions(ROWS[:2])))
+
+    assert report.n_succeeded == 2
+    assert report.submissions[0].attempts == 3
+    assert [x[2] for x in node.sent] == [3, 4]
+
+def test_stale_nonce_is_resynced():
+    node = MockNode()
+    account = node.account(0xa)
+    sender = submitter(node, [account])
+    asyncio.run(sender.submit_async(predict_submissions(ROWS[:1])))
+    # sent by someone else in between
+    node.nonces[0xa] += 1
+
+    report = asyncio.run(sender.submit_async(predict_submissions(ROWS[:1])))
+
+    assert report.n_succeeded == 1
+    assert report.submissions[0].attempts == 2
+    assert [x[2] for x in node.sent] == [0, 2]
+
+def test_retries_are_bounded():
+    node = MockNode()
+    node.fail_sends = 10
+
+    report = asyncio.run(submitter(node, [node.account(0xa)], max_retries=2).submit_async(predict_submissions(ROWS[:1])))
+
+    assert report.n_failed == 1
+    assert report.submissions[0].attempts == 3
+    assert isinstance(report.submissions[0].error, NodeError)
+    assert node.sent == []
+
+def test_acceptance_failure_does_not_resend():
+    node = MockNode()
+    node.fail_acceptances = 1
+
+    report = asyncio.run(
+        submitter(node, [node.account(0xa)], wait_for_acceptance=True).submit_async(predict_submissions(ROWS[:2]))
+    )
+
+    assert len(node.sent) == 2
+    assert [x.attempts for x in report.submissions] == [1, 1]
+    assert isinstance(report.submissions[0].error, NodeError)
+    assert report.submissions[1].error is None
+
+def test_fee_observation_failure_does_not_resend(monkeypatch):
+    node = MockNode(gas_used=50_000)
+    node.fail_receipts = 1
+    estimator = FeeEstimator()
+    monkeypatch.setattr(globalState, "_fee_estimator", estimator)
+
+    report = asyncio.run(
+        submitter(node, [node.account(0xa)], wait_for_acceptance=True).submit_async(predict_submissions(ROWS[:2]))
+    )
+
+    assert report.n_succeeded == 2
+    assert len(node.sent) == 2
+    # only the second receipt could be read
+    assert estimator.gas("predict", (1, 2)) >= 50_000
+
+def test_evaluations_share_the_nonces():
+    node = MockNode()
+    account = node.account(0xa)
+    submissions = predict_submissions(ROWS[:1]) + [Submission("evaluate_stored_prediction", dict(which=0, evaluation=None))]
+
+    report = asyncio.run(submitter(node, [account]).submit_async(submissions))
+
+    assert report.n_succeeded == 2
+    assert [(x[1], x[2]) for x in node.sent] == [("predict", 0), ("evaluate_stored_prediction", 1)]
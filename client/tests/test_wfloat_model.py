@@ -0,0 +1,83 @@
+import os
+import re
+
+import numpy as np
+import pytest
+
+import wfloat_model
+from basic_conversions import wsad_array_to_felt
+from conftest import CLIENT_DIR
+from wfloat_model import ONE, RELU, WFloatSequential, reference_forward
+
+# ----------------------------------------------------------------------
+# Self-consistency of the WFloat engine : the vectors are read from the
+# client_vectors_* Cairo tests, the models are rebuilt from their layers.
+# The expected values were computed by wfloat_model.py itself and have not
+# been run under scarb yet : this checks that the vectorized, python int,
+# scalar and felt paths agree with each other, not that they match the contract.
+
+CAIRO_TESTS = os.path.join(CLIENT_DIR, "..", "contract", "tests", "test_sequential.cairo")
+
+# (input_shape, [(output_shape, activation)]) of each Cairo test
+MODELS = {
+    "client_vectors_single_layer" : (3, [(4, RELU)]),
+    "client_vectors_three_layers" : (1, [(10, RELU), (10, RELU), (3, RELU)]),
+}
+
+def matrix_argument(body : str, constructor : str) -> np.ndarray:
+    start = body.index(f"MatrixBasics::{constructor}(")
+    end = body.index(");", start)
+    rows = re.findall(r"array!\[([-\d,\s]+)\]", body[start:end])
+    return np.array([[int(x) for x in row.split(",") if x.strip()] for row in rows], dtype=np.int64)
+
+def cairo_vectors(test_name : str):
+    '''
+    (X as raw i128, expected raw i128 output) of a Cairo test.
+    '''
+    with open(CAIRO_TESTS, "r") as file :
+        source = file.read()
+    start = source.index(f"fn {test_name}()")
+    body = source[start:source.index("\n}\n", start)]
+    # from_i128 : integers, from_raw_i128 : raw WFloat values
+    return matrix_argument(body, "from_i128") * ONE, matrix_argument(body, "from_raw_i128")
+
+@pytest.fixture(params=sorted(MODELS))
+def case(request):
+    input_shape, layers = MODELS[request.param]
+    X, expected = cairo_vectors(request.param)
+    return WFloatSequential.random(input_shape, layers), X, expected
+
+def test_vectorized_forward(case):
+    model, X, expected = case
+    np.testing.assert_array_equal(model.forward(X).astype(np.int64), expected)
+
+def test_vectorized_forward_on_python_ints(case, monkeypatch):
+    model, X, expected = case
+    # every product goes through the object (python int) path
+    monkeypatch.setattr(wfloat_model, "_INT64_PRODUCT_BOUND", 0)
+    np.testing.assert_array_equal(model.forward(X).astype(np.int64), expected)
+
+def test_scalar_reference(case):
+    model, X, expected = case
+    assert reference_forward(model, X.tolist()) == expected.tolist()
+
+def test_felt_calldata(case):
+    model, X, expected = case
+    np.testing.assert_array_equal(
+        model.predict_felts(wsad_array_to_felt(X)), wsad_array_to_felt(expected)
+    )
+
+def test_float_model_follows_the_fixed_point_one(case):
+    model, X, expected = case
+    float_model = model.to_model()
+    outputs = expected.astype(np.float64) / ONE
+
+    # only the fixed point rounding differs
+    tolerance = 1e-4 * max(1.0, np.abs(outputs).max())
+    np.testing.assert_allclose(float_model.compile()(X / ONE), outputs, atol=tolerance)
+    np.testing.assert_allclose(float_model.predict_batch(X / ONE, chunk_size=2), outputs, atol=tolerance)
+
+def test_every_client_vectors_test_is_covered():
+    with open(CAIRO_TESTS, "r") as file :
+        names = re.findall(r"fn (client_vectors_\w+)\(", file.read())
+    assert sorted(names) == sorted(MODELS)
@@ -3,9 +3,9 @@ import time
 from threading import Thread
 from client.basic_conversions import to_hex
 from common import globalState
-from simulation_data import sample
 # from basic_model_sample import
-from contract import invoke_predict
+from interface_jobs import fetch_job, predict_job, predict_all_job
+from jobs import JobPool
 
 # ----------------------------------------------------------------------
 
@@ -14,8 +14,16 @@ Commands :
     - help / clear / exit
     
     - fetch
-    - predict
+    - predict [store]
         - requires to fetch before
+        - rows already predicted are answered from the cache, unless store
+          (the contract then stores every row)
+    - predict_all
+        - one predict per fetched row, spread over every loaded account
+
+    - jobs
+        - fetch / predict / predict_all run in the background, each one as a job
+    - cancel <job id>
 
     - auto_fetch on/off (default: off)
     - auto_commit on/off (default: off, ie. fetch => commit)
@@ -50,6 +58,10 @@ For <validator> <bot> arguments, you can either specify the index in the contrac
 
 # ----------------------------------------------------------------------
 
+PUMP_INTERVAL = 0.1 # seconds between two flushes of the job messages
+
+jobPool = JobPool()
+
 def init_server():
     print("Starting graphical interface...")
     eel.init('web')
@@ -57,6 +69,16 @@ def init_server():
             mode='default',
             host='localhost',
             block=False)
+    eel.spawn(pump_messages)
+
+def pump_messages():
+    '''
+    Forward the messages of the jobs (worker threads) to the page, from the eel loop.
+    '''
+    while globalState.application_on :
+        for function_name, text in jobPool.drain() :
+            getattr(eel, function_name)(text)
+        eel.sleep(PUMP_INTERVAL)
 
 # ----------------------------------------------------------------------
 
@@ -103,19 +125,29 @@ def query(text : str):
             eel.writeToConsole(f"Contract Address :\n{globalState.DEPLOYED_ADDRESS}")
             
         case "fetch":
-            eel.writeToConsole("Processing ..")
-            X, Y = sample()
-            globalState.current_sample = X
-            model_Y = None
-            visual = f"X = \n{X}\n Expected Y = \n{Y}\nExpected model\nY = \n{model_Y}"
-            eel.setSimulationConsole(
-                visual
-            )
+            jobPool.submit("fetch", fetch_job)
 
         case "predict":
-            eel.writeToConsole("Processing ..")
-            invoke_predict(globalState.current_sample)
-
+            if len(splitted) > 2 or (len(splitted) == 2 and splitted[1] != "store") :
+                eel.writeToConsole("usage : predict [store]")
+                return
+            # the sample is captured now, a later fetch does not change it
+            jobPool.submit("predict", predict_job(globalState.current_sample, for_storage=len(splitted) == 2))
+
+        case "predict_all":
+            if len(globalState.current_sample) == 0 :
+                eel.writeToConsole("Nothing to predict, fetch before.")
+                return
+            jobPool.submit("predict_all", predict_all_job(globalState.current_sample))
+
+        case "jobs":
+            jobs = list(jobPool.jobs.values())
+            eel.writeToConsole("\n".join(map(str, jobs)) if len(jobs) > 0 else "No job.")
+
+        case "cancel":
+            if unexpected_argument(2, splitted) : return
+            job = jobPool.cancel(int(splitted[1])) if splitted[1].isdigit() else None
+            eel.writeToConsole("Unknown job." if job is None else str(job))
 
         case "auto_fetch":
             if unexpected_argument(2, splitted) : return
@@ -133,6 +165,8 @@ def query(text : str):
 
         case "clear": eel.clearConsole()
         case "help" : eel.writeToConsole(HELP)
-        case "exit" : exit()
+        case "exit" :
+            jobPool.shutdown()
+            exit()
         case "" : pass
         case _ : eel.writeToConsole("invalid command")
\ No newline at end of file
@@ -0,0 +1,398 @@
+import numpy as np
+from typing import List, Tuple
+
+from basic_conversions import UPPER_BOUND__I128, LOWER_BOUND__I128, \
+    wsad_array, wsad_array_to_felt, felt_array_to_wsad
+from basic_model_sample import DenseLayer, SGD, Sequential
+
+# ----------------------------------------------------------------------
+# Off-chain replica of the Cairo WFloat arithmetic (contract/src/math)
+# Values are the raw i128 of WFloat (1e6 scale), every rounding mirrors
+# wfloat.cairo / function.cairo / ml.cairo so that results are bit-exact
+# (not yet checked under scarb, see tests/test_wfloat_model.py).
+
+ONE = 1_000_000
+TWO = 2_000_000
+HALF = 500_000
+
+EXP_ITERATIONS = 100
+MAX_SQRT_ITERATIONS = 50
+
+# ActivationFunction enum (ml.cairo)
+RELU = 0
+SIGMOID = 1
+SOFTMAX = 2
+
+# LambdaActivation (component_lambda.cairo) applies relu whatever the
+# stored activation function is, the contract output follows it.
+CONTRACT_FORCES_RELU = True
+
+# int64 products are exact below this bound, object (python int) beyond
+_INT64_PRODUCT_BOUND = 2**62
+
+class WFloatOverflow(OverflowError):
+    '''
+    An intermediate value left the i128 range, the contract would panic.
+    '''
+
+# ----------------------------------------------------------------------
+# Scalar reference (line by line transliteration of the Cairo code)
+
+def i128(x : int) -> int:
+    if x > UPPER_BOUND__I128 or x < LOWER_BOUND__I128 :
+        raise WFloatOverflow("i128 overflow")
+    return x
+
+def trunc_div(lhs : int, rhs : int) -> int:
+    # I128Div : unsigned division, sign restored afterward
+    quotient = abs(lhs) // abs(rhs)
+    return quotient if (lhs >= 0) == (rhs >= 0) else -quotient
+
+def mul(lhs : int, rhs : int) -> int:
+    return trunc_div(i128(lhs * rhs) + HALF, ONE)
+
+def div(lhs : int, rhs : int) -> int:
+    return trunc_div(i128(lhs * ONE) + trunc_div(rhs, 2), rhs)
+
+def relu(x : int) -> int:
+    return x if x > 0 else 0
+
+def exp(x : int) -> int:
+    total, term, n = ONE, ONE, ONE
+    for _ in range(EXP_ITERATIONS):
+        term = mul(term, div(x, n))
+        total = total + term
+        n = n + ONE
+    return total
+
+def sigmoid(x : int) -> int:
+    return div(ONE, ONE + exp(0 - x))
+
+def sqrt(value : int) -> int:
+    if value == 0 :
+        return 0
+    g = div(value, TWO)
+    g2 = g + ONE
+    for _ in range(MAX_SQRT_ITERATIONS):
+        if g == g2 :
+            break
+        n = div(value, g)
+        g2 = g
+        g = div(g + n, TWO)
+    return g
+
+def reference_forward(model : 'WFloatSequential', X) -> list:
+    '''
+    Scalar forward pass (DenseLayer.forward element by element), for self-consistency checks.
+    '''
+    functions = { RELU : relu, SIGMOID : sigmoid }
+    output = [[int(x) for x in line] for line in X]
+    for layer in model.layers :
+        W = layer.weights.tolist()
+        b = layer.biaises.tolist()
+        activation = RELU if model.force_relu else layer.activation
+        output = [
+            [
+                i128(sum(mul(line[k], W[k][j]) for k in range(len(W))) + b[j])
+                for j in range(len(b))
+            ]
+            for line in output
+        ]
+        if activation == SOFTMAX :
+            exps = [[exp(x) for x in line] for line in output]
+            output = [[div(x, sum(line)) for x in line] for line in exps]
+        else :
+            output = [[functions[activation](x) for x in line] for line in output]
+    return output
+
+# ----------------------------------------------------------------------
+# Vectorized version (int64 when exact, python int object arrays otherwise)
+
+def _fits_int64(*arrays) -> bool:
+    bound = 1
+    for x in arrays :
+        bound *= int(np.max(np.abs(x), initial=0)) + 1
+    return bound < _INT64_PRODUCT_BOUND
+
+def _as_dtype(x, dtype) -> np.ndarray:
+    return np.asarray(x).astype(dtype)
+
+def _check_i128(x) -> None:
+    if np.asarray(x).dtype == object and x.size > 0 and \
+            (np.max(x) > UPPER_BOUND__I128 or np.min(x) < LOWER_BOUND__I128) :
+        raise WFloatOverflow("i128 overflow")
+
+def trunc_div_array(lhs, rhs) -> np.ndarray:
+    lhs, rhs = np.broadcast_arrays(lhs, rhs)
+    if np.any(rhs == 0) :
+        raise ZeroDivisionError("WFloat division by zero")
+    quotient = np.abs(lhs) // np.abs(rhs)
+    return np.where((lhs >= 0) == (rhs >= 0), quotient, -quotient)
+
+def mul_array(lhs, rhs) -> np.ndarray:
+    dtype = np.int64 if _fits_int64(lhs, rhs) else object
+    product = _as_dtype(lhs, dtype) * _as_dtype(rhs, dtype)
+    _check_i128(product)
+    return trunc_div_array(product + HALF, ONE)
+
+def div_array(lhs, rhs) -> np.ndarray:
+    dtype = np.int64 if _fits_int64(lhs, ONE) else object
+    scaled = _as_dtype(lhs, dtype) * ONE
+    _check_i128(scaled)
+    return trunc_div_array(scaled + trunc_div_array(rhs, 2), _as_dtype(rhs, dtype))
+
+def relu_array(x) -> np.ndarray:
+    return np.where(x > 0, x, 0)
+
+def exp_array(x) -> np.ndarray:
+    total = np.full(np.shape(x), ONE, dtype=object)
+    term = np.full(np.shape(x), ONE, dtype=object)
+    n = ONE
+    for _ in range(EXP_ITERATIONS):
+        term = mul_array(term, div_array(x, n))
+        total = total + term
+        n = n + ONE
+    _check_i128(_as_dtype(total, object))
+    return total
+
+def sigmoid_array(x) -> np.ndarray:
+    return div_array(np.full(np.shape(x), ONE), ONE + exp_array(0 - _as_dtype(x, object)))
+
+def softmax_array(x) -> np.ndarray:
+    # softmax of each row (a Vector in the Cairo code)
+    denormalized = exp_array(x)
+    normalizer = np.sum(denormalized, axis=-1, keepdims=True)
+    return div_array(denormalized, normalizer)
+
+def sqrt_array(value) -> np.ndarray:
+    value = _as_dtype(value, object)
+    g = div_array(value, TWO)
+    g2 = g + ONE
+    done = value == 0
+    for _ in range(MAX_SQRT_ITERATIONS):
+        done = done | (g == g2)
+        if np.all(done) :
+            break
+        active = ~done
+        n = div_array(value[active], g[active])
+        g2[active] = g[active]
+        g[active] = div_array(g[active] + n, TWO)
+    return np.where(value == 0, 0, g)
+
+def dot_array(X, W, chunk_size : int = 1024) -> np.ndarray:
+    '''
+    Matrix.dot : every product rounded by WFloatMul then summed.
+    '''
+    dtype = np.int64 if _fits_int64(X, W) else object
+    X = _as_dtype(X, dtype)
+    W = _as_dtype(W, dtype)
+
+    result = np.empty((X.shape[0], W.shape[1]), dtype=dtype)
+    for i in range(0, X.shape[0], chunk_size) :
+        products = X[i:i + chunk_size, :, None] * W[None, :, :]
+        _check_i128(products)
+        result[i:i + chunk_size] = np.sum(trunc_div_array(products + HALF, ONE), axis=1)
+    _check_i128(result)
+    return result
+
+# ----------------------------------------------------------------------
+# Pseudo random initialization (random.cairo), to rebuild the models of
+# the Cairo tests
+
+DEFAULT_SEED = 95732
+LCG_A = 1664525
+LCG_C = 1013904223
+LCG_M = 2**32
+
+def lcg_rand(seed : int) -> int:
+    return (LCG_A * seed + LCG_C) % LCG_M
+
+def normalize_lgn_rand_11(lgc_rand_result : int) -> int:
+    lgc_float = (lgc_rand_result % LCG_M) * ONE
+    return div(mul(TWO, lgc_float), LCG_M * ONE) - ONE
+
+def random_vector(dimension : int, seed : int) -> np.ndarray:
+    result = []
+    for _ in range(dimension):
+        result.append(normalize_lgn_rand_11(seed))
+        seed = lcg_rand(seed)
+    return np.array(result, dtype=np.int64)
+
+def random_matrix(shape : Tuple[int, int], seed : int) -> np.ndarray:
+    result = []
+    for _ in range(shape[0]):
+        result.append(random_vector(shape[1], seed * 293 + 13))
+        seed = lcg_rand(seed)
+    return np.array(result, dtype=np.int64).reshape(shape)
+
+ACTIVATIONS = {
+    RELU : relu_array,
+    SIGMOID : sigmoid_array,
+    SOFTMAX : softmax_array,
+}
+
+# basic_model_sample.DenseLayer activation names
+ACTIVATION_NAMES = {
+    RELU : "ReLU",
+    SIGMOID : "Sigmoid",
+    SOFTMAX : "Softmax",
+}
+
+# ----------------------------------------------------------------------
+
+class WFloatDenseLayer:
+    def __init__(self, weights : np.ndarray, biaises : np.ndarray, activation : int = RELU) -> None:
+        self.weights = weights
+        self.biaises = biaises
+        self.activation = activation
+
+    @property
+    def input_shape(self) -> int: return self.weights.shape[0]
+
+    @property
+    def output_shape(self) -> int: return self.weights.shape[1]
+
+    def forward(self, X : np.ndarray, force_relu : bool = CONTRACT_FORCES_RELU) -> np.ndarray:
+        z = dot_array(X, self.weights) + self.biaises
+        _check_i128(z)
+        activation = RELU if force_relu else self.activation
+        return ACTIVATIONS[activation](z)
+
+class WFloatSequential:
+    '''
+    Fixed point replica of the on-chain Sequential, forward only.
+    '''
+    def __init__(self, layers : List[WFloatDenseLayer], force_relu : bool = CONTRACT_FORCES_RELU) -> None:
+        self.layers = layers
+        self.force_relu = force_relu
+
+    @staticmethod
+    def from_model(model, force_relu : bool = CONTRACT_FORCES_RELU) -> 'WFloatSequential':
+        '''
+        Quantize a basic_model_sample.Sequential as Sequential.serialize does
+        (DenseLayer.serialize always stores ReLU).
+        '''
+        return WFloatSequential([
+            WFloatDenseLayer(wsad_array(layer.W), wsad_array(layer.b[0]), RELU)
+            for layer in model.layers
+        ], force_relu)
+
+    @staticmethod
+    def random(input_shape : int, layers : List[Tuple[int, int]], seed : int = DEFAULT_SEED,
+               force_relu : bool = CONTRACT_FORCES_RELU) -> 'WFloatSequential':
+        '''
+        Same weights as SequentialBasics::init for layers given as (output_shape, activation).
+        '''
+        result = []
+        for output_shape, activation in layers :
+            # DenseLayer.build
+            result.append(WFloatDenseLayer(
+                random_matrix((input_shape, output_shape), seed + 29399),
+                random_vector(output_shape, seed + 18839),
+                activation
+            ))
+            input_shape = output_shape
+            seed = lcg_rand(seed)
+        return WFloatSequential(result, force_relu)
+
+    @staticmethod
+    def from_felts(felts : list, force_relu : bool = CONTRACT_FORCES_RELU) -> 'WFloatSequential':
+        '''
+        Parse the calldata layout of Sequential::init_from_felt252.
+        '''
+        felts = felt_array_to_wsad(np.asarray(felts, dtype=object).ravel())
+        position = 0
+
+        def take(n : int) -> np.ndarray:
+            nonlocal position
+            position += n
+            return felts[position - n:position]
+
+        layers = []
+        for _ in range(int(take(1)[0])) :
+            n_rows = int(take(1)[0])
+            rows = []
+            for _ in range(n_rows) :
+                rows.append(take(int(take(1)[0])))
+            weights = np.array(rows, dtype=object).reshape(n_rows, -1)
+            biaises = take(int(take(1)[0]))
+            activation = int(take(1)[0])
+            layers.append(WFloatDenseLayer(_shrink(weights), _shrink(biaises), activation))
+        return WFloatSequential(layers, force_relu)
+
+    def to_model(self) -> Sequential:
+        '''
+        Float basic_model_sample.Sequential of the same weights (no fixed point
+        rounding), for its inference / predict_batch / compile path.
+        '''
+        layers = []
+        for layer in self.layers :
+            activation = RELU if self.force_relu else layer.activation
+            dense = DenseLayer(layer.input_shape, layer.output_shape, ACTIVATION_NAMES[activation])
+            dense.build()
+            dense.W = layer.weights.astype(np.float64) / ONE
+            dense.b = layer.biaises.astype(np.float64)[None, :] / ONE
+            layers.append(dense)
+        return Sequential(layers, SGD(learning_rate=0.0))
+
+    def forward(self, X : np.ndarray, batch_size : int = 4096) -> np.ndarray:
+        '''
+        Raw i128 inputs -> raw i128 outputs, by batches of rows.
+        '''
+        outputs = []
+        for i in range(0, len(X), batch_size) :
+            output = X[i:i + batch_size]
+            for layer in self.layers :
+                output = layer.forward(output, self.force_relu)
+            outputs.append(_as_dtype(output, object))
+        return np.concatenate(outputs, axis=0)
+
+    def predict_felts(self, inputs_as_felt) -> np.ndarray:
+        '''
+        Same felt252 matrix as CountryWiseContract.predict.
+        '''
+        return wsad_array_to_felt(self.forward(_shrink(felt_array_to_wsad(inputs_as_felt))))
+
+    def predict(self, X : np.ndarray) -> np.ndarray:
+        return self.forward(wsad_array(X)).astype(np.float64) * 1e-6
+
+def _shrink(x : np.ndarray) -> np.ndarray:
+    # object -> int64 when every value fits
+    if x.size == 0 or (np.max(x) < 2**63 and np.min(x) >= -2**63) :
+        return x.astype(np.int64)
+    return x
+
+# ----------------------------------------------------------------------
+
+def quantization_report(model, X : np.ndarray, Y : np.ndarray = None) -> List[dict]:
+    '''
+    Float (basic_model_sample.Sequential) vs on-chain fixed point, layer by layer :
+    mean / max absolute gap of the activations, and the accuracy gap
+    (argmax of the outputs) when the one hot targets Y are given.
+    '''
+    fixed = WFloatSequential.from_model(model)
+
+    report = []
+    float_output = np.asarray(X, dtype=np.float64)
+    fixed_output = wsad_array(X)
+    for index, (layer, fixed_layer) in enumerate(zip(model.layers, fixed.layers)) :
+        float_output = layer.inference(float_output)
+        fixed_output = fixed_layer.forward(fixed_output, fixed.force_relu)
+        gap = np.abs(float_output - fixed_output.astype(np.float64) * 1e-6)
+
+        line = { "layer" : index, "mean_gap" : float(gap.mean()), "max_gap" : float(gap.max()) }
+        if Y is not None :
+            # how often float and fixed point activations pick the same unit
+            agreement = np.argmax(float_output, axis=1) == np.argmax(fixed_output, axis=1)
+            line["argmax_agreement"] = float(agreement.mean())
+        report.append(line)
+
+    if Y is not None :
+        labels = np.argmax(Y, axis=1)
+        float_accuracy = float((np.argmax(float_output, axis=1) == labels).mean())
+        fixed_accuracy = float((np.argmax(fixed_output, axis=1) == labels).mean())
+        report[-1]["float_accuracy"] = float_accuracy
+        report[-1]["fixed_accuracy"] = fixed_accuracy
+        report[-1]["accuracy_gap"] = float_accuracy - fixed_accuracy
+
+    return report
@@ -143,3 +143,70 @@ fn verify_network_() {
 
     println!("finished");
 }
+
+// ----------------------------------------------------------
+// Vectors of the off-chain engine (client/wfloat_model.py)
+// Expected values : WFloatSequential.random(...).forward(X), computed in
+// Python and not yet run under scarb. Until ``scarb test`` passes on them,
+// they are not a conformance check of client/wfloat_model.py.
+
+#[test]
+fn client_vectors_single_layer() {
+    let layers: Span<DenseLayer> = array![
+        DenseLayerBasics::init(
+            input_shape: Option::Some(3),
+            output_shape: 4,
+            activation_function: ActivationFunction::ReLU,
+            seed: Option::None
+        )
+    ]
+        .span();
+
+    let mut model = SequentialBasics::init(layers, DEFAULT_SGD, Option::None);
+
+    let X = MatrixBasics::from_i128(
+        @array![
+            array![1, 0, 0].span(),
+            array![0, 3, 2].span(),
+            array![4, 2, 1].span(),
+            array![5, 2, 1].span(),
+            array![1, 2, 5].span(),
+        ]
+            .span()
+    );
+
+    let expected = MatrixBasics::from_raw_i128(
+        @array![
+            array![0, 0, 0, 0].span(),
+            array![0, 2041335, 1050631, 1148402].span(),
+            array![0, 0, 0, 0].span(),
+            array![0, 0, 0, 0].span(),
+            array![0, 3311517, 1882799, 2670868].span(),
+        ]
+            .span()
+    );
+
+    assert!(model.forward(@X) == expected, "differs from client/wfloat_model.py");
+}
+
+#[test]
+fn client_vectors_three_layers() {
+    let layers: Span<DenseLayer> = array![
+        DenseLayerBasics::init(
+            input_shape: Option::Some(1),
+            output_shape: 10,
+            activation_function: ActivationFunction::ReLU,
+            seed: Option::None
+        ),
+        DenseLayerBasics::add(output_shape: 10, activation_function: ActivationFunction::ReLU,),
+        DenseLayerBasics::add(output_shape: 3, activation_function: ActivationFunction::ReLU,),
+    ]
+        .span();
+
+    let mut model = SequentialBasics::init(layers, DEFAULT_SGD, Option::None);
+
+    let X = MatrixBasics::from_i128(@array![array![1].span()].span());
+    let expected = MatrixBasics::from_raw_i128(@array![array![994545, 743907, 615261].span()].span());
+
+    assert!(model.forward(@X) == expected, "differs from client/wfloat_model.py");
+}
@@ -0,0 +1,120 @@
+import argparse
+import time
+import numpy as np
+
+from constants import FOV_U, FOV_V
+from sampling import compute_angular_distances, k_nearest_edges, keep_k_closest
+from star_index import StarIndex, within_fov
+
+def timeit(function, repeat: int = 3) -> float:
+    """
+    Best wall time (seconds) over ``repeat`` runs.
+    """
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+def report(name: str, baseline: float, candidate: float) -> None:
+    print(f"{name:<32} baseline {baseline*1e3:10.2f} ms | "
+          f"optimized {candidate*1e3:10.2f} ms | x{baseline / candidate:.1f}")
+
+# ----------------------------------------------------------------------
+# Previous implementations, kept as the baseline
+
+def _loop_angular_distances(positions: np.ndarray) -> np.ndarray:
+    num_stars = positions.shape[0]
+    distances = np.zeros((num_stars, num_stars))
+    for i in range(num_stars):
+        for j in range(num_stars):
+            if i != j:
+                distances[i, j] = np.sqrt((positions[i, 0] - positions[j, 0])**2 +
+                                          (positions[i, 1] - positions[j, 1])**2)
+    return distances
+
+def _argsort_k_closest(distances: np.ndarray, k: int) -> np.ndarray:
+    num_stars = distances.shape[0]
+    for i in range(num_stars):
+        row = distances[i, :]
+        closest_indices = np.argsort(row)[:k + 1]
+        mask = np.ones_like(row, dtype=bool)
+        mask[closest_indices] = False
+        row[mask] = 0.0
+    return distances
+
+# ----------------------------------------------------------------------
+
+def benchmark_distances(num_stars: int) -> None:
+    positions = np.random.uniform(-np.pi, np.pi, (num_stars, 2))
+    assert np.allclose(_loop_angular_distances(positions), compute_angular_distances(positions))
+    report(
+        f"distances {num_stars} stars",
+        timeit(lambda: _loop_angular_distances(positions), repeat=1),
+        timeit(lambda: compute_angular_distances(positions))
+    )
+
+def benchmark_knn(num_stars: int, k: int) -> None:
+    positions = np.random.uniform(-np.pi, np.pi, (num_stars, 2))
+
+    dense = _argsort_k_closest(compute_angular_distances(positions), k)
+    edge_index, edge_attr = k_nearest_edges(positions, k)
+    sparse = np.zeros_like(dense)
+    sparse[edge_index[0], edge_index[1]] = edge_attr
+    assert np.allclose(dense, sparse)
+    assert np.allclose(keep_k_closest(compute_angular_distances(positions), k), dense)
+
+    report(
+        f"keep_k_closest {num_stars} stars",
+        timeit(lambda: _argsort_k_closest(compute_angular_distances(positions), k)),
+        timeit(lambda: keep_k_closest(compute_angular_distances(positions), k))
+    )
+    report(
+        f"k_nearest_edges {num_stars} stars",
+        timeit(lambda: _argsort_k_closest(compute_angular_distances(positions), k)),
+        timeit(lambda: k_nearest_edges(positions, k))
+    )
+    print(f"{'':<32} memory dense {dense.nbytes / 2**20:.1f} MiB | "
+          f"edges {(edge_index.nbytes + edge_attr.nbytes) / 2**20:.1f} MiB")
+
+def benchmark_fov(num_stars: int, num_centers: int = 1000) -> None:
+    stars = np.random.uniform(-np.pi, np.pi, (num_stars, 2))
+    centers = np.random.uniform(-np.pi + FOV_U / 2, np.pi - FOV_U / 2, (num_centers, 2))
+
+    def scan():
+        return [
+            np.flatnonzero(
+                (stars[:, 0] >= u - FOV_U / 2) & (stars[:, 0] <= u + FOV_U / 2) &
+                (stars[:, 1] >= v - FOV_V / 2) & (stars[:, 1] <= v + FOV_V / 2)
+            )
+            for u, v in centers
+        ]
+
+    index = StarIndex(stars)
+    indices, offsets = index.query_many(centers, FOV_U, FOV_V)
+    assert all(
+        np.array_equal(indices[offsets[i]:offsets[i + 1]], np.flatnonzero(within_fov(stars, center, FOV_U, FOV_V)))
+        for i, center in enumerate(centers)
+    )
+    report(f"fov {num_centers} x {num_stars} stars", timeit(scan), timeit(lambda: index.query_many(centers, FOV_U, FOV_V)))
+    print(f"{'':<32} index build {timeit(lambda: StarIndex(stars)) * 1e3:.2f} ms")
+
+BENCHMARKS = {
+    "distances": lambda args: benchmark_distances(min(args.stars, 1000)),
+    "knn": lambda args: benchmark_knn(args.stars, args.k),
+    "fov": lambda args: benchmark_fov(max(args.stars, 100_000)),
+}
+
+def main():
+    parser = argparse.ArgumentParser(description="Sampling benchmarks")
+    parser.add_argument('names', nargs='*', default=list(BENCHMARKS), help='benchmarks to run')
+    parser.add_argument('--stars', type=int, default=1000, help='number of visible stars')
+    parser.add_argument('-k', type=int, default=8, help='neighbours per star')
+    args = parser.parse_args()
+
+    for name in args.names:
+        BENCHMARKS[name](args)
+
+if __name__ == "__main__":
+    main()
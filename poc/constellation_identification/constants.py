@@ -9,11 +9,30 @@ INTENSITY_RANGE = (0.1, 1)
 
 STAR_DATA_FILE = os.path.join("data", "stars.csv")
 TRAINING_GRAPHS_DIR = os.path.join("data", "sample")
+PACKED_GRAPHS_DIR = os.path.join("data", "packed")
 MODEL_PATH = os.path.join("output", "model.pt")
+CHECKPOINT_DIR = os.path.join("output", "checkpoints")
+TRAINING_LOG_PATH = os.path.join("output", "training_log.jsonl")
+PROFILE_DIR = os.path.join("output", "profile")
+DATA_CACHE_PATH = os.path.join("data", "cache", "graphs.pt")
+
+DATA_CACHE_BYTES = 2 * 2**30 # in memory Data objects
+NUM_WORKERS = 2 # DataLoader processes
+CHECKPOINT_EVERY = 1 # epochs
+KEPT_CHECKPOINTS = 3
+PROFILED_STEPS = 5 # steps recorded by --profile, after 1 skipped and 1 warmup
+
+EDGE_ATTR_DTYPE = np.float32 # stored edge distances
+ONLINE_K_NEIGHBORS = 8 # edges per star of the generated graphs (None : complete graph)
 
 FOV_U = math.radians(30.0)  # Field of view width in degrees
 FOV_V = math.radians(15.0)  # Field of view height in degrees
 MAX_ANGLE = np.pi
 
+KNN_BLOCK_SIZE = 1024 # rows of the distance matrix computed at once
+
+SHARD_SIZE = 1000 # graph samples per shard file
+GENERATION_SEED = 0
+
 INTENSITY_NOISE = 0.1
 LOCATION_NOISE  = math.radians(3)
\ No newline at end of file
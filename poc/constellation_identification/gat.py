@@ -1,5 +1,13 @@
 import os
+import json
+import time
+import shutil
+import argparse
+import hashlib
+import resource
 import numpy as np
+import pandas as pd
+from typing import List, Tuple
 import torch
 import torch.nn as nn
 import torch.optim as optim
@@ -8,22 +16,54 @@ from torch_geometric.data import Data
 from torch_geometric.loader import DataLoader
 import matplotlib.pyplot as plt
 
-from constants import MODEL_PATH, TRAINING_GRAPHS_DIR, NUM_SAMPLES
+from constants import CHECKPOINT_DIR, CHECKPOINT_EVERY, DATA_CACHE_BYTES, DATA_CACHE_PATH, FOV_U, FOV_V, \
+    GENERATION_SEED, KEPT_CHECKPOINTS, MODEL_PATH, NUM_WORKERS, ONLINE_K_NEIGHBORS, PACKED_GRAPHS_DIR, PROFILE_DIR, \
+    PROFILED_STEPS, STAR_DATA_FILE, TRAINING_GRAPHS_DIR, TRAINING_LOG_PATH, NUM_SAMPLES
+from packed_dataset import PackedGraphs
+from sampling import build_graph_sample, graph_edges
+from star_index import StarIndex
 from visualization import visualize_predictions
 
+def graph_to_data(graph_sample, ground_truth) -> Data:
+    """
+    Data of a graph sample and its ground truth (see sampling.save_graph_sample).
+    """
+    intensities = torch.tensor(graph_sample['intensities'], dtype=torch.float32).unsqueeze(1)
+    positions = torch.tensor(graph_sample['relative_positions'], dtype=torch.float32)
+
+    true_positions = torch.tensor(ground_truth['true_positions'], dtype=torch.float32)
+    camera_center = torch.tensor(ground_truth['camera_center'], dtype=torch.float32)
+
+    edge_index, edge_attr = graph_edges(graph_sample)
+    edge_index = torch.tensor(edge_index, dtype=torch.long)
+    edge_attr = torch.tensor(edge_attr, dtype=torch.float32).view(-1, 1)
+
+    x = torch.cat([positions, intensities], dim=1)
+
+    return Data(x=x, edge_index=edge_index, edge_attr=edge_attr, y=true_positions, camera_center=camera_center)
+
 class StarDataset(torch.utils.data.Dataset):
+    """
+    Graph samples of ``data_dir``, either packed (see packed_dataset.py,
+    memory mapped) or in the sample_{id}_x/y.npz layout.
+    """
     def __init__(self, data_dir):
         self.data_dir = data_dir
-        self.samples = [
-            int(file.split('_')[1])
-            for file in os.listdir(data_dir)
-            if file.endswith("_x.npz")
-        ]
+        self.packed = PackedGraphs(data_dir) if PackedGraphs.exists(data_dir) else None
+        if self.packed is None:
+            self.samples = [
+                int(file.split('_')[1])
+                for file in os.listdir(data_dir)
+                if file.endswith("_x.npz")
+            ]
 
     def __len__(self):
-        return len(self.samples)
+        return len(self.packed) if self.packed is not None else len(self.samples)
 
     def __getitem__(self, idx):
+        if self.packed is not None:
+            return self._packed_item(idx)
+
         sample_id = self.samples[idx]
         x_path = os.path.join(self.data_dir, f"sample_{sample_id}_x.npz")
         y_path = os.path.join(self.data_dir, f"sample_{sample_id}_y.npz")
@@ -31,23 +71,147 @@ class StarDataset(torch.utils.data.Dataset):
         x_data = np.load(x_path)
         y_data = np.load(y_path)
 
-        distances = torch.tensor(x_data['distances'], dtype=torch.float32)
-        intensities = torch.tensor(x_data['intensities'], dtype=torch.float32).unsqueeze(1)
-        positions = torch.tensor(x_data['relative_positions'], dtype=torch.float32)
+        return graph_to_data(x_data, y_data)
+
+    def _packed_item(self, idx):
+        # slices of the memory mapped arrays, shared with the tensors
+        sample = self.packed[idx]
+        return Data(
+            x=torch.from_numpy(sample['x']),
+            edge_index=torch.from_numpy(sample['edge_index']),
+            edge_attr=torch.from_numpy(sample['edge_attr']).view(-1, 1),
+            y=torch.from_numpy(sample['y']),
+            camera_center=torch.from_numpy(sample['camera_center'])
+        )
+
+class OnlineStarDataset(torch.utils.data.IterableDataset):
+    """
+    Fresh graph samples drawn from the star catalogue at every epoch, no file involved.
+
+    Each DataLoader worker draws its share of ``samples_per_epoch`` from
+    its own stream, seeded by (seed, epoch, worker id) : a run is
+    reproducible for a given number of workers. Call ``set_epoch`` before
+    each epoch (done by train_model). With ``wrap_around`` the centers are
+    drawn anywhere, the FOV may cross +-pi.
+    """
+    def __init__(
+        self,
+        star_data_file: str = STAR_DATA_FILE,
+        samples_per_epoch: int = NUM_SAMPLES,
+        k_neighbors: int = ONLINE_K_NEIGHBORS,
+        seed: int = GENERATION_SEED,
+        fov_u: float = FOV_U,
+        fov_v: float = FOV_V,
+        wrap_around: bool = False
+    ):
+        self.star_data = pd.read_csv(star_data_file).to_numpy()
+        self.index = StarIndex(self.star_data)
+        self.samples_per_epoch = samples_per_epoch
+        self.k_neighbors = k_neighbors
+        self.seed = seed
+        self.fov_u = fov_u
+        self.fov_v = fov_v
+        self.wrap_around = wrap_around
+        self.epoch = 0
+
+    def set_epoch(self, epoch: int) -> None:
+        self.epoch = epoch
+
+    def __len__(self):
+        return self.samples_per_epoch
 
-        true_positions = torch.tensor(y_data['true_positions'], dtype=torch.float32)
-        camera_center = torch.tensor(y_data['camera_center'], dtype=torch.float32)
+    def __iter__(self):
+        worker = torch.utils.data.get_worker_info()
+        worker_id, num_workers = (0, 1) if worker is None else (worker.id, worker.num_workers)
+        rng = np.random.default_rng(np.random.SeedSequence(self.seed, spawn_key=(self.epoch, worker_id)))
 
-        edge_index = (distances > 0).nonzero(as_tuple=False).T
-        edge_attr = distances[distances > 0].view(-1, 1)
+        for _ in range(worker_id, self.samples_per_epoch, num_workers):
+            graph_sample, ground_truth = build_graph_sample(
+                self.star_data, self.fov_u, self.fov_v, self.k_neighbors, rng, self.index, self.wrap_around
+            )
+            yield graph_to_data(graph_sample, ground_truth)
 
-        x = torch.cat([positions, intensities], dim=1)
+def create_online_dataloader(batch_size, num_workers: int = NUM_WORKERS, **kwargs):
+    """
+    Batches of OnlineStarDataset(**kwargs). Workers are started again at
+    every epoch, so that they see the epoch given to set_epoch.
+    """
+    return DataLoader(
+        OnlineStarDataset(**kwargs), batch_size=batch_size,
+        num_workers=num_workers,
+        pin_memory=torch.cuda.is_available(),
+        prefetch_factor=2 if num_workers > 0 else None
+    )
 
-        return Data(x=x, edge_index=edge_index, edge_attr=edge_attr, y=true_positions, camera_center=camera_center)
+def dataset_fingerprint(data_dir: str) -> str:
+    """
+    Name, size and mtime of every file of ``data_dir`` (no content read).
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    for file in sorted(os.listdir(data_dir)):
+        stat = os.stat(os.path.join(data_dir, file))
+        digest.update(f"{file}:{stat.st_size}:{stat.st_mtime_ns};".encode())
+    return digest.hexdigest()
 
-def create_dataloader(data_dir, batch_size):
+def data_nbytes(data: Data) -> int:
+    return sum(value.numel() * value.element_size() for _, value in data if torch.is_tensor(value))
+
+class CachedDataset(torch.utils.data.Dataset):
+    """
+    Data objects of a StarDataset built once instead of every epoch.
+
+    Samples are kept in memory up to ``max_bytes`` (later ones are rebuilt
+    on access). When everything fits, the list is also saved to
+    ``cache_path`` and reloaded by later runs while the data directory
+    is unchanged.
+    """
+    def __init__(self, dataset: StarDataset, cache_path: str = None, max_bytes: int = DATA_CACHE_BYTES):
+        self.dataset = dataset
+        fingerprint = dataset_fingerprint(dataset.data_dir)
+
+        if cache_path is not None and os.path.exists(cache_path):
+            cached = torch.load(cache_path, weights_only=False)
+            if cached['fingerprint'] == fingerprint:
+                self.items = cached['items']
+                return
+
+        start = time.perf_counter()
+        self.items = []
+        total = 0
+        for idx in range(len(dataset)):
+            data = dataset[idx] if total < max_bytes else None
+            if data is not None:
+                total += data_nbytes(data)
+            self.items.append(data)
+        num_cached = sum(item is not None for item in self.items)
+        print(f"Cached {num_cached}/{len(dataset)} samples ({total / 2**20:.1f} MiB) in {time.perf_counter() - start:.2f}s")
+
+        if cache_path is not None and num_cached == len(dataset):
+            os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+            torch.save({'fingerprint': fingerprint, 'items': self.items}, cache_path)
+
+    def __len__(self):
+        return len(self.items)
+
+    def __getitem__(self, idx):
+        item = self.items[idx]
+        return item if item is not None else self.dataset[idx]
+
+def create_dataloader(data_dir, batch_size, num_workers: int = NUM_WORKERS, cache_path: str = DATA_CACHE_PATH):
+    """
+    Shuffled batches of the (cached) samples of ``data_dir``, collated by
+    ``num_workers`` prefetching processes kept alive between epochs.
+    """
     dataset = StarDataset(data_dir)
-    return DataLoader(dataset, batch_size=batch_size, shuffle=True)
+    if cache_path is not None:
+        dataset = CachedDataset(dataset, cache_path)
+    return DataLoader(
+        dataset, batch_size=batch_size, shuffle=True,
+        num_workers=num_workers,
+        pin_memory=torch.cuda.is_available(),
+        persistent_workers=num_workers > 0,
+        prefetch_factor=2 if num_workers > 0 else None
+    )
 
 class GATModel(nn.Module):
     def __init__(self, input_dim, hidden_dim, output_dim):
@@ -65,24 +229,177 @@ class GATModel(nn.Module):
         out = self.fc(x)
         return out
 
-def train_model(model, dataloader, epochs, lr, device):
+# ----------------------------------------------------------------------
+# Checkpoints : <checkpoint_dir>/epoch_{n}.pt with the model, the optimizer
+# and the torch rng state after n epochs, the KEPT_CHECKPOINTS last are kept.
+
+def checkpoint_path(checkpoint_dir: str, epoch: int) -> str:
+    return os.path.join(checkpoint_dir, f"epoch_{epoch:04d}.pt")
+
+def list_checkpoints(checkpoint_dir: str) -> List[Tuple[int, str]]:
+    """
+    :return: (epoch, path) of the checkpoints of checkpoint_dir, by increasing epoch
+    """
+    if not os.path.isdir(checkpoint_dir):
+        return []
+    return sorted(
+        (int(file[len("epoch_"):-len(".pt")]), os.path.join(checkpoint_dir, file))
+        for file in os.listdir(checkpoint_dir)
+        if file.startswith("epoch_") and file.endswith(".pt") and file[len("epoch_"):-len(".pt")].isdigit()
+    )
+
+def latest_checkpoint(checkpoint_dir: str) -> str:
+    checkpoints = list_checkpoints(checkpoint_dir)
+    return checkpoints[-1][1] if checkpoints else None
+
+def save_checkpoint(model: nn.Module, optimizer: optim.Optimizer, epoch: int, checkpoint_dir: str) -> None:
+    os.makedirs(checkpoint_dir, exist_ok=True)
+    path = checkpoint_path(checkpoint_dir, epoch)
+    # written under a temporary name, an interrupted save never shadows the previous checkpoint
+    torch.save({
+        'epoch': epoch,
+        'model': model.state_dict(),
+        'optimizer': optimizer.state_dict(),
+        'rng': torch.get_rng_state(),
+    }, path + ".tmp")
+    os.replace(path + ".tmp", path)
+
+    # whatever checkpoint_every is, only the KEPT_CHECKPOINTS most recent remain
+    for _, old_path in list_checkpoints(checkpoint_dir)[:-KEPT_CHECKPOINTS]:
+        os.remove(old_path)
+
+def load_checkpoint(model: nn.Module, optimizer: optim.Optimizer, path: str) -> int:
+    """
+    :return: Number of epochs already done
+    """
+    # the rng state is a cpu tensor, the state dicts are moved by load_state_dict
+    checkpoint = torch.load(path, map_location="cpu")
+    model.load_state_dict(checkpoint['model'])
+    optimizer.load_state_dict(checkpoint['optimizer'])
+    torch.set_rng_state(checkpoint['rng'])
+    return checkpoint['epoch']
+
+# ----------------------------------------------------------------------
+
+def synchronize(device: torch.device) -> None:
+    # cuda kernels are asynchronous, wait for them before reading the clock
+    if device.type == 'cuda':
+        torch.cuda.synchronize(device)
+
+def peak_memory(device: torch.device) -> dict:
+    memory = {'peak_rss_mib': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024}
+    if device.type == 'cuda':
+        memory['peak_cuda_mib'] = torch.cuda.max_memory_allocated(device) / 2**20
+    return memory
+
+def train_model(
+    model, dataloader, epochs, lr, device,
+    checkpoint_dir: str = None,
+    checkpoint_every: int = CHECKPOINT_EVERY,
+    log_path: str = None,
+    profile_dir: str = None
+):
+    """
+    Train for ``epochs`` epochs, resuming from the latest checkpoint of ``checkpoint_dir``.
+
+    :param checkpoint_dir: Where checkpoints are saved every ``checkpoint_every`` epochs (None : never)
+    :param log_path: JSON lines file receiving one record per epoch (timings, throughput, memory)
+    :param profile_dir: Write a torch profiler trace of the first steps there
+    """
     optimizer = optim.Adam(model.parameters(), lr=lr)
     criterion = nn.MSELoss()
 
-    for epoch in range(epochs):
+    start_epoch = 0
+    checkpoint = None if checkpoint_dir is None else latest_checkpoint(checkpoint_dir)
+    if checkpoint is not None:
+        start_epoch = load_checkpoint(model, optimizer, checkpoint)
+        print(f"Resumed from {checkpoint} ({start_epoch}/{epochs} epochs done)")
+
+    profiler = None
+    if profile_dir is not None:
+        profiler = torch.profiler.profile(
+            schedule=torch.profiler.schedule(wait=1, warmup=1, active=PROFILED_STEPS, repeat=1),
+            on_trace_ready=torch.profiler.tensorboard_trace_handler(profile_dir),
+            record_shapes=True,
+            profile_memory=True
+        )
+        profiler.start()
+    if device.type == 'cuda':
+        torch.cuda.reset_peak_memory_stats(device)
+
+    for epoch in range(start_epoch, epochs):
+        if hasattr(dataloader.dataset, 'set_epoch'):
+            dataloader.dataset.set_epoch(epoch)
         model.train()
         epoch_loss = 0
+        timings = {'data': 0.0, 'forward': 0.0, 'backward': 0.0, 'optimizer': 0.0}
+        num_batches, num_graphs, num_nodes = 0, 0, 0
+        epoch_start = time.perf_counter()
+
+        batches = iter(dataloader)
+        while True:
+            start = time.perf_counter()
+            data = next(batches, None)
+            if data is None:
+                break
+            data = data.to(device, non_blocking=True)
+            synchronize(device)
+            forward_start = time.perf_counter()
+
+            with torch.profiler.record_function("forward"):
+                optimizer.zero_grad()
+                outputs = model(data)
+                loss = criterion(outputs, data.y)
+            synchronize(device)
+            backward_start = time.perf_counter()
 
-        for data in dataloader:
-            data = data.to(device)
-            optimizer.zero_grad()
-            outputs = model(data)
-            loss = criterion(outputs, data.y)
-            loss.backward()
-            optimizer.step()
+            with torch.profiler.record_function("backward"):
+                loss.backward()
+            synchronize(device)
+            optimizer_start = time.perf_counter()
+
+            with torch.profiler.record_function("optimizer"):
+                optimizer.step()
             epoch_loss += loss.item()
+            end = time.perf_counter()
+
+            timings['data'] += forward_start - start
+            timings['forward'] += backward_start - forward_start
+            timings['backward'] += optimizer_start - backward_start
+            timings['optimizer'] += end - optimizer_start
+            num_batches += 1
+            num_graphs += data.num_graphs
+            num_nodes += data.num_nodes
+            if profiler is not None:
+                profiler.step()
+
+        elapsed = time.perf_counter() - epoch_start
+        record = {
+            'epoch': epoch + 1,
+            'loss': epoch_loss / max(num_batches, 1),
+            'elapsed_s': elapsed,
+            **{f"{name}_s": value for name, value in timings.items()},
+            'graphs_per_s': num_graphs / elapsed if elapsed > 0 else 0.0,
+            'nodes_per_s': num_nodes / elapsed if elapsed > 0 else 0.0,
+            **peak_memory(device),
+        }
+        print(
+            f"Epoch {epoch + 1}/{epochs}, Loss: {record['loss']:.4f}, "
+            f"data {timings['data']:.2f}s, forward {timings['forward']:.2f}s, "
+            f"backward {timings['backward']:.2f}s, optimizer {timings['optimizer']:.2f}s, "
+            f"{record['graphs_per_s']:.1f} graphs/s"
+        )
+        if log_path is not None:
+            os.makedirs(os.path.dirname(log_path), exist_ok=True)
+            with open(log_path, "a") as file:
+                file.write(json.dumps(record) + "\n")
 
-        print(f"Epoch {epoch + 1}/{epochs}, Loss: {epoch_loss / len(dataloader):.4f}")
+        if checkpoint_dir is not None and ((epoch + 1) % checkpoint_every == 0 or epoch + 1 == epochs):
+            save_checkpoint(model, optimizer, epoch + 1, checkpoint_dir)
+
+    if profiler is not None:
+        profiler.stop()
+        print(f"Profiler trace written to {profile_dir}")
 
 def save_model(model: nn.Module, path: str) -> None:
     os.makedirs(os.path.dirname(path), exist_ok=True)
@@ -97,23 +414,44 @@ def load_model(model: nn.Module, path: str) -> None:
 
 
 def main() -> None:
-    data_dir = TRAINING_GRAPHS_DIR
+    parser = argparse.ArgumentParser(description="Train the GAT")
+    parser.add_argument('--online', action='store_true', help='generate the samples while training (no data/sample)')
+    parser.add_argument('--epochs', type=int, default=30)
+    parser.add_argument('--profile', action='store_true', help=f'write a torch profiler trace to {PROFILE_DIR}')
+    parser.add_argument('--fresh', action='store_true', help='drop the saved model and checkpoints, train from scratch')
+    parser.add_argument('--wrap-around', action='store_true', help='with --online : the FOV may cross +-pi')
+    args = parser.parse_args()
+
+    # packed format when converted (python3 packed_dataset.py)
+    data_dir = PACKED_GRAPHS_DIR if PackedGraphs.exists(PACKED_GRAPHS_DIR) else TRAINING_GRAPHS_DIR
     batch_size = 10
-    epochs = 30
+    epochs = args.epochs
     lr = 0.001
     input_dim = 3
     hidden_dim = 64
     output_dim = 2
     device = torch.device('cpu')
 
-    dataloader = create_dataloader(data_dir, batch_size)
+    dataloader = create_online_dataloader(batch_size, wrap_around=args.wrap_around) if args.online \
+        else create_dataloader(data_dir, batch_size)
 
     model = GATModel(input_dim, hidden_dim, output_dim)
-    
+
+    if args.fresh:
+        shutil.rmtree(CHECKPOINT_DIR, ignore_errors=True)
+        if os.path.exists(MODEL_PATH):
+            os.remove(MODEL_PATH)
+
     load_model(model, MODEL_PATH)
-    
+
+    # an interrupted training has checkpoints but no model yet, it is resumed
     if not os.path.exists(MODEL_PATH):
-        train_model(model, dataloader, epochs, lr, device)
+        train_model(
+            model, dataloader, epochs, lr, device,
+            checkpoint_dir=CHECKPOINT_DIR,
+            log_path=TRAINING_LOG_PATH,
+            profile_dir=PROFILE_DIR if args.profile else None
+        )
         save_model(model, MODEL_PATH)
 
     visualize_predictions(model, dataloader, device)
@@ -0,0 +1,175 @@
+import os
+import argparse
+import shutil
+import numpy as np
+from typing import Iterable, Iterator, Tuple
+
+from constants import PACKED_GRAPHS_DIR, TRAINING_GRAPHS_DIR
+from sampling import graph_edges, read_shard
+
+# ----------------------------------------------------------------------
+# Packed graph dataset : every sample of a corpus in a few .npy files,
+# memory mapped and sliced per sample through offset arrays.
+#
+#   x.npy              (num_nodes, 3) float32 : relative u, v, intensity
+#   y.npy              (num_nodes, 2) float32 : true positions
+#   camera_center.npy  (num_samples, 2) float32
+#   node_offsets.npy   (num_samples + 1,) int64 : nodes of sample i
+#   indptr.npy         (num_nodes + 1,) int64 : CSR, edges of node n
+#   indices.npy        (num_edges,) int32 : target of each edge (index in its sample)
+#   edge_attr.npy      (num_edges,) float32 : distance of each edge
+#
+# Edges are sorted by source star (stable, so row major for complete and k-NN graphs).
+
+PACKED_ARRAYS = ['x', 'y', 'camera_center', 'node_offsets', 'indptr', 'indices', 'edge_attr']
+
+def sample_edges(graph_sample: dict) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    CSR of the edges of one sample.
+
+    :return: Tuple of the degree of each node, edge targets and edge distances
+    """
+    edge_index, edge_attr = graph_edges(graph_sample)
+    order = np.argsort(edge_index[0], kind='stable')
+    degrees = np.bincount(edge_index[0], minlength=len(graph_sample['intensities']))
+    return degrees, edge_index[1][order], edge_attr[order]
+
+def per_file_samples(data_dir: str = TRAINING_GRAPHS_DIR) -> Iterator[Tuple[dict, dict]]:
+    """
+    Samples of the sample_{id}_x/y.npz layout, by increasing id.
+    """
+    sample_ids = sorted(
+        int(file.split('_')[1])
+        for file in os.listdir(data_dir)
+        if file.endswith("_x.npz")
+    )
+    for sample_id in sample_ids:
+        with np.load(os.path.join(data_dir, f"sample_{sample_id}_x.npz")) as x_data, \
+             np.load(os.path.join(data_dir, f"sample_{sample_id}_y.npz")) as y_data:
+            yield (
+                {name: x_data[name] for name in x_data.files},
+                {name: y_data[name] for name in y_data.files}
+            )
+
+def shard_samples(data_dir: str = TRAINING_GRAPHS_DIR) -> Iterator[Tuple[dict, dict]]:
+    """
+    Samples of the shard_*.npz files of sampling.generate_training_graph_shards.
+    """
+    for file in sorted(os.listdir(data_dir)):
+        if file.startswith("shard_") and file.endswith(".npz"):
+            yield from read_shard(os.path.join(data_dir, file))
+
+def pack_samples(samples: Iterable[Tuple[dict, dict]], output_dir: str = PACKED_GRAPHS_DIR) -> int:
+    """
+    Write samples in the packed format, in chunks appended to the .npy files.
+
+    :return: Number of samples written
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    temporary = {name: open(os.path.join(output_dir, f"{name}.tmp"), "wb") for name in PACKED_ARRAYS}
+    counts = {name: 0 for name in PACKED_ARRAYS}
+    num_nodes, num_edges = 0, 0
+
+    def append(name: str, array: np.ndarray) -> None:
+        temporary[name].write(np.ascontiguousarray(array).tobytes())
+        counts[name] += len(array)
+
+    append('node_offsets', np.zeros(1, dtype=np.int64))
+    append('indptr', np.zeros(1, dtype=np.int64))
+    try:
+        for graph, truth in samples:
+            degrees, targets, distances = sample_edges(graph)
+            x = np.column_stack([graph['relative_positions'], graph['intensities']]).astype(np.float32)
+
+            append('x', x)
+            append('y', np.asarray(truth['true_positions'], dtype=np.float32))
+            append('camera_center', np.asarray(truth['camera_center'], dtype=np.float32)[None, :])
+            append('indptr', num_edges + np.cumsum(degrees, dtype=np.int64))
+            append('indices', targets.astype(np.int32))
+            append('edge_attr', distances.astype(np.float32))
+
+            num_nodes += len(x)
+            num_edges += len(targets)
+            append('node_offsets', np.array([num_nodes], dtype=np.int64))
+    finally:
+        for file in temporary.values():
+            file.close()
+
+    shapes = {
+        'x': ((counts['x'], 3), np.float32),
+        'y': ((counts['y'], 2), np.float32),
+        'camera_center': ((counts['camera_center'], 2), np.float32),
+        'node_offsets': ((counts['node_offsets'],), np.int64),
+        'indptr': ((counts['indptr'],), np.int64),
+        'indices': ((counts['indices'],), np.int32),
+        'edge_attr': ((counts['edge_attr'],), np.float32),
+    }
+    # raw chunks -> .npy : header then the same bytes, streamed
+    for name, (shape, dtype) in shapes.items():
+        raw = os.path.join(output_dir, f"{name}.tmp")
+        with open(os.path.join(output_dir, f"{name}.npy"), "wb") as target, open(raw, "rb") as source:
+            np.lib.format.write_array_header_1_0(target, {
+                'descr': np.lib.format.dtype_to_descr(np.dtype(dtype)),
+                'fortran_order': False,
+                'shape': shape,
+            })
+            shutil.copyfileobj(source, target)
+        os.remove(raw)
+
+    return counts['camera_center']
+
+class PackedGraphs:
+    """
+    Read-only view of a packed dataset, each sample is a set of slices
+    of the memory mapped arrays (nothing is copied).
+    """
+    def __init__(self, data_dir: str = PACKED_GRAPHS_DIR):
+        # copy on write : writable views for torch.from_numpy, the files are never modified
+        self.arrays = {
+            name: self._load(os.path.join(data_dir, f"{name}.npy"))
+            for name in PACKED_ARRAYS
+        }
+        self.node_offsets = np.asarray(self.arrays['node_offsets'])
+        self.indptr = self.arrays['indptr']
+
+    @staticmethod
+    def _load(path: str) -> np.ndarray:
+        try:
+            return np.load(path, mmap_mode='c')
+        except ValueError:
+            # empty arrays cannot be mapped
+            return np.load(path)
+
+    @staticmethod
+    def exists(data_dir: str) -> bool:
+        return os.path.exists(os.path.join(data_dir, "node_offsets.npy"))
+
+    def __len__(self) -> int:
+        return len(self.node_offsets) - 1
+
+    def __getitem__(self, idx: int) -> dict:
+        first, last = self.node_offsets[idx], self.node_offsets[idx + 1]
+        indptr = self.indptr[first:last + 1]
+        edges = slice(indptr[0], indptr[-1])
+        sources = np.repeat(np.arange(last - first), np.diff(indptr))
+
+        return {
+            'x': self.arrays['x'][first:last],
+            'y': self.arrays['y'][first:last],
+            'camera_center': self.arrays['camera_center'][idx],
+            'edge_index': np.stack([sources, self.arrays['indices'][edges]]),
+            'edge_attr': self.arrays['edge_attr'][edges],
+        }
+
+def main():
+    parser = argparse.ArgumentParser(description="Convert graph samples to the packed format")
+    parser.add_argument('--input', default=TRAINING_GRAPHS_DIR)
+    parser.add_argument('--output', default=PACKED_GRAPHS_DIR)
+    parser.add_argument('--from-shards', action='store_true', help='read shard_*.npz instead of sample_*_x/y.npz')
+    args = parser.parse_args()
+
+    samples = shard_samples(args.input) if args.from_shards else per_file_samples(args.input)
+    print(f"{pack_samples(samples, args.output)} samples packed into {args.output}")
+
+if __name__ == "__main__":
+    main()
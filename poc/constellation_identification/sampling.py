@@ -1,33 +1,78 @@
 import os
+import argparse
+import multiprocessing as mp
 import numpy as np
 import pandas as pd
 from typing import Tuple, List
 
-from constants import FOV_U, FOV_V, MAX_ANGLE, NUM_SAMPLES, STAR_DATA_FILE, TRAINING_GRAPHS_DIR
+from constants import EDGE_ATTR_DTYPE, FOV_U, FOV_V, GENERATION_SEED, KNN_BLOCK_SIZE, MAX_ANGLE, \
+    NUM_SAMPLES, SHARD_SIZE, STAR_DATA_FILE, TRAINING_GRAPHS_DIR
+from star_index import StarIndex, within_fov, wrap_angle
 
-def sample_visible_stars(star_data: pd.DataFrame, fov_u: float, fov_v: float) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+def draw_camera_centers(
+    fov_u: float,
+    fov_v: float,
+    num_centers: int,
+    rng: np.random.Generator = None,
+    wrap_around: bool = False
+) -> np.ndarray:
+    """
+    Random camera centers, drawn as (u, v) pairs one center after the other.
+
+    :param wrap_around: Draw the centers anywhere, the FOV may cross +-pi
+    :return: Array of camera centers (u, v), shape (num_centers, 2)
+    """
+    rng = np.random if rng is None else rng
+    margin = np.zeros(2) if wrap_around else np.array([fov_u / 2, fov_v / 2])
+    return rng.uniform(-MAX_ANGLE + margin, MAX_ANGLE - margin, size=(num_centers, 2))
+
+def sample_visible_stars(
+    star_data: pd.DataFrame,
+    fov_u: float,
+    fov_v: float,
+    rng: np.random.Generator = None,
+    index: StarIndex = None,
+    wrap_around: bool = False
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
     """
     Sample stars visible within a random camera field of view (FOV).
 
-    :param star_data: DataFrame with star positions and intensities
+    :param star_data: DataFrame (or array) with star positions and intensities
     :param fov_u: Field of view in the u direction (angular width)
     :param fov_v: Field of view in the v direction (angular height)
+    :param rng: Random generator, defaults to the global np.random state
+    :param index: StarIndex of star_data, avoids scanning the whole catalogue
+    :param wrap_around: Draw the center anywhere, the FOV may cross +-pi
     :return: Tuple containing visible star data, the camera center (u, v), and relative positions
     """
-    center_u = np.random.uniform(-MAX_ANGLE + fov_u / 2, MAX_ANGLE - fov_u / 2)
-    center_v = np.random.uniform(-MAX_ANGLE + fov_v / 2, MAX_ANGLE - fov_v / 2)
+    stars = np.asarray(star_data)
+
+    center = draw_camera_centers(fov_u, fov_v, 1, rng, wrap_around)[0]
+    center_u, center_v = center
+
+    if index is not None or wrap_around:
+        visible_indices = index.query(center, fov_u, fov_v) if index is not None \
+            else np.flatnonzero(within_fov(stars, center, fov_u, fov_v))
+        visible_stars = stars[visible_indices]
+        return visible_stars, center, fov_relative_positions(visible_stars, center, fov_u, fov_v)
 
     mask = (
-        (star_data['u'] >= center_u - fov_u / 2) &
-        (star_data['u'] <= center_u + fov_u / 2) &
-        (star_data['v'] >= center_v - fov_v / 2) &
-        (star_data['v'] <= center_v + fov_v / 2)
+        (stars[:, 0] >= center_u - fov_u / 2) &
+        (stars[:, 0] <= center_u + fov_u / 2) &
+        (stars[:, 1] >= center_v - fov_v / 2) &
+        (stars[:, 1] <= center_v + fov_v / 2)
     )
 
-    visible_stars = star_data[mask]
-    relative_positions = visible_stars[['u', 'v']].to_numpy() - [center_u - fov_u / 2, center_v - fov_v / 2]
+    visible_stars = stars[mask]
+    relative_positions = visible_stars[:, :2] - [center_u - fov_u / 2, center_v - fov_v / 2]
+
+    return visible_stars, center, relative_positions
 
-    return visible_stars.to_numpy(), np.array([center_u, center_v]), relative_positions
+def fov_relative_positions(visible_stars: np.ndarray, center: np.ndarray, fov_u: float, fov_v: float) -> np.ndarray:
+    """
+    Positions of the visible stars relative to the FOV corner, across the +-pi boundary.
+    """
+    return wrap_angle(visible_stars[:, :2] - center) + [fov_u / 2, fov_v / 2]
 
 def compute_angular_distances(positions: np.ndarray) -> np.ndarray:
     """
@@ -36,15 +81,75 @@ def compute_angular_distances(positions: np.ndarray) -> np.ndarray:
     :param positions: Array of star positions (u, v)
     :return: Adjacency matrix of angular distances
     """
+    delta = positions[:, None, :2] - positions[None, :, :2]
+    return np.sqrt(np.einsum('ijk,ijk->ij', delta, delta))
+
+def k_nearest_edges(positions: np.ndarray, k: int, block_size: int = KNN_BLOCK_SIZE) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Sparse k-nearest-neighbour graph, without the dense distance matrix.
+
+    Distances are computed for ``block_size`` rows at a time, so memory stays
+    O(block_size * n + n * k) instead of O(n^2).
+
+    :param positions: Array of star positions (u, v)
+    :param k: Number of neighbours per star (capped to n - 1)
+    :param block_size: Number of rows handled at once
+    :return: edge_index (2, n * k) as (star, neighbour) and edge_attr (n * k,) distances
+    """
     num_stars = positions.shape[0]
-    distances = np.zeros((num_stars, num_stars))
+    k = min(k, num_stars - 1)
+    if k <= 0:
+        return np.empty((2, 0), dtype=np.int64), np.empty(0, dtype=positions.dtype)
 
-    for i in range(num_stars):
-        for j in range(num_stars):
-            if i != j:
-                distances[i, j] = np.sqrt((positions[i, 0] - positions[j, 0])**2 +
-                                          (positions[i, 1] - positions[j, 1])**2)
-    return distances
+    positions = positions[:, :2]
+    squared_norms = np.einsum('ij,ij->i', positions, positions)
+    sources = np.repeat(np.arange(num_stars), k)
+    targets = np.empty((num_stars, k), dtype=np.int64)
+    edge_attr = np.empty((num_stars, k), dtype=positions.dtype)
+
+    for start in range(0, num_stars, block_size):
+        stop = min(start + block_size, num_stars)
+        rows = np.arange(start, stop)
+        # |a - b|^2 = |a|^2 + |b|^2 - 2 a.b
+        squared = squared_norms[start:stop, None] + squared_norms[None, :] - 2 * positions[start:stop] @ positions.T
+        squared[rows - start, rows] = np.inf
+
+        neighbours = np.argpartition(squared, k - 1, axis=1)[:, :k]
+        nearest = np.take_along_axis(squared, neighbours, axis=1)
+        targets[start:stop] = neighbours
+        edge_attr[start:stop] = np.sqrt(np.maximum(nearest, 0.0))
+
+    return np.stack([sources, targets.ravel()]), edge_attr.ravel()
+
+def complete_edges(positions: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Every ordered pair of distinct stars, in row major order.
+
+    :return: edge_index (2, n * (n - 1)) and edge_attr (n * (n - 1),) distances
+    """
+    distances = compute_angular_distances(positions)
+    mask = ~np.eye(len(positions), dtype=bool)
+    return np.stack(np.nonzero(mask)), distances[mask]
+
+def compact_edges(edge_index: np.ndarray, edge_attr: np.ndarray, num_nodes: int) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Storage dtypes of the edges : local star ids as int16 (int32 above 32768
+    stars), distances as float32. 8 bytes per edge, so a complete graph
+    takes less room than the dense float64 distance matrix.
+    """
+    index_dtype = np.int16 if num_nodes <= np.iinfo(np.int16).max + 1 else np.int32
+    return edge_index.astype(index_dtype), edge_attr.astype(EDGE_ATTR_DTYPE)
+
+def graph_edges(graph_sample: dict) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    edge_index and edge_attr of a graph sample, also for samples saved with a
+    dense ``distances`` matrix (where a zero meant no edge).
+    """
+    if 'edge_index' in graph_sample:
+        return graph_sample['edge_index'], graph_sample['edge_attr']
+    distances = graph_sample['distances']
+    mask = distances > 0
+    return np.stack(np.nonzero(mask)), distances[mask]
 
 def save_graph_sample(
     graph_sample: dict, 
@@ -56,7 +161,8 @@ def save_graph_sample(
 
     np.savez(
         os.path.join(output_dir, f"sample_{sample_id}_x.npz"),
-        distances=graph_sample['distances'],
+        edge_index=graph_sample['edge_index'],
+        edge_attr=graph_sample['edge_attr'],
         intensities=graph_sample['intensities'],
         relative_positions=graph_sample['relative_positions']
     )
@@ -67,52 +173,245 @@ def save_graph_sample(
         camera_center=ground_truth['camera_center']
     )
 
+def build_graph_sample(
+    star_data: np.ndarray,
+    fov_u: float,
+    fov_v: float,
+    k_neighbors: int = None,
+    rng: np.random.Generator = None,
+    index: StarIndex = None,
+    wrap_around: bool = False
+) -> Tuple[dict, dict]:
+    """
+    Draw one camera pointing and build its graph.
+
+    :param wrap_around: Draw the center anywhere, the FOV may cross +-pi
+    :return: Tuple of the graph sample and its ground truth (see save_graph_sample)
+    """
+    visible_stars, camera_center, relative_positions = sample_visible_stars(
+        star_data, fov_u, fov_v, rng, index, wrap_around
+    )
+    return graph_from_visible_stars(visible_stars, camera_center, relative_positions, k_neighbors)
+
+def build_graph_samples(
+    star_data: np.ndarray,
+    fov_u: float,
+    fov_v: float,
+    num_samples: int,
+    index: StarIndex,
+    k_neighbors: int = None,
+    rng: np.random.Generator = None,
+    wrap_around: bool = False
+) -> List[Tuple[dict, dict]]:
+    """
+    ``num_samples`` graphs, the visible stars of every center are found by
+    a single StarIndex.query_many call. Same samples as calling
+    build_graph_sample ``num_samples`` times with the same rng and index.
+    """
+    stars = np.asarray(star_data)
+    centers = draw_camera_centers(fov_u, fov_v, num_samples, rng, wrap_around)
+    indices, offsets = index.query_many(centers, fov_u, fov_v)
+
+    samples = []
+    for i, center in enumerate(centers):
+        visible_stars = stars[indices[offsets[i]:offsets[i + 1]]]
+        relative_positions = fov_relative_positions(visible_stars, center, fov_u, fov_v)
+        samples.append(graph_from_visible_stars(visible_stars, center, relative_positions, k_neighbors))
+    return samples
+
+def graph_from_visible_stars(
+    visible_stars: np.ndarray,
+    camera_center: np.ndarray,
+    relative_positions: np.ndarray,
+    k_neighbors: int = None
+) -> Tuple[dict, dict]:
+    """
+    Graph of the stars seen from one camera center (see sample_visible_stars).
+    """
+    positions = visible_stars[:, :2]
+    intensities = visible_stars[:, 2]
+
+    if k_neighbors:
+        edge_index, edge_attr = k_nearest_edges(positions, k_neighbors)
+    else:
+        edge_index, edge_attr = complete_edges(positions)
+    edge_index, edge_attr = compact_edges(edge_index, edge_attr, len(positions))
+
+    return (
+        {
+            'edge_index': edge_index,
+            'edge_attr': edge_attr,
+            'intensities': intensities,
+            'relative_positions': relative_positions
+        },
+        {
+            'true_positions': positions,
+            'camera_center': camera_center
+        }
+    )
+
 def generate_training_graphs_per_file(
     star_data_file: str,
     fov_u: float,
     fov_v: float,
     num_samples: int,
     output_dir: str,
-    k_neighbors: int = None
+    k_neighbors: int = None,
+    wrap_around: bool = False
 ) -> None:
-    star_data = pd.read_csv(star_data_file)
+    star_data = pd.read_csv(star_data_file).to_numpy()
+    index = StarIndex(star_data)
 
     for i in range(num_samples):
-        visible_stars, camera_center, relative_positions = sample_visible_stars(star_data, fov_u, fov_v)
-        positions = visible_stars[:, :2]
-        intensities = visible_stars[:, 2]
+        graph_sample, ground_truth = build_graph_sample(
+            star_data, fov_u, fov_v, k_neighbors, index=index, wrap_around=wrap_around
+        )
+        save_graph_sample(graph_sample, ground_truth, sample_id=i, output_dir=output_dir)
+
+# ----------------------------------------------------------------------
+# Sharded generation : SHARD_SIZE samples per file, shard s drawn from its
+# own seed stream (SeedSequence(seed).spawn), so the output only depends
+# on the seed, not on the number of workers.
+
+SHARD_ARRAYS = ['intensities', 'relative_positions', 'true_positions', 'edge_attr']
+
+def shard_path(output_dir: str, shard_id: int) -> str:
+    return os.path.join(output_dir, f"shard_{shard_id:05d}.npz")
 
-        distances = compute_angular_distances(positions)
+def shard_rng(seed: int, shard_id: int) -> np.random.Generator:
+    return np.random.default_rng(np.random.SeedSequence(seed, spawn_key=(shard_id,)))
 
-        if k_neighbors:
-            distances = keep_k_closest(distances, k_neighbors)
+def write_shard(path: str, samples: List[Tuple[dict, dict]]) -> None:
+    """
+    Concatenate the samples of a shard, node and edge arrays are
+    delimited by ``node_offsets`` and ``edge_offsets``.
+    """
+    num_nodes = np.array([len(graph['intensities']) for graph, _ in samples])
+    num_edges = np.array([len(graph['edge_attr']) for graph, _ in samples])
+    arrays = {
+        name: np.concatenate([{**graph, **truth}[name] for graph, truth in samples])
+        for name in SHARD_ARRAYS
+    }
+    arrays['edge_index'] = np.concatenate([graph['edge_index'] for graph, _ in samples], axis=1)
+    arrays['camera_center'] = np.stack([truth['camera_center'] for _, truth in samples])
+    arrays['node_offsets'] = np.concatenate([[0], np.cumsum(num_nodes)])
+    arrays['edge_offsets'] = np.concatenate([[0], np.cumsum(num_edges)])
+
+    # written under a temporary name, a shard file is always complete
+    temporary = path + ".tmp"
+    with open(temporary, "wb") as file:
+        np.savez(file, **arrays)
+    os.replace(temporary, path)
+
+def read_shard(path: str) -> List[Tuple[dict, dict]]:
+    """
+    Samples of a shard, as given to save_graph_sample.
+    """
+    with np.load(path) as shard:
+        arrays = {name: shard[name] for name in shard.files}
+    node_offsets = arrays['node_offsets']
+    edge_offsets = arrays['edge_offsets']
 
-        save_graph_sample(
+    samples = []
+    for i in range(len(node_offsets) - 1):
+        nodes = slice(node_offsets[i], node_offsets[i + 1])
+        edges = slice(edge_offsets[i], edge_offsets[i + 1])
+        samples.append((
             {
-                'distances': distances,
-                'intensities': intensities,
-                'relative_positions': relative_positions
+                'edge_index': arrays['edge_index'][:, edges],
+                'edge_attr': arrays['edge_attr'][edges],
+                'intensities': arrays['intensities'][nodes],
+                'relative_positions': arrays['relative_positions'][nodes]
             },
             {
-                'true_positions': positions,
-                'camera_center': camera_center
-            },
-            sample_id=i,
-            output_dir=output_dir
-        )
+                'true_positions': arrays['true_positions'][nodes],
+                'camera_center': arrays['camera_center'][i]
+            }
+        ))
+    return samples
+
+_worker_stars = None
+_worker_index = None
+
+def _init_worker(star_data_file: str) -> None:
+    global _worker_stars, _worker_index
+    _worker_stars = pd.read_csv(star_data_file).to_numpy()
+    _worker_index = StarIndex(_worker_stars)
+
+def _generate_shard(task: tuple) -> int:
+    shard_id, num_samples, fov_u, fov_v, k_neighbors, wrap_around, seed, output_dir = task
+    samples = build_graph_samples(
+        _worker_stars, fov_u, fov_v, num_samples, _worker_index, k_neighbors, shard_rng(seed, shard_id), wrap_around
+    )
+    write_shard(shard_path(output_dir, shard_id), samples)
+    return num_samples
+
+def generate_training_graph_shards(
+    star_data_file: str,
+    fov_u: float,
+    fov_v: float,
+    num_samples: int,
+    output_dir: str,
+    k_neighbors: int = None,
+    shard_size: int = SHARD_SIZE,
+    num_workers: int = None,
+    seed: int = GENERATION_SEED,
+    wrap_around: bool = False
+) -> int:
+    """
+    Generate ``num_samples`` graphs into shard files with a process pool.
+    The stars of a shard are queried at once (see build_graph_samples).
+
+    :return: Number of shards written
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    tasks = [
+        (shard_id, min(shard_size, num_samples - start), fov_u, fov_v, k_neighbors, wrap_around, seed, output_dir)
+        for shard_id, start in enumerate(range(0, num_samples, shard_size))
+    ]
+    num_workers = os.cpu_count() if num_workers is None else num_workers
+
+    if num_workers <= 1:
+        _init_worker(star_data_file)
+        for task in tasks:
+            _generate_shard(task)
+    else:
+        with mp.Pool(num_workers, initializer=_init_worker, initargs=(star_data_file,)) as pool:
+            for _ in pool.imap_unordered(_generate_shard, tasks):
+                pass
+    return len(tasks)
 
 def keep_k_closest(distances: np.ndarray, k: int) -> np.ndarray:
     num_stars = distances.shape[0]
-    for i in range(num_stars):
-        row = distances[i, :]
-        closest_indices = np.argsort(row)[:k + 1]
-        mask = np.ones_like(row, dtype=bool)
-        mask[closest_indices] = False
-        row[mask] = 0.0
+    if k + 1 >= num_stars:
+        return distances
+    # k + 1 smallest of each row (the star itself included)
+    closest_indices = np.argpartition(distances, k, axis=1)[:, :k + 1]
+    mask = np.ones_like(distances, dtype=bool)
+    mask[np.arange(num_stars)[:, None], closest_indices] = False
+    distances[mask] = 0.0
     return distances
 
 def main():
-    generate_training_graphs_per_file(STAR_DATA_FILE, FOV_U, FOV_V, NUM_SAMPLES, TRAINING_GRAPHS_DIR)
+    parser = argparse.ArgumentParser(description="Generate the training graphs")
+    parser.add_argument('--num-samples', type=int, default=NUM_SAMPLES)
+    parser.add_argument('-k', '--k-neighbors', type=int, default=None)
+    parser.add_argument('--sharded', action='store_true', help='write shard files with a process pool')
+    parser.add_argument('--shard-size', type=int, default=SHARD_SIZE)
+    parser.add_argument('--workers', type=int, default=None, help='default: number of cpus')
+    parser.add_argument('--seed', type=int, default=GENERATION_SEED)
+    parser.add_argument('--wrap-around', action='store_true', help='camera centers anywhere, the FOV may cross +-pi')
+    args = parser.parse_args()
+
+    if args.sharded:
+        generate_training_graph_shards(
+            STAR_DATA_FILE, FOV_U, FOV_V, args.num_samples, TRAINING_GRAPHS_DIR,
+            args.k_neighbors, args.shard_size, args.workers, args.seed, args.wrap_around
+        )
+    else:
+        generate_training_graphs_per_file(
+            STAR_DATA_FILE, FOV_U, FOV_V, args.num_samples, TRAINING_GRAPHS_DIR, args.k_neighbors, args.wrap_around
+        )
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
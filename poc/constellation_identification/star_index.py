@@ -0,0 +1,91 @@
+import numpy as np
+import pandas as pd
+from typing import Tuple
+
+from constants import FOV_V, MAX_ANGLE, STAR_DATA_FILE
+
+def wrap_angle(angle: np.ndarray) -> np.ndarray:
+    """
+    Map angles onto [-pi, pi).
+    """
+    return np.mod(angle + MAX_ANGLE, 2 * MAX_ANGLE) - MAX_ANGLE
+
+def within_fov(positions: np.ndarray, center: np.ndarray, fov_u: float, fov_v: float) -> np.ndarray:
+    """
+    Mask of the positions inside the field of view, across the +-pi boundary.
+
+    :param positions: Array of star positions (u, v)
+    :param center: Camera center (u, v)
+    """
+    delta = wrap_angle(positions[..., :2] - center)
+    return (np.abs(delta[..., 0]) <= fov_u / 2) & (np.abs(delta[..., 1]) <= fov_v / 2)
+
+class StarIndex:
+    """
+    Uniform grid over the (u, v) torus [-pi, pi)^2.
+
+    Stars are sorted by cell with CSR offsets, a field of view query only
+    looks at the cells it overlaps instead of the whole catalogue.
+    """
+    def __init__(self, positions: np.ndarray, cell_size: float = FOV_V / 2):
+        self.positions = np.asarray(positions, dtype=float)[:, :2]
+        self.num_cells = max(1, int(2 * MAX_ANGLE // cell_size))
+        self.cell_width = 2 * MAX_ANGLE / self.num_cells
+
+        cells = self._cell(self.positions[:, 0]) * self.num_cells + self._cell(self.positions[:, 1])
+        self.order = np.argsort(cells, kind='stable')
+        self.sorted_positions = self.positions[self.order]
+        self.cell_offsets = np.searchsorted(cells[self.order], np.arange(self.num_cells ** 2 + 1))
+
+    @classmethod
+    def from_file(cls, star_data_file: str = STAR_DATA_FILE, **kwargs) -> 'StarIndex':
+        return cls(pd.read_csv(star_data_file)[['u', 'v']].to_numpy(), **kwargs)
+
+    def _cell(self, angle: np.ndarray) -> np.ndarray:
+        cell = np.floor((wrap_angle(angle) + MAX_ANGLE) / self.cell_width).astype(np.int64)
+        return np.minimum(cell, self.num_cells - 1)
+
+    def _cell_range(self, low: np.ndarray, fov: float) -> np.ndarray:
+        """
+        (m, K) cells covering [low, low + fov] on one axis, modulo num_cells.
+        """
+        span = min(int(fov // self.cell_width) + 2, self.num_cells)
+        return (self._cell(low)[:, None] + np.arange(span)) % self.num_cells
+
+    def query_many(self, centers: np.ndarray, fov_u: float, fov_v: float) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Stars visible from each camera center.
+
+        :param centers: Array of camera centers (u, v), shape (m, 2)
+        :return: Star indices (ascending per center) and offsets (m + 1,), the
+                 stars of center i are indices[offsets[i]:offsets[i + 1]]
+        """
+        centers = np.atleast_2d(np.asarray(centers, dtype=float))
+        num_centers = len(centers)
+
+        cells_u = self._cell_range(centers[:, 0] - fov_u / 2, fov_u)
+        cells_v = self._cell_range(centers[:, 1] - fov_v / 2, fov_v)
+        cells = (cells_u[:, :, None] * self.num_cells + cells_v[:, None, :]).reshape(num_centers, -1)
+
+        # candidates : concatenation of the overlapped cells, for every center
+        starts = self.cell_offsets[cells].ravel()
+        lengths = self.cell_offsets[cells + 1].ravel() - starts
+        total = int(lengths.sum())
+        center_of_candidate = np.repeat(np.repeat(np.arange(num_centers), cells.shape[1]), lengths)
+        slots = np.repeat(starts - (np.cumsum(lengths) - lengths), lengths) + np.arange(total)
+
+        visible = within_fov(self.sorted_positions[slots], centers[center_of_candidate], fov_u, fov_v)
+        slots, center_of_candidate = slots[visible], center_of_candidate[visible]
+
+        # catalogue order inside each center
+        keys = np.sort(center_of_candidate * len(self.order) + self.order[slots])
+        indices = keys % len(self.order)
+        offsets = np.searchsorted(keys, np.arange(num_centers + 1) * len(self.order))
+        return indices, offsets
+
+    def query(self, center: np.ndarray, fov_u: float, fov_v: float) -> np.ndarray:
+        """
+        Indices (ascending) of the stars visible from one camera center.
+        """
+        indices, _ = self.query_many(np.asarray(center)[None, :], fov_u, fov_v)
+        return indices
@@ -1,12 +1,14 @@
 import os
 import numpy as np
 import matplotlib.pyplot as plt
+from matplotlib.collections import LineCollection
 import torch
 import torch.nn as nn
 import torch.optim as optim
 from torch_geometric.loader import DataLoader
 
 from constants import TRAINING_GRAPHS_DIR
+from sampling import graph_edges
 
 def load_sample(sample_id: int, data_dir: str):
     """
@@ -33,7 +35,7 @@ def visualize_sample(sample_id: int, data_dir: str):
     """
     x_data, y_data = load_sample(sample_id, data_dir)
 
-    distances = x_data['distances']
+    edge_index, _ = graph_edges(x_data)
     relative_positions = x_data['relative_positions']
     intensities = x_data['intensities']
     true_positions = y_data['true_positions']
@@ -45,16 +47,9 @@ def visualize_sample(sample_id: int, data_dir: str):
     for i, (pos, intensity) in enumerate(zip(relative_positions, intensities)):
         plt.scatter(pos[0], pos[1], s=intensity * 50, label=f"Node {i}" if i < 10 else "")
 
-    # Plot edges based on distances
-    num_nodes = distances.shape[0]
-    for i in range(num_nodes):
-        for j in range(num_nodes):
-            if distances[i, j] > 0:
-                plt.plot(
-                    [relative_positions[i, 0], relative_positions[j, 0]],
-                    [relative_positions[i, 1], relative_positions[j, 1]],
-                    color="gray", linestyle="--", linewidth=0.5
-                )
+    # Plot edges, one segment per (source, target) pair
+    segments = np.stack([relative_positions[edge_index[0]], relative_positions[edge_index[1]]], axis=1)
+    plt.gca().add_collection(LineCollection(segments, colors="gray", linestyles="--", linewidths=0.5))
 
     # Annotate true positions
     for pos in true_positions: